@@ -0,0 +1,309 @@
+"""Benchmarky vrstvy dataloaderu nad souborovou SQLite (offline).
+
+    python benchmarks/bench_dataloaders.py --output results.json
+    python benchmarks/bench_dataloaders.py --baseline baseline.json --threshold 0.25
+    python benchmarks/bench_dataloaders.py --quick --scenarios load_by_id codec
+
+Scenare:
+load_by_id   IDLoader.load_many pro ruzne velikosti davky a podil zasahu v GlobalTTLCache
+fk_fanout    FKeyLoader pro ruzny pocet potomku na rodice
+where        kompilace prepareSelect podle slozitosti where
+page         IDLoader.page s where ruzne slozitosti
+codec        GlobalTTLCache._encode / _decode (s kompresi i bez)
+concurrency  N soubeznych "requestu" (vlastni session a IDLoader), requesty za sekundu
+
+Kazde mereni se opakuje `--repeat` krat, pouzije se nejrychlejsi beh. Vysledky jsou
+zaznamy {name, params, ops, seconds, ops_per_second}, s `--baseline` se porovnaji
+pres benchmarks/compare.py a pri regresi skript konci s kodem 1.
+"""
+import io
+import os
+import sys
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import datetime
+import platform
+import tempfile
+import contextlib
+
+import sqlalchemy
+from sqlalchemy import ForeignKey
+from sqlalchemy.orm import DeclarativeBase, MappedAsDataclass, Mapped, mapped_column, relationship
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+from uoishelpers.datagenerator import generateIntoDatabase
+from uoishelpers.dataloaders.IDLoader import IDLoader, FKeyLoader, GlobalTTLCache, prepareSelect, make_entity_cache_key, detach_entity
+from compare import compare, report, load_results, save_results
+
+
+class BModel(MappedAsDataclass, DeclarativeBase):
+    pass
+
+
+class UserModel(BModel):
+    __tablename__ = "users"
+
+    id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default_factory=uuid.uuid4)
+    name: Mapped[str] = mapped_column(default=None, nullable=True)
+    surname: Mapped[str] = mapped_column(default=None, nullable=True)
+    email: Mapped[str] = mapped_column(default=None, nullable=True)
+    valid: Mapped[bool] = mapped_column(default=True)
+    lastchange: Mapped[datetime.datetime] = mapped_column(default_factory=datetime.datetime.now)
+
+
+class GroupModel(BModel):
+    __tablename__ = "groups"
+
+    id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default_factory=uuid.uuid4)
+    name: Mapped[str] = mapped_column(default=None, nullable=True)
+    mastergroup_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("groups.id"), default=None, nullable=True)
+    lastchange: Mapped[datetime.datetime] = mapped_column(default_factory=datetime.datetime.now)
+
+
+class MembershipModel(BModel):
+    __tablename__ = "memberships"
+
+    id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default_factory=uuid.uuid4)
+    user_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("users.id"), default=None, index=True)
+    group_id: Mapped[uuid.UUID] = mapped_column(ForeignKey("groups.id"), default=None, index=True)
+    startdate: Mapped[datetime.datetime] = mapped_column(default=None, nullable=True)
+    enddate: Mapped[datetime.datetime] = mapped_column(default=None, nullable=True)
+    lastchange: Mapped[datetime.datetime] = mapped_column(default_factory=datetime.datetime.now)
+
+
+# vztah pro where pres relationship, mimo dataclass pole (detach_entity je neprochazi)
+MembershipModel.user = relationship(UserModel, viewonly=True, lazy="raise")
+
+
+WHERES = {
+    "none": (UserModel, None),
+    "eq": (UserModel, {"name": {"_eq": "Jan"}}),
+    "and_or": (UserModel, {"_and": [
+        {"_or": [{"name": {"_eq": "Jan"}}, {"name": {"_eq": "Eva"}}, {"surname": {"_startswith": "No"}}]},
+        {"email": {"_like": "%a%"}},
+        {"valid": {"_eq": True}},
+    ]}),
+    "relationship": (MembershipModel, {"user": {"_and": [{"name": {"_eq": "Jan"}}, {"valid": {"_eq": True}}]}}),
+}
+
+
+async def create_database(directory, name, users, fanout, seed=0):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(directory, name)}")
+    async with engine.begin() as conn:
+        await conn.run_sync(BModel.metadata.create_all)
+    session_maker = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    await generateIntoDatabase(
+        session_maker, BModel, counts={"users": users, "groups": max(users // 20, 1)},
+        fanout={"memberships.user_id": fanout, "groups.mastergroup_id": 5}, seed=seed
+    )
+    async with session_maker() as session:
+        ids = list(await session.scalars(sqlalchemy.select(UserModel.id)))
+    return engine, session_maker, ids
+
+
+async def best_of(repeat, body):
+    """Spusti `body()` repeat krat, vraci (ops, seconds) nejrychlejsiho behu.
+    `body` vraci (ops, seconds), aby si mohlo pripravu vyloucit z mereni."""
+    best = None
+    for _ in range(repeat):
+        ops, seconds = await body()
+        if best is None or seconds < best[1]:
+            best = (ops, seconds)
+    return best
+
+
+def record(name, params, ops, seconds):
+    rate = ops / seconds if seconds > 0 else float("inf")
+    print(f"{name:>12} {str(params):<48} {rate:14.0f} ops/s", flush=True)
+    return {"name": name, "params": params, "ops": ops, "seconds": seconds, "ops_per_second": rate}
+
+
+async def bench_load_by_id(session_maker, ids, repeat, batch_sizes=(1, 10, 100, 1000), hit_ratios=(0.0, 0.5, 0.9)):
+    results = []
+    rng = random.Random(1)
+    for batch_size in batch_sizes:
+        rounds = max(1, min(len(ids) // batch_size, 2000 // batch_size))
+        for hit_ratio in hit_ratios:
+            async def body():
+                cache = GlobalTTLCache(ttl=3600, maxsize=len(ids) * 2)
+                sample = rng.sample(ids, rounds * batch_size)
+                hits = int(round(hit_ratio * batch_size))
+                async with session_maker() as session:
+                    # predplneni cache mimo mereni
+                    cached = [id for start in range(0, len(sample), batch_size) for id in sample[start:start + hits]]
+                    if cached:
+                        rows = await session.scalars(sqlalchemy.select(UserModel).where(UserModel.id.in_(cached)))
+                        await cache.set_many({make_entity_cache_key(UserModel, row.id): detach_entity(row) for row in rows})
+                        session.expunge_all()
+                    start = time.perf_counter()
+                    for offset in range(0, len(sample), batch_size):
+                        loader = IDLoader[UserModel](session, shared_cache=cache, asyncio_lock=asyncio.Lock())
+                        await loader.load_many(sample[offset:offset + batch_size])
+                        session.expunge_all()
+                    return len(sample), time.perf_counter() - start
+            ops, seconds = await best_of(repeat, body)
+            results.append(record("load_by_id", {"batch_size": batch_size, "hit_ratio": hit_ratio}, ops, seconds))
+    return results
+
+
+async def bench_fk_fanout(directory, users, repeat, fanouts=(1, 10, 50), batch_size=20):
+    results = []
+    rng = random.Random(2)
+    for fanout in fanouts:
+        engine, session_maker, ids = await create_database(directory, f"fanout_{fanout}.sqlite", users, fanout)
+
+        async def body():
+            sample = rng.sample(ids, (len(ids) // batch_size) * batch_size)
+            async with session_maker() as session:
+                with contextlib.redirect_stdout(io.StringIO()):
+                    loader = FKeyLoader[MembershipModel](session, "user_id", asyncio_lock=asyncio.Lock())
+                loaded = 0
+                start = time.perf_counter()
+                for offset in range(0, len(sample), batch_size):
+                    groups = await loader.load_many(sample[offset:offset + batch_size])
+                    loaded += sum(len(group) for group in groups)
+                    loader.clear_all()
+                    session.expunge_all()
+                return loaded, time.perf_counter() - start
+        ops, seconds = await best_of(repeat, body)
+        results.append(record("fk_fanout", {"fanout": fanout, "batch_size": batch_size}, ops, seconds))
+        await engine.dispose()
+    return results
+
+
+async def bench_where(repeat, iterations=2000):
+    results = []
+    for complexity, (model, where) in WHERES.items():
+        if where is None:
+            continue
+
+        async def body():
+            start = time.perf_counter()
+            for _ in range(iterations):
+                prepareSelect(model, where)
+            return iterations, time.perf_counter() - start
+        ops, seconds = await best_of(repeat, body)
+        results.append(record("where", {"complexity": complexity}, ops, seconds))
+    return results
+
+
+async def bench_page(session_maker, repeat, iterations=200, limit=100):
+    results = []
+    for complexity, (model, where) in WHERES.items():
+        async def body():
+            async with session_maker() as session:
+                start = time.perf_counter()
+                for index in range(iterations):
+                    loader = IDLoader[model](session, shared_cache=None, asyncio_lock=asyncio.Lock())
+                    await loader.page(skip=(index * limit) % 1000, limit=limit, where=where)
+                    session.expunge_all()
+                return iterations, time.perf_counter() - start
+        ops, seconds = await best_of(repeat, body)
+        results.append(record("page", {"complexity": complexity, "limit": limit}, ops, seconds))
+    return results
+
+
+async def bench_codec(repeat, iterations=5000):
+    now = datetime.datetime(2025, 1, 1)
+    values = {
+        "small": {"id": uuid.uuid4(), "name": "Jan", "surname": "Novak", "email": "jan.novak@example.com", "valid": True, "lastchange": now},
+        "large": {"id": uuid.uuid4(), "name": "Jan", "description": "lorem ipsum dolor sit amet " * 80, "lastchange": now},
+    }
+    results = []
+    for size, value in values.items():
+        for compression in (None, "zlib"):
+            cache = GlobalTTLCache(ttl=60, compress_threshold=256 if compression else None, compression=compression or "zlib")
+            encoded = cache._encode(value)
+
+            async def encode():
+                start = time.perf_counter()
+                for _ in range(iterations):
+                    cache._encode(value)
+                return iterations, time.perf_counter() - start
+
+            async def decode():
+                start = time.perf_counter()
+                for _ in range(iterations):
+                    cache._decode(encoded)
+                return iterations, time.perf_counter() - start
+
+            params = {"value": size, "compression": compression}
+            results.append(record("encode", params, *await best_of(repeat, encode)))
+            results.append(record("decode", params, *await best_of(repeat, decode)))
+    return results
+
+
+async def bench_concurrency(session_maker, ids, repeat, levels=(1, 8, 32, 128), requests=256, batch_size=50):
+    results = []
+    rng = random.Random(3)
+
+    async def request(semaphore):
+        async with semaphore:
+            async with session_maker() as session:
+                loader = IDLoader[UserModel](session, shared_cache=None, asyncio_lock=asyncio.Lock())
+                await loader.load_many(rng.sample(ids, batch_size))
+
+    for level in levels:
+        async def body():
+            semaphore = asyncio.Semaphore(level)
+            start = time.perf_counter()
+            await asyncio.gather(*(request(semaphore) for _ in range(requests)))
+            return requests, time.perf_counter() - start
+        ops, seconds = await best_of(repeat, body)
+        results.append(record("concurrency", {"concurrency": level, "batch_size": batch_size}, ops, seconds))
+    return results
+
+
+SCENARIOS = ["load_by_id", "fk_fanout", "where", "page", "codec", "concurrency"]
+
+
+async def run(scenarios, users, repeat):
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        engine, session_maker, ids = await create_database(directory, "main.sqlite", users, 3)
+        if "load_by_id" in scenarios:
+            results.extend(await bench_load_by_id(session_maker, ids, repeat))
+        if "fk_fanout" in scenarios:
+            results.extend(await bench_fk_fanout(directory, max(users // 10, 100), repeat))
+        if "where" in scenarios:
+            results.extend(await bench_where(repeat))
+        if "page" in scenarios:
+            results.extend(await bench_page(session_maker, repeat))
+        if "codec" in scenarios:
+            results.extend(await bench_codec(repeat))
+        if "concurrency" in scenarios:
+            results.extend(await bench_concurrency(session_maker, ids, repeat))
+        await engine.dispose()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--quick", action="store_true", help="maly dataset a jedno opakovani")
+    parser.add_argument("--output", help="ulozi vysledky do JSON souboru")
+    parser.add_argument("--baseline", help="porovna vysledky s JSON souborem z --output")
+    parser.add_argument("--threshold", type=float, default=0.25, help="povolene zpomaleni proti baseline (podil)")
+    args = parser.parse_args(argv)
+    if args.quick:
+        args.users, args.repeat = 1000, 1
+
+    results = asyncio.run(run(args.scenarios, args.users, args.repeat))
+    meta = {"users": args.users, "repeat": args.repeat, "python": platform.python_version(), "sqlalchemy": sqlalchemy.__version__}
+    if args.output:
+        save_results(args.output, results, meta)
+    if args.baseline:
+        return report(compare(results, load_results(args.baseline), args.threshold), args.threshold)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
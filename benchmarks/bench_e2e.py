@@ -0,0 +1,322 @@
+"""Zatezovy test celeho stacku: MountGuardedGQL + sentinel, WhoAmIExtension,
+RolePermissionSchemaExtension, RBAC field extensions, SessionCommitExtension a loadery.
+
+    python benchmarks/bench_e2e.py --concurrency 32 --requests 2000
+    python benchmarks/bench_e2e.py --latency 0.005 --jitter 0.002 --userinfo-ratio 0.5
+    python benchmarks/bench_e2e.py --mix mix.json --output e2e.json --baseline e2e_baseline.json
+
+Autorita (/oauth/publickey, /oauth/userinfo) a UG endpoint bezi lokalne
+(tests/authority_standin.py) s nastavitelnou latenci, tokeny jsou podepsane jejim klicem.
+Aplikace bezi v procesu (httpx ASGITransport), data jsou v souborove SQLite
+naplnene generatorem `uoishelpers.datagenerator`.
+
+Mix dotazu je JSON {"jmeno": {"query": ..., "variables": {...}, "weight": 1}},
+hodnota promenne "$userId" se nahradi nahodnym id uzivatele z databaze.
+Vystupem jsou p50/p95/p99 latence a propustnost po operacich (a "total").
+"""
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import typing
+import asyncio
+import argparse
+import tempfile
+import contextlib
+
+import httpx
+import sqlalchemy
+import strawberry
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import DeclarativeBase, MappedAsDataclass, Mapped, mapped_column
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "tests"))
+sys.path.insert(0, os.path.dirname(__file__))
+from uoishelpers.gqlrouter import MountGuardedGQL
+from uoishelpers.authenticationMiddleware import createAuthentizationSentinel
+from uoishelpers.datagenerator import generateIntoDatabase
+from uoishelpers.dataloaders.IDLoader import GlobalTTLCache
+from uoishelpers.dataloaders.LoaderMapBase import LoaderMapBase
+from uoishelpers.schema import WhoAmIExtension, SessionCommitExtension
+from uoishelpers.gqlpermissions.RolePermissionSchemaExtension import RolePermissionSchemaExtension
+from uoishelpers.gqlpermissions.LoadDataExtension import LoadDataExtension
+from uoishelpers.gqlpermissions.RbacProviderExtension import RbacProviderExtension
+from uoishelpers.gqlpermissions.UserRoleProviderExtension import UserRoleProviderExtension
+from uoishelpers.gqlpermissions.UserAccessControlExtension import UserAccessControlExtension
+from authority_standin import AuthorityStandIn
+from compare import compare, report, load_results, save_results
+
+
+class BModel(MappedAsDataclass, DeclarativeBase):
+    pass
+
+
+class UserModel(BModel):
+    __tablename__ = "users"
+
+    id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default_factory=uuid.uuid4)
+    name: Mapped[str] = mapped_column(default=None, nullable=True)
+    surname: Mapped[str] = mapped_column(default=None, nullable=True)
+    email: Mapped[str] = mapped_column(default=None, nullable=True)
+    rbacobject_id: Mapped[uuid.UUID] = mapped_column(default=None, nullable=True)
+
+
+DEFAULT_MIX = {
+    "userById": {"query": "query($id: UUID!) { userById(id: $id) { id name surname email } }", "variables": {"id": "$userId"}, "weight": 5},
+    "userPage": {"query": "query { userPage(skip: 0, limit: 20) { id name } }", "variables": {}, "weight": 2},
+    "whoami": {"query": "query { whoami }", "variables": {}, "weight": 1},
+    "userGuarded": {"query": "query($id: UUID!) { userGuarded(id: $id) { id name } }", "variables": {"id": "$userId"}, "weight": 2},
+}
+
+
+class DemoError:
+    """Chybovy typ pro RBAC extensions (v demo schematu jen zaznam chyby)."""
+
+    def __class_getitem__(cls, item):
+        return cls
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def create_schema(session_maker, standin, shared_cache=None):
+    @strawberry.type
+    class UserGQLModel:
+        id: uuid.UUID
+        name: typing.Optional[str] = None
+        surname: typing.Optional[str] = None
+        email: typing.Optional[str] = None
+
+        @classmethod
+        def from_row(cls, row):
+            return None if row is None else cls(id=row.id, name=row.name, surname=row.surname, email=row.email)
+
+    def getLoader(info):
+        return info.context["loaders"].get(UserModel)
+
+    @strawberry.type
+    class Query:
+        @strawberry.field
+        async def user_by_id(self, info: strawberry.types.Info, id: uuid.UUID) -> typing.Optional[UserGQLModel]:
+            return UserGQLModel.from_row(await getLoader(info).load(id))
+
+        @strawberry.field
+        async def user_page(self, info: strawberry.types.Info, skip: int = 0, limit: int = 10) -> typing.List[UserGQLModel]:
+            return [UserGQLModel.from_row(row) for row in await getLoader(info).page(skip=skip, limit=limit)]
+
+        @strawberry.field
+        def whoami(self, info: strawberry.types.Info) -> typing.Optional[str]:
+            return (info.context.get("user", None) or {}).get("id", None)
+
+        @strawberry.field(extensions=[
+            UserAccessControlExtension[DemoError, UserGQLModel](roles=["administrátor"]),
+            UserRoleProviderExtension[DemoError, UserGQLModel](),
+            RbacProviderExtension[DemoError, UserGQLModel](),
+            LoadDataExtension[DemoError, UserGQLModel](getLoader=getLoader),
+        ])
+        async def user_guarded(
+            self, info: strawberry.types.Info, id: uuid.UUID,
+            db_row: typing.Optional[strawberry.scalars.JSON] = None,
+            rbacobject_id: typing.Optional[uuid.UUID] = None,
+            user_roles: typing.Optional[strawberry.scalars.JSON] = None,
+        ) -> typing.Optional[UserGQLModel]:
+            return UserGQLModel.from_row(db_row)
+
+    class StandInWhoAmIExtension(WhoAmIExtension):
+        GQLUG_ENDPOINT_URL = standin.ug_url
+
+    async def session_maker_factory():
+        return session_maker
+
+    def loaders_factory(session):
+        return {"loaders": LoaderMapBase[BModel](session, defer_invalidation=True, shared_cache=shared_cache)}
+
+    return strawberry.Schema(
+        query=Query,
+        extensions=[
+            StandInWhoAmIExtension,
+            RolePermissionSchemaExtension,
+            lambda: SessionCommitExtension(session_maker_factory=session_maker_factory, loaders_factory=loaders_factory),
+        ],
+    )
+
+
+def create_app(session_maker, standin, shared_cache=None):
+    app = FastAPI()
+    sentinel = createAuthentizationSentinel(
+        JWTPUBLICKEY=standin.publickey_url,
+        JWTRESOLVEUSERPATH=standin.userinfo_url,
+        queriesWOAuthentization=[],
+        onAuthenticationError=lambda item: JSONResponse({"data": None, "errors": ["Unauthenticated"]}, status_code=401),
+    )
+
+    async def get_context(request):
+        return {"request": request}
+
+    MountGuardedGQL(app, "/gql", schema=create_schema(session_maker, standin, shared_cache), get_context=get_context, sentinel=sentinel)
+    return app
+
+
+async def create_database(directory, users, seed=0):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{os.path.join(directory, 'e2e.sqlite')}")
+    async with engine.begin() as conn:
+        await conn.run_sync(BModel.metadata.create_all)
+    session_maker = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    await generateIntoDatabase(session_maker, BModel, counts={"users": users}, seed=seed)
+    async with session_maker() as session:
+        ids = [f"{id}" for id in await session.scalars(sqlalchemy.select(UserModel.id))]
+    return engine, session_maker, ids
+
+
+def percentile(values, fraction):
+    """Percentil metodou nejblizsiho poradi, `values` musi byt serazene."""
+    if not values:
+        return None
+    index = min(len(values) - 1, max(0, int(round(fraction * len(values) + 0.5)) - 1))
+    return values[index]
+
+
+def summarize(samples, seconds, concurrency):
+    """samples {operace: [(latence, ok), ...]} -> zaznamy pro compare.py"""
+    results = []
+    everything = [sample for operation in samples.values() for sample in operation]
+    for operation, items in sorted(samples.items()) + [("total", everything)]:
+        latencies = sorted(latency for latency, _ in items)
+        results.append({
+            "name": "e2e",
+            "params": {"operation": operation, "concurrency": concurrency},
+            "ops": len(items),
+            "errors": sum(1 for _, ok in items if not ok),
+            "seconds": seconds,
+            "ops_per_second": len(items) / seconds if seconds > 0 else 0.0,
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+        })
+    return results
+
+
+async def run_load(client, mix, tokens, user_ids, concurrency=8, requests=1000, duration=None, path="/gql", seed=0):
+    """Pusti `concurrency` workeru, ktere posilaji dotazy z `mix` (vazene podle `weight`),
+    dokud neodeslou `requests` dotazu nebo neuplyne `duration` sekund.
+    Vraci ({operace: [(latence, ok), ...]}, celkovy cas)."""
+    rng = random.Random(seed)
+    names = list(mix)
+    weights = [mix[name].get("weight", 1) for name in names]
+    samples = {name: [] for name in names}
+    remaining = [requests]
+    deadline = None if duration is None else time.perf_counter() + duration
+
+    def variables_for(template):
+        return {key: rng.choice(user_ids) if value == "$userId" else value for key, value in (template or {}).items()}
+
+    async def worker():
+        while True:
+            if deadline is not None:
+                if time.perf_counter() >= deadline:
+                    return
+            else:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            name = rng.choices(names, weights)[0]
+            operation = mix[name]
+            payload = {"query": operation["query"], "variables": variables_for(operation.get("variables", None))}
+            headers = {"Authorization": f"Bearer {rng.choice(tokens)}"}
+            start = time.perf_counter()
+            try:
+                response = await client.post(path, json=payload, headers=headers)
+                ok = response.status_code == 200 and not response.json().get("errors", None)
+            except Exception:
+                ok = False
+            samples[name].append((time.perf_counter() - start, ok))
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples, time.perf_counter() - start
+
+
+async def run(args):
+    mix = DEFAULT_MIX
+    if args.mix:
+        with open(args.mix, "r", encoding="utf-8") as f:
+            mix = json.load(f)
+
+    async with AuthorityStandIn(latency=args.latency, jitter=args.jitter, seed=args.seed) as standin:
+        with tempfile.TemporaryDirectory() as directory:
+            engine, session_maker, user_ids = await create_database(directory, args.users, seed=args.seed)
+            shared_cache = GlobalTTLCache(ttl=60) if args.cache else None
+            app = create_app(session_maker, standin, shared_cache)
+
+            rng = random.Random(args.seed)
+            # token s access_token (bez user_id) = sentinel se pta /oauth/userinfo
+            tokens = [
+                standin.sign(access_token=uuid.uuid4().hex, user_id=user_id) if rng.random() < args.userinfo_ratio else standin.sign(user_id)
+                for user_id in rng.sample(user_ids, min(args.tokens, len(user_ids)))
+            ]
+
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://e2e", timeout=60.0) as client:
+                # sentinel, WhoAmI i aplikace tiskne na stdout, pro mereni se potlaci
+                output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+                with output:
+                    if args.warmup:
+                        await run_load(client, mix, tokens, user_ids, args.concurrency, requests=args.warmup, seed=args.seed + 1)
+                    samples, seconds = await run_load(
+                        client, mix, tokens, user_ids, args.concurrency,
+                        requests=args.requests, duration=args.duration, seed=args.seed
+                    )
+            await engine.dispose()
+            results = summarize(samples, seconds, args.concurrency)
+            print_report(results, standin.requests)
+    return results
+
+
+def print_report(results, upstream):
+    print(f"{'operation':<14} {'count':>7} {'errors':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for result in results:
+        row = [result["p50"], result["p95"], result["p99"]]
+        print(
+            f"{result['params']['operation']:<14} {result['ops']:>7} {result['errors']:>7} {result['ops_per_second']:>9.1f} "
+            + " ".join(f"{value * 1000:>9.2f}" if value is not None else f"{'-':>9}" for value in row)
+        )
+    print(f"upstream calls: {dict(upstream)}", flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=None, help="misto --requests bezi zadany pocet sekund")
+    parser.add_argument("--warmup", type=int, default=50, help="pocet dotazu pred merenim")
+    parser.add_argument("--users", type=int, default=1000, help="pocet uzivatelu v databazi")
+    parser.add_argument("--tokens", type=int, default=100, help="pocet ruznych JWT (uzivatelu) v zatezi")
+    parser.add_argument("--userinfo-ratio", type=float, default=0.0, help="podil tokenu bez user_id (sentinel vola /oauth/userinfo)")
+    parser.add_argument("--latency", type=float, default=0.0, help="latence autority a UG v sekundach")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--cache", action="store_true", help="sdilena GlobalTTLCache pro loadery")
+    parser.add_argument("--mix", help="JSON soubor s mixem dotazu")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verbose", action="store_true", help="nepotlacovat vystup aplikace")
+    parser.add_argument("--output", help="ulozi vysledky do JSON souboru")
+    parser.add_argument("--baseline", help="porovna propustnost s JSON souborem z --output (viz compare.py)")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args))
+    if args.output:
+        save_results(args.output, results, {key: value for key, value in vars(args).items() if key not in ("output", "baseline")})
+    if args.baseline:
+        return report(compare(results, load_results(args.baseline), args.threshold), args.threshold)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
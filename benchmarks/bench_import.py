@@ -0,0 +1,116 @@
+"""Porovnani cest hromadneho vkladani na SQLite.
+
+    python benchmarks/bench_import.py --rows 10000 100000 1000000
+
+orm    - session.add_all(DBModel(**row)) po 30 radcich (puvodni putPredefinedStructuresIntoTable)
+core   - Core insert() executemany v jedne transakci
+feeder - putPredefinedStructuresIntoTable (diff podle id, INSERT ... ON CONFLICT DO NOTHING, kontrola poctu)
+"""
+import os
+import sys
+import time
+import uuid
+import asyncio
+import argparse
+import datetime
+import tempfile
+
+import sqlalchemy
+from sqlalchemy.orm import DeclarativeBase, MappedAsDataclass, Mapped, mapped_column
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+from uoishelpers.feeders import putPredefinedStructuresIntoTable
+from compare import compare, report, load_results, save_results
+
+
+class BModel(MappedAsDataclass, DeclarativeBase):
+    pass
+
+
+class ItemModel(BModel):
+    __tablename__ = "items"
+
+    id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default_factory=uuid.uuid4)
+    name: Mapped[str] = mapped_column(default=None, nullable=True)
+    value: Mapped[int] = mapped_column(default=None, nullable=True)
+    lastchange: Mapped[datetime.datetime] = mapped_column(default_factory=datetime.datetime.now)
+
+
+def generate_rows(count):
+    now = datetime.datetime.now()
+    return [{"id": uuid.uuid4(), "name": f"item {i}", "value": i, "lastchange": now} for i in range(count)]
+
+
+async def insert_orm(session_maker, rows):
+    for start in range(0, len(rows), 30):
+        async with session_maker() as session:
+            async with session.begin():
+                session.add_all([ItemModel(**row) for row in rows[start:start + 30]])
+
+
+async def insert_core(session_maker, rows, chunk_size=1000):
+    async with session_maker() as session:
+        async with session.begin():
+            for start in range(0, len(rows), chunk_size):
+                await session.execute(sqlalchemy.insert(ItemModel.__table__), rows[start:start + chunk_size])
+
+
+async def insert_feeder(session_maker, rows, chunk_size=1000):
+    await putPredefinedStructuresIntoTable(session_maker, ItemModel, lambda: rows, chunk_size=chunk_size)
+
+
+PATHS = {"orm": insert_orm, "core": insert_core, "feeder": insert_feeder}
+
+
+async def measure(path, rows, directory):
+    filename = os.path.join(directory, f"{path}_{len(rows)}.sqlite")
+    engine = create_async_engine(f"sqlite+aiosqlite:///{filename}")
+    async with engine.begin() as conn:
+        await conn.run_sync(BModel.metadata.create_all)
+    session_maker = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
+    start = time.perf_counter()
+    await PATHS[path](session_maker, rows)
+    elapsed = time.perf_counter() - start
+    async with session_maker() as session:
+        count = await session.scalar(sqlalchemy.select(sqlalchemy.func.count()).select_from(ItemModel))
+    await engine.dispose()
+    assert count == len(rows), (path, count, len(rows))
+    return elapsed
+
+
+async def run(sizes, paths, max_orm_rows):
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for size in sizes:
+            rows = generate_rows(size)
+            for path in paths:
+                if path == "orm" and size > max_orm_rows:
+                    continue
+                elapsed = await measure(path, rows, directory)
+                results.append({"path": path, "rows": size, "seconds": elapsed, "rows_per_second": size / elapsed})
+                print(f"{path:>7} {size:>9} rows {elapsed:9.2f} s {size / elapsed:12.0f} rows/s", flush=True)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--paths", nargs="+", choices=list(PATHS), default=list(PATHS))
+    parser.add_argument("--max-orm-rows", type=int, default=1_000_000, help="orm path is skipped above this size")
+    parser.add_argument("--output", help="ulozi vysledky do JSON souboru")
+    parser.add_argument("--baseline", help="porovna vysledky s JSON souborem z --output (viz compare.py)")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    args = parser.parse_args(argv)
+    results = asyncio.run(run(args.rows, args.paths, args.max_orm_rows))
+    if args.output:
+        save_results(args.output, results)
+    if args.baseline:
+        return report(compare(results, load_results(args.baseline), args.threshold), args.threshold)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
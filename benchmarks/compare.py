@@ -0,0 +1,75 @@
+"""Porovnani vysledku benchmarku s ulozenym baseline (JSON).
+
+    python benchmarks/compare.py current.json baseline.json --threshold 0.25
+
+Vysledek je seznam zaznamu, merena velicina je `ops_per_second` (nebo `rows_per_second`),
+ostatni klice (name, params, ...) identifikuji mereni. Mereni pomalejsi nez baseline
+o vic nez `threshold` (podil) je regrese, skript pak konci s kodem 1.
+"""
+import sys
+import json
+import argparse
+
+_METRICS = ("ops_per_second", "rows_per_second")
+_MEASURED = {"seconds", "ops", "errors", "skipped", "p50", "p95", "p99", "db_queries", *_METRICS}
+
+
+def _key(record):
+    return json.dumps({key: value for key, value in record.items() if key not in _MEASURED}, sort_keys=True, default=str)
+
+
+def _rate(record):
+    for metric in _METRICS:
+        if metric in record:
+            return record[metric]
+    return None
+
+
+def load_results(path):
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    # soubor je bud primo seznam, nebo {"meta": ..., "results": [...]}
+    return data["results"] if isinstance(data, dict) else data
+
+
+def save_results(path, results, meta=None):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta or {}, "results": results}, f, indent=2, default=str)
+
+
+def compare(results, baseline, threshold=0.25):
+    """Vraci seznam regresi {key, baseline, current, change}, change je relativni zmena rychlosti."""
+    baselineIndex = {_key(record): _rate(record) for record in baseline}
+    regressions = []
+    for record in results:
+        key = _key(record)
+        expected, current = baselineIndex.get(key, None), _rate(record)
+        if not expected or current is None:
+            continue
+        change = current / expected - 1.0
+        if change < -threshold:
+            regressions.append({"key": key, "baseline": expected, "current": current, "change": change})
+    return regressions
+
+
+def report(regressions, threshold):
+    """Vypise regrese, vraci navratovy kod (0 = bez regresi)."""
+    if not regressions:
+        print(f"no regressions (threshold {threshold:.0%})")
+        return 0
+    for regression in regressions:
+        print(f"REGRESSION {regression['key']}: {regression['baseline']:.1f} -> {regression['current']:.1f} ops/s ({regression['change']:+.1%})")
+    return 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("current")
+    parser.add_argument("baseline")
+    parser.add_argument("--threshold", type=float, default=0.25)
+    args = parser.parse_args(argv)
+    return report(compare(load_results(args.current), load_results(args.baseline), args.threshold), args.threshold)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,168 @@
+"""Lokalni nahrada autority (OAuth) a UG GraphQL endpointu pro testy a zatezove testy.
+
+Posloucha na 127.0.0.1 (nahodny port) a obsluhuje
+GET  /oauth/publickey   verejny klic (PEM jako JSON string, jak ho vraci autorita)
+GET  /oauth/userinfo    {"id": ...} podle `access_token` z Bearer hlavicky
+POST /gql               UG endpoint, odpovida na `me`, `rbacById { userCanWithoutState
+                        | userCanWithState | roles }` a pole z `handlers`
+
+`latency` a `jitter` (sekundy, normalni rozdeleni) zpozdi kazdou odpoved,
+`sign()` vystavi RS256 JWT, `rotate_key()` vymeni klic, `requests` pocita volani.
+"""
+import json
+import time
+import uuid
+import random
+import asyncio
+import collections
+
+import jwt
+from aiohttp import web
+from graphql import parse
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+
+ROLETYPE_ADMIN = {"__typename": "RoleTypeGQLModel", "id": "ced46aa4-3217-4fc1-b79d-f6be7d21c6b6", "name": "administrátor", "path": None, "subtypes": []}
+GROUP = {"id": "2d9dcd22-a4a2-11ed-b9df-0242ac120003", "name": "Uni", "grouptype": {"id": "cd49e152-610c-11ed-9f29-001a7dda7110", "name": "univerzita"}}
+
+
+class AuthorityStandIn:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, roletypes=(ROLETYPE_ADMIN,), allow: bool = True, handlers=None, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.roletypes = list(roletypes)
+        self.allow = allow
+        self.handlers = handlers or {}
+        self.users = {}  # access_token -> userinfo
+        self.requests = collections.Counter()
+        self._rng = random.Random(seed)
+        self._runner = None
+        self._port = None
+        self.rotate_key()
+
+    # ========================
+    # klice a tokeny
+    # ========================
+
+    def rotate_key(self) -> None:
+        self._private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        self.public_pem = self._private_key.public_key().public_bytes(
+            serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+        ).decode()
+
+    def sign(self, user_id=None, *, access_token=None, expires_in: float = 3600, **claims) -> str:
+        """Vystavi JWT. Bez `access_token` obsahuje `user_id` a sentinel ho prevezme primo,
+        s `access_token` se sentinel pta /oauth/userinfo (token se zaregistruje pro `user_id`)."""
+        payload = {"exp": int(time.time() + expires_in), **claims}
+        if access_token is None and user_id is not None:
+            payload["user_id"] = f"{user_id}"
+        else:
+            access_token = access_token or uuid.uuid4().hex
+            self.users[access_token] = {"id": f"{user_id or uuid.uuid4()}"}
+            payload["access_token"] = access_token
+        return jwt.encode(payload, self._private_key, algorithm="RS256")
+
+    # ========================
+    # server
+    # ========================
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._port}"
+
+    @property
+    def publickey_url(self) -> str:
+        return f"{self.base_url}/oauth/publickey"
+
+    @property
+    def userinfo_url(self) -> str:
+        return f"{self.base_url}/oauth/userinfo"
+
+    @property
+    def ug_url(self) -> str:
+        return f"{self.base_url}/gql"
+
+    async def __aenter__(self):
+        app = web.Application()
+        app.router.add_get("/oauth/publickey", self._publickey)
+        app.router.add_get("/oauth/userinfo", self._userinfo)
+        app.router.add_post("/gql", self._gql)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self._port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._runner.cleanup()
+
+    async def _delay(self):
+        delay = self._rng.gauss(self.latency, self.jitter) if self.jitter else self.latency
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _publickey(self, request):
+        self.requests["publickey"] += 1
+        await self._delay()
+        return web.Response(text=json.dumps(self.public_pem))
+
+    async def _userinfo(self, request):
+        self.requests["userinfo"] += 1
+        await self._delay()
+        token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+        userinfo = self.users.get(token, None)
+        if userinfo is None:
+            return web.json_response({"error": "unknown token"}, status=401)
+        return web.json_response(userinfo)
+
+    async def _gql(self, request):
+        self.requests["ug"] += 1
+        await self._delay()
+        payload = await request.json()
+        user_id = self._user_id(request.cookies.get("authorization", None))
+        data = {}
+        for operation in parse(payload["query"]).definitions:
+            for field in operation.selection_set.selections:
+                key = field.alias.value if field.alias else field.name.value
+                data[key] = self._resolve(field, payload.get("variables", None) or {}, user_id)
+        return web.json_response({"data": data})
+
+    def _user_id(self, token):
+        if token is None:
+            return None
+        try:
+            claims = jwt.decode(token, self.public_pem, algorithms=["RS256"])
+        except jwt.PyJWTError:
+            return None
+        user_id = claims.get("user_id", None)
+        if user_id is None:
+            user_id = self.users.get(claims.get("access_token", None), {}).get("id", None)
+        return user_id
+
+    def _roles(self, user_id):
+        return [
+            {"valid": True, "userId": user_id, "startdate": None, "enddate": None, "group": GROUP, "roletype": roletype}
+            for roletype in self.roletypes
+        ]
+
+    def _resolve(self, field, variables, user_id):
+        name = field.name.value
+        if name in self.handlers:
+            return self.handlers[name](field, variables, user_id)
+        if name == "me":
+            if user_id is None:
+                return None
+            return {"id": user_id, "fullname": "John Newbie", "email": "john.newbie@example.com", "roles": self._roles(user_id)}
+        if name == "rbacById":
+            result = {}
+            for subfield in field.selection_set.selections:
+                key = subfield.alias.value if subfield.alias else subfield.name.value
+                if subfield.name.value == "roles":
+                    result[key] = self._roles(variables.get("user_id", user_id))
+                else:
+                    # userCanWithoutState, userCanWithState
+                    result[key] = self.allow
+            return result
+        return None
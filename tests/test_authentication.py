@@ -0,0 +1,141 @@
+import time
+import types
+import uuid
+
+import pytest
+
+from uoishelpers.authenticationMiddleware import createAuthentizationSentinel, BasicAuthBackend, TokenCache
+
+from authority_standin import AuthorityStandIn
+from valkey_standin import ValkeyStandIn
+
+
+def create_request(token=None):
+    headers = {} if token is None else {"Authorization": f"Bearer {token}"}
+    return types.SimpleNamespace(
+        client=None, headers=headers, cookies={}, url=types.SimpleNamespace(path="/gql"), base_url="http://test/", scope={}
+    )
+
+
+def create_item(query="{ hello }"):
+    return types.SimpleNamespace(query=query, variables={})
+
+
+@pytest.mark.asyncio
+async def test_sentinel_with_authority_standin():
+    async with AuthorityStandIn() as standin:
+        sentinel = createAuthentizationSentinel(
+            JWTPUBLICKEY=standin.publickey_url, JWTRESOLVEUSERPATH=standin.userinfo_url,
+            onAuthenticationError=lambda item: "unauthorized"
+        )
+        user_id = f"{uuid.uuid4()}"
+
+        request = create_request(standin.sign(user_id))
+        assert await sentinel(request, create_item()) is None
+        assert request.scope["user"] == {"id": user_id}
+        assert standin.requests == {"publickey": 1}
+
+        # token bez user_id, identita z /oauth/userinfo
+        request = create_request(standin.sign(user_id, access_token="token"))
+        assert await sentinel(request, create_item()) is None
+        assert request.scope["user"] == {"id": user_id}
+        assert standin.requests == {"publickey": 1, "userinfo": 1}
+
+        # po rotaci klice se verejny klic znovu nacte
+        standin.rotate_key()
+        request = create_request(standin.sign(user_id))
+        assert await sentinel(request, create_item()) is None
+        assert standin.requests["publickey"] == 2
+
+        assert await sentinel(create_request(), create_item()) == "unauthorized"
+        assert await sentinel(create_request("garbage"), create_item()) == "unauthorized"
+
+
+@pytest.mark.asyncio
+async def test_sentinel_caches_verified_tokens():
+    async with AuthorityStandIn() as standin:
+        tokenCache = TokenCache(maxsize=2)
+        sentinel = createAuthentizationSentinel(
+            JWTPUBLICKEY=standin.publickey_url, JWTRESOLVEUSERPATH=standin.userinfo_url,
+            onAuthenticationError=lambda item: "unauthorized", tokenCache=tokenCache
+        )
+        user_id = f"{uuid.uuid4()}"
+        token = standin.sign(user_id, access_token="token")
+
+        for _ in range(3):
+            request = create_request(token)
+            assert await sentinel(request, create_item()) is None
+            assert request.scope["user"] == {"id": user_id}
+        # userinfo se dohledava jen poprve
+        assert standin.requests == {"publickey": 1, "userinfo": 1}
+        assert tokenCache.get_stats()["hits"] == 2
+
+        # neplatne tokeny se necachuji
+        assert await sentinel(create_request("garbage"), create_item()) == "unauthorized"
+        assert tokenCache.get_stats()["entries"] == 1
+
+        # omezena velikost
+        for index in range(3):
+            assert await sentinel(create_request(standin.sign(user_id, jti=f"{index}")), create_item()) is None
+        assert tokenCache.get_stats()["entries"] == 2
+        assert tokenCache.get_stats()["evictions"] == 2
+
+        # rotace klice cache vyprazdni
+        standin.rotate_key()
+        assert await sentinel(create_request(standin.sign(user_id)), create_item()) is None
+        assert tokenCache.get_stats()["clears"] == 1
+        assert tokenCache.get_stats()["entries"] == 1
+
+
+@pytest.mark.asyncio
+async def test_token_cache_lifetime():
+    async with AuthorityStandIn() as standin:
+        tokenCache = TokenCache(max_ttl=60)
+        claims = {"exp": time.time() + 3600, "user_id": "u"}
+        await tokenCache.set("a", b"key", claims, {"id": "u"})
+        assert (await tokenCache.get("a", b"key"))["userinfo"] == {"id": "u"}
+        # jiny verejny klic, jiny zaznam
+        assert await tokenCache.get("a", b"other") is None
+        # zaznam plati nejdele max_ttl, resp. do exp tokenu
+        assert tokenCache._data[TokenCache._key("a", b"key")][0] <= time.time() + 60
+        await tokenCache.set("b", b"key", {"exp": time.time() + 1}, {"id": "u"})
+        assert tokenCache._data[TokenCache._key("b", b"key")][0] <= time.time() + 1
+        await tokenCache.set("c", b"key", {"exp": time.time() - 1}, {"id": "u"})
+        assert await tokenCache.get("c", b"key") is None
+
+        # BasicAuthBackend sdili stejnou logiku
+        backend = BasicAuthBackend(JWTPUBLICKEY=standin.publickey_url, JWTRESOLVEUSERPATH=standin.userinfo_url, tokenCache=TokenCache())
+        token = standin.sign("user", access_token="backend")
+        for _ in range(2):
+            credentials, userinfo = await backend.authenticate(create_request(token))
+            assert userinfo == {"id": "user"}
+        assert standin.requests == {"publickey": 1, "userinfo": 1}
+
+        # maxsize=0 cache vypne
+        backend = BasicAuthBackend(JWTPUBLICKEY=standin.publickey_url, JWTRESOLVEUSERPATH=standin.userinfo_url, tokenCache=TokenCache(maxsize=0))
+        for _ in range(2):
+            await backend.authenticate(create_request(token))
+        assert standin.requests["userinfo"] == 3
+
+
+@pytest.mark.asyncio
+async def test_token_cache_shared_through_valkey():
+    async with AuthorityStandIn() as standin, ValkeyStandIn() as valkeyStandIn:
+        sentinels = [
+            createAuthentizationSentinel(
+                JWTPUBLICKEY=standin.publickey_url, JWTRESOLVEUSERPATH=standin.userinfo_url,
+                onAuthenticationError=lambda item: "unauthorized",
+                tokenCache=TokenCache(connection_string=valkeyStandIn.url, timeout=1.0)
+            )
+            for _ in range(2)
+        ]
+        token = standin.sign("user", access_token="shared")
+        for sentinel in sentinels:
+            request = create_request(token)
+            assert await sentinel(request, create_item()) is None
+            assert request.scope["user"] == {"id": "user"}
+        # druhy worker prevzal overeni z Valkey
+        assert standin.requests["userinfo"] == 1
+        assert sentinels[1].tokenCache.get_stats()["valkey_hits"] == 1
+        key = next(iter(valkeyStandIn.data)).decode()
+        assert key.startswith("jwtCache:") and token not in key
@@ -0,0 +1,98 @@
+import uuid
+import datetime
+
+import pytest
+import sqlalchemy
+
+from sqlalchemy import ForeignKey, event
+from sqlalchemy.orm import DeclarativeBase, MappedAsDataclass, Mapped, mapped_column
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from uoishelpers.datagenerator import iterSyntheticRows, generateIntoDatabase, generateJsonFile
+
+
+class BModel(MappedAsDataclass, DeclarativeBase):
+    pass
+
+
+class UserModel(BModel):
+    __tablename__ = 'users'
+
+    id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default_factory=uuid.uuid4)
+    name: Mapped[str] = mapped_column(default=None, nullable=True)
+    email: Mapped[str] = mapped_column(default=None, nullable=True)
+    valid: Mapped[bool] = mapped_column(default=True)
+
+
+class GroupModel(BModel):
+    __tablename__ = 'groups'
+
+    id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default_factory=uuid.uuid4)
+    name: Mapped[str] = mapped_column(default=None, nullable=True)
+    mastergroup_id: Mapped[uuid.UUID] = mapped_column(ForeignKey('groups.id'), default=None, nullable=True)
+
+
+class MembershipModel(BModel):
+    __tablename__ = 'memberships'
+
+    id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default_factory=uuid.uuid4)
+    user_id: Mapped[uuid.UUID] = mapped_column(ForeignKey('users.id'), default=None)
+    group_id: Mapped[uuid.UUID] = mapped_column(ForeignKey('groups.id'), default=None)
+    startdate: Mapped[datetime.datetime] = mapped_column(default=None, nullable=True)
+    enddate: Mapped[datetime.datetime] = mapped_column(default=None, nullable=True)
+
+
+async def create_db(filename=":memory:"):
+    asyncEngine = create_async_engine(f"sqlite+aiosqlite:///{filename}")
+
+    @event.listens_for(asyncEngine.sync_engine, "connect")
+    def enable_foreign_keys(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+    async with asyncEngine.begin() as conn:
+        await conn.run_sync(BModel.metadata.create_all)
+    return sessionmaker(asyncEngine, expire_on_commit=False, class_=AsyncSession)
+
+
+def test_synthetic_rows_fanout():
+    batches = list(iterSyntheticRows(
+        BModel, counts={"users": 50, "groups": 13}, fanout={"memberships.user_id": 3, "groups.mastergroup_id": 3},
+        batchSize=20, nullRatio=0
+    ))
+    rows = {}
+    for tableName, batch in batches:
+        assert len(batch) <= 20
+        rows.setdefault(tableName, []).extend(batch)
+
+    assert {tableName: len(items) for tableName, items in rows.items()} == {"users": 50, "groups": 13, "memberships": 150}
+    # kazdy uzivatel ma prave 3 clenstvi
+    userIds = [row["id"] for row in rows["users"]]
+    assert sorted(userIds) == sorted(set(row["user_id"] for row in rows["memberships"]))
+    # strom skupin, rodic vzdy drive
+    seen = set()
+    for row in rows["groups"]:
+        assert row["mastergroup_id"] is None or row["mastergroup_id"] in seen
+        seen.add(row["id"])
+    assert all(row["enddate"] > row["startdate"] for row in rows["memberships"])
+    # deterministicke pro stejny seed
+    assert list(iterSyntheticRows(BModel, defaultCount=5)) == list(iterSyntheticRows(BModel, defaultCount=5))
+
+
+@pytest.mark.asyncio
+async def test_generate_into_database_and_json(tmp_path):
+    from uoishelpers.feeders import ImportJsonFile
+
+    sessionMaker = await create_db()
+    result = await generateIntoDatabase(sessionMaker, BModel, defaultCount=40, fanout={"memberships.group_id": 2}, batchSize=25)
+    assert result == {"users": 40, "groups": 40, "memberships": 80}
+    async with sessionMaker() as session:
+        assert await session.scalar(sqlalchemy.select(sqlalchemy.func.count()).select_from(MembershipModel)) == 80
+
+    path = tmp_path / "dataset.json"
+    assert generateJsonFile(f"{path}", BModel, defaultCount=30, batchSize=7) == {"users": 30, "groups": 30, "memberships": 30}
+    target = await create_db()
+    imported = await ImportJsonFile(target, [UserModel, GroupModel, MembershipModel], f"{path}")
+    assert imported == {"users": 30, "groups": 30, "memberships": 30}
@@ -0,0 +1,108 @@
+import csv
+import io
+import json
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse
+
+from uoishelpers.gqlrouter import MountStreamingExport
+
+from test_sessioncommit import BModel, UserModel, USER_ID, prepare_in_memory_sqllite
+
+
+async def create_client(sentinel, models=("UserModel",), permission=None):
+    async_session_maker = await prepare_in_memory_sqllite()
+    async with async_session_maker() as session:
+        session.add_all([UserModel(name=f"User {i:03}") for i in range(25)])
+        await session.commit()
+
+    async def session_maker_factory():
+        return async_session_maker
+
+    app = FastAPI()
+    MountStreamingExport(
+        app, BaseModel=BModel, session_maker_factory=session_maker_factory, sentinel=sentinel, chunk_size=10,
+        models=models, permission=permission
+    )
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test")
+
+
+async def allow(request, item):
+    return None
+
+
+@pytest.mark.asyncio
+async def test_export_ndjson_keyset():
+    async with await create_client(allow) as client:
+        response = await client.post("/export", json={"model": "UserModel", "limit": 20})
+        assert response.status_code == 200
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        assert len(rows) == 20
+        assert set(rows[0]) == {"id", "name"}
+
+        response = await client.post("/export", json={"model": "UserModel", "after": rows[-1]["id"]})
+        rest = [json.loads(line) for line in response.text.splitlines()]
+        assert len(rest) == 6
+        assert rest[0]["id"] > rows[-1]["id"]
+
+        response = await client.post("/export", json={"model": "UserModel", "where": {"name": {"_eq": "John"}}, "format": "csv"})
+        assert list(csv.reader(io.StringIO(response.text))) == [["id", "name"], [f"{USER_ID}", "John"]]
+
+        response = await client.post("/export", json={"model": "Unknown"})
+        assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_export_requires_sentinel():
+    async def deny(request, item):
+        assert item.query == "export UserModel"
+        return JSONResponse({"errors": ["Unauthenticated"]}, status_code=401)
+
+    async with await create_client(deny) as client:
+        response = await client.post("/export", json={"model": "UserModel"})
+        assert response.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_export_allowlist_and_permission():
+    # model mimo seznam se tvari jako neexistujici
+    async with await create_client(allow, models=[]) as client:
+        response = await client.post("/export", json={"model": "UserModel"})
+        assert response.status_code == 404
+
+    checked = []
+
+    async def permission(request, model, item):
+        checked.append(model)
+        return item.where is not None
+
+    async with await create_client(allow, models=[UserModel], permission=permission) as client:
+        response = await client.post("/export", json={"model": "UserModel"})
+        assert response.status_code == 403
+        response = await client.post("/export", json={"model": "UserModel", "where": {"name": {"_eq": "John"}}})
+        assert response.status_code == 200
+        assert [json.loads(line)["name"] for line in response.text.splitlines()] == ["John"]
+    assert checked == [UserModel, UserModel]
+
+
+@pytest.mark.asyncio
+async def test_export_error_trailer(monkeypatch):
+    from uoishelpers.dataloaders.IDLoader import IDLoader
+
+    async def failing_stream_select(self, statement, chunk_size=1000, register=False):
+        for index in range(3):
+            yield UserModel(name=f"partial {index}")
+        raise RuntimeError("connection lost")
+
+    monkeypatch.setattr(IDLoader, "stream_select", failing_stream_select)
+    async with await create_client(allow) as client:
+        response = await client.post("/export", json={"model": "UserModel"})
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert len(lines) == 4
+        assert lines[-1] == {"errors": ["connection lost"]}
+
+        response = await client.post("/export", json={"model": "UserModel", "format": "csv"})
+        assert response.text.splitlines()[-1] == "# export failed: connection lost"
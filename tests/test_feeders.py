@@ -181,3 +181,492 @@ async def test_export_json():
         assert dr == rr
 
 
+
+@pytest.mark.asyncio
+async def test_put_predefined_bulk():
+    import uuid
+    import datetime
+    from sqlalchemy.orm import DeclarativeBase, MappedAsDataclass, Mapped, mapped_column
+    from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+    from sqlalchemy.orm import sessionmaker
+    from uoishelpers.feeders import putPredefinedStructuresIntoTable
+
+    class BModel(MappedAsDataclass, DeclarativeBase):
+        pass
+
+    class ItemModel(BModel):
+        __tablename__ = 'items'
+
+        id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default_factory=uuid.uuid4)
+        name: Mapped[str] = mapped_column(default=None, nullable=True)
+        created: Mapped[datetime.datetime] = mapped_column(default_factory=datetime.datetime.now)
+
+    asyncEngine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with asyncEngine.begin() as conn:
+        await conn.run_sync(BModel.metadata.create_all)
+    async_session_maker = sessionmaker(asyncEngine, expire_on_commit=False, class_=AsyncSession)
+
+    data = [{'id': uuid.uuid4(), 'name': f'item {i}'} for i in range(2500)]
+    data.append({'id': data[0]['id'], 'name': 'duplicate'})
+    data.append({'id': uuid.uuid4()})
+
+    inserted = await putPredefinedStructuresIntoTable(async_session_maker, ItemModel, lambda: data, chunk_size=1000)
+    assert inserted == 2501
+    assert await putPredefinedStructuresIntoTable(async_session_maker, ItemModel, lambda: data) == 0
+
+    async with async_session_maker() as session:
+        first = await session.get(ItemModel, data[0]['id'])
+        assert first.name == 'item 0'
+        assert first.created is not None
+        assert await session.scalar(sqlalchemy.select(sqlalchemy.func.count()).select_from(ItemModel)) == 2501
+
+
+@pytest.mark.asyncio
+async def test_copy_rows_bind_processing():
+    import enum
+    import types
+    import uuid
+    from sqlalchemy.dialects.postgresql import asyncpg
+    from uoishelpers.feeders import _copyRows
+
+    class Color(enum.Enum):
+        red = 1
+
+    class Upper(sqlalchemy.types.TypeDecorator):
+        impl = sqlalchemy.String
+        cache_ok = True
+
+        def process_bind_param(self, value, dialect):
+            return None if value is None else value.upper()
+
+    table = sqlalchemy.Table(
+        "items", sqlalchemy.MetaData(),
+        sqlalchemy.Column("id", sqlalchemy.Uuid, primary_key=True),
+        sqlalchemy.Column("data", sqlalchemy.JSON),
+        sqlalchemy.Column("color", sqlalchemy.Enum(Color)),
+        sqlalchemy.Column("code", Upper),
+    )
+
+    class FakeAsyncpgConnection:
+        """COPY jako asyncpg, json kodek enkoduje str.encode (jako ho registruje SQLAlchemy)"""
+        def __init__(self):
+            self.copied = []
+
+        async def copy_records_to_table(self, table_name, records, columns):
+            for record in records:
+                values = dict(zip(columns, record))
+                values["data"].encode()
+                self.copied.append(values)
+
+    class FakeSession:
+        def __init__(self):
+            self.driver = FakeAsyncpgConnection()
+            self.statements = []
+
+        def get_bind(self):
+            return types.SimpleNamespace(dialect=asyncpg.dialect())
+
+        async def execute(self, statement):
+            self.statements.append(f"{statement}")
+            return types.SimpleNamespace(rowcount=len(self.driver.copied))
+
+        async def connection(self):
+            return self
+
+        async def get_raw_connection(self):
+            return types.SimpleNamespace(driver_connection=self.driver)
+
+    session = FakeSession()
+    id = uuid.uuid4()
+    rows = [{"id": id, "data": {"a": [1, 2]}, "color": Color.red, "code": "abc"}]
+    assert await _copyRows(session, table, rows, ("id", "data", "color", "code")) == 1
+    assert session.driver.copied == [{"id": id, "data": '{"a": [1, 2]}', "color": "red", "code": "ABC"}]
+    assert session.statements[-1].startswith("INSERT INTO items")
+
+
+@pytest.mark.asyncio
+async def test_import_dependency_order():
+    from sqlalchemy import Column, String, ForeignKey, event
+    from sqlalchemy.orm import declarative_base
+    from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+    from sqlalchemy.orm import sessionmaker
+    from uoishelpers.feeders import ImportModels, _importPlan
+
+    BModel = declarative_base()
+
+    class UserBM(BModel):
+        __tablename__ = 'users'
+        id = Column(String, primary_key=True)
+        name = Column(String)
+
+    class GroupBM(BModel):
+        __tablename__ = 'groups'
+        id = Column(String, primary_key=True)
+        mastergroup_id = Column(ForeignKey('groups.id'), nullable=True)
+
+    class MembershipBM(BModel):
+        __tablename__ = 'memberships'
+        id = Column(String, primary_key=True)
+        user_id = Column(ForeignKey('users.id'))
+        group_id = Column(ForeignKey('groups.id'))
+
+    asyncEngine = create_async_engine("sqlite+aiosqlite:///:memory:")
+
+    @event.listens_for(asyncEngine.sync_engine, "connect")
+    def enable_foreign_keys(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+    async with asyncEngine.begin() as conn:
+        await conn.run_sync(BModel.metadata.create_all)
+    async_session_maker = sessionmaker(asyncEngine, expire_on_commit=False, class_=AsyncSession)
+
+    DBModels = [MembershipBM, GroupBM, UserBM]
+    assert [sorted(level) for level in _importPlan(DBModels)] == [['groups', 'users'], ['memberships']]
+
+    data = {
+        'memberships': [{'id': 'm1', 'user_id': 'u1', 'group_id': 'g3'}],
+        # deti pred rodici
+        'groups': [
+            {'id': 'g3', 'mastergroup_id': 'g2'},
+            {'id': 'g2', 'mastergroup_id': 'g1'},
+            {'id': 'g1'},
+        ],
+        'users': [{'id': 'u1', 'name': 'John'}],
+    }
+    await ImportModels(async_session_maker, DBModels, data)
+
+    async with async_session_maker() as session:
+        for DBModel, count in [(UserBM, 1), (GroupBM, 3), (MembershipBM, 1)]:
+            assert await session.scalar(sqlalchemy.select(sqlalchemy.func.count()).select_from(DBModel)) == count
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("target", ["export", "export.zip"])
+async def test_export_import_ndjson(tmp_path, target):
+    import uuid
+    import datetime
+    from sqlalchemy import ForeignKey
+    from sqlalchemy.orm import DeclarativeBase, MappedAsDataclass, Mapped, mapped_column
+    from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+    from sqlalchemy.orm import sessionmaker
+    from uoishelpers.feeders import ExportModelsToNDJSON, ImportModelsFromNDJSON
+
+    class BModel(MappedAsDataclass, DeclarativeBase):
+        pass
+
+    class GroupModel(BModel):
+        __tablename__ = 'groups'
+
+        id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default_factory=uuid.uuid4)
+        name: Mapped[str] = mapped_column(default=None, nullable=True)
+        mastergroup_id: Mapped[uuid.UUID] = mapped_column(ForeignKey('groups.id'), default=None, nullable=True)
+        created: Mapped[datetime.datetime] = mapped_column(default_factory=datetime.datetime.now)
+
+    async def create_db(filename):
+        asyncEngine = create_async_engine(f"sqlite+aiosqlite:///{filename}")
+        async with asyncEngine.begin() as conn:
+            await conn.run_sync(BModel.metadata.create_all)
+        return sessionmaker(asyncEngine, expire_on_commit=False, class_=AsyncSession)
+
+    source = await create_db(tmp_path / "source.sqlite")
+    root = GroupModel(name="root")
+    # id potomku mensi nez id rodice, export je tedy neseradi podle hierarchie
+    groups = [root] + [
+        GroupModel(id=uuid.UUID(int=i), name=f"group {i}", mastergroup_id=root.id)
+        for i in range(1, 2500)
+    ]
+    async with source() as session:
+        session.add_all(groups)
+        await session.commit()
+
+    progress = []
+    path = tmp_path / target
+    exported = await ExportModelsToNDJSON(
+        source, [GroupModel], f"{path}", chunk_size=1000,
+        onProgress=lambda tableName, count: progress.append(count)
+    )
+    assert exported == {"groups": 2500}
+    assert progress == [1000, 2000, 2500]
+
+    target_db = await create_db(tmp_path / "target.sqlite")
+    assert await ImportModelsFromNDJSON(target_db, [GroupModel], f"{path}", batch_size=1000) == {"groups": 2500}
+    assert await ImportModelsFromNDJSON(target_db, [GroupModel], f"{path}") == {"groups": 0}
+
+    async with target_db() as session:
+        copy = await session.get(GroupModel, root.id)
+        assert (copy.name, copy.created) == ("root", root.created)
+        child = await session.get(GroupModel, uuid.UUID(int=7))
+        assert child.mastergroup_id == root.id
+
+
+def test_iter_json_tables(tmp_path):
+    from uoishelpers.feeders import iterJsonTables
+
+    path = tmp_path / "data.json"
+    path.write_text('{"users": [{"id": 1, "name": "J\\u00f6hn [x]"}, {"id": 12345}], "meta": {"a": [1]}, "empty": [], "groups": [ {"id": 2} ] }', encoding="utf-8")
+    expected = [("users", {"id": 1, "name": "Jöhn [x]"}), ("users", {"id": 12345}), ("groups", {"id": 2})]
+    for bufferSize in [1, 3, 7, 1 << 16]:
+        assert list(iterJsonTables(f"{path}", bufferSize=bufferSize)) == expected
+
+
+@pytest.mark.asyncio
+async def test_import_json_file(tmp_path):
+    import json
+    import uuid
+    import datetime
+    from sqlalchemy import ForeignKey
+    from sqlalchemy.orm import DeclarativeBase, MappedAsDataclass, Mapped, mapped_column
+    from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+    from sqlalchemy.orm import sessionmaker
+    from uoishelpers.feeders import ImportJsonFile
+
+    class BModel(MappedAsDataclass, DeclarativeBase):
+        pass
+
+    class UserModel(BModel):
+        __tablename__ = 'users'
+
+        id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default_factory=uuid.uuid4)
+        name: Mapped[str] = mapped_column(default=None, nullable=True)
+        startdate: Mapped[datetime.datetime] = mapped_column(default=None, nullable=True)
+
+    class MembershipModel(BModel):
+        __tablename__ = 'memberships'
+
+        id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default_factory=uuid.uuid4)
+        user_id: Mapped[uuid.UUID] = mapped_column(ForeignKey('users.id'), default=None)
+        # jmeno ve stylu "_id", ktere neni UUID
+        outer_id: Mapped[str] = mapped_column(default=None, nullable=True)
+
+    asyncEngine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with asyncEngine.begin() as conn:
+        await conn.run_sync(BModel.metadata.create_all)
+    async_session_maker = sessionmaker(asyncEngine, expire_on_commit=False, class_=AsyncSession)
+
+    user_ids = [uuid.uuid4() for _ in range(30)]
+    data = {
+        # clenstvi pred uzivateli, musi se odlozit
+        "memberships": [{"id": f"{uuid.uuid4()}", "user_id": f"{id}", "outer_id": "X-1"} for id in user_ids],
+        "users": [{"id": f"{id}", "name": f"user {i}", "startdate": "2024-02-01T10:00:00", "unknown": 1} for i, id in enumerate(user_ids)],
+        "unknown_table": [{"id": "1"}],
+    }
+    path = tmp_path / "data.json"
+    path.write_text(json.dumps(data), encoding="utf-8")
+
+    result = await ImportJsonFile(async_session_maker, [UserModel, MembershipModel], f"{path}", batch_size=7)
+    assert result == {"users": 30, "memberships": 30}
+
+    async with async_session_maker() as session:
+        user = await session.get(UserModel, user_ids[3])
+        assert (user.name, user.startdate) == ("user 3", datetime.datetime(2024, 2, 1, 10))
+        membership = (await session.execute(sqlalchemy.select(MembershipModel))).scalars().first()
+        assert membership.outer_id == "X-1"
+
+
+@pytest.mark.asyncio
+async def test_delta_export_import(tmp_path):
+    import json
+    import uuid
+    import datetime
+    from sqlalchemy.orm import DeclarativeBase, MappedAsDataclass, Mapped, mapped_column
+    from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+    from sqlalchemy.orm import sessionmaker
+    from uoishelpers.feeders import ExportModelsDelta, ImportModelsDelta
+
+    class BModel(MappedAsDataclass, DeclarativeBase):
+        pass
+
+    class ItemModel(BModel):
+        __tablename__ = 'items'
+
+        id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default_factory=uuid.uuid4)
+        name: Mapped[str] = mapped_column(default=None, nullable=True)
+        lastchange: Mapped[datetime.datetime] = mapped_column(default_factory=datetime.datetime.now)
+
+    async def create_db(filename):
+        asyncEngine = create_async_engine(f"sqlite+aiosqlite:///{filename}")
+        async with asyncEngine.begin() as conn:
+            await conn.run_sync(BModel.metadata.create_all)
+        return sessionmaker(asyncEngine, expire_on_commit=False, class_=AsyncSession)
+
+    source = await create_db(tmp_path / "source.sqlite")
+    target = await create_db(tmp_path / "target.sqlite")
+
+    day = datetime.datetime(2024, 1, 1)
+    items = [ItemModel(name=f"item {i}", lastchange=day) for i in range(100)]
+    async with source() as session:
+        session.add_all(items)
+        await session.commit()
+
+    # plny export (bez watermarku)
+    watermarks = await ExportModelsDelta(source, [ItemModel], f"{tmp_path / 'full'}")
+    assert watermarks == {"items": day.isoformat()}
+    assert await ImportModelsDelta(target, [ItemModel], f"{tmp_path / 'full'}") == {"items": {"upserted": 100, "deleted": 0}}
+
+    # zmeny za dalsi den
+    nextday = day + datetime.timedelta(days=1)
+    async with source() as session:
+        changed = await session.get(ItemModel, items[5].id)
+        changed.name, changed.lastchange = "changed", nextday
+        session.add(ItemModel(name="new", lastchange=nextday))
+        await session.delete(await session.get(ItemModel, items[7].id))
+        await session.commit()
+
+    path = tmp_path / "delta.zip"
+    newWatermarks = await ExportModelsDelta(
+        source, [ItemModel], f"{path}", watermarks=json.loads(json.dumps(watermarks)),
+        tombstones={"items": [items[7].id]}
+    )
+    assert newWatermarks == {"items": nextday.isoformat()}
+    assert await ImportModelsDelta(target, [ItemModel], f"{path}") == {"items": {"upserted": 2, "deleted": 1}}
+
+    async with target() as session:
+        assert (await session.get(ItemModel, items[5].id)).name == "changed"
+        assert await session.get(ItemModel, items[7].id) is None
+        assert await session.scalar(sqlalchemy.select(sqlalchemy.func.count()).select_from(ItemModel)) == 100
+
+    # opakovany import stejneho rozdilu nic nemeni
+    assert await ImportModelsDelta(target, [ItemModel], f"{path}") == {"items": {"upserted": 0, "deleted": 0}}
+
+
+@pytest.mark.asyncio
+async def test_delta_import_null_values(tmp_path):
+    import uuid
+    import datetime
+    from sqlalchemy.orm import DeclarativeBase, MappedAsDataclass, Mapped, mapped_column
+    from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+    from sqlalchemy.orm import sessionmaker
+    from uoishelpers.feeders import ExportModelsDelta, ImportModelsDelta
+
+    class BModel(MappedAsDataclass, DeclarativeBase):
+        pass
+
+    class ItemModel(BModel):
+        __tablename__ = 'items'
+
+        id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default_factory=uuid.uuid4)
+        name: Mapped[str] = mapped_column(default=None, nullable=True)
+        code: Mapped[str] = mapped_column(default_factory=lambda: "generated", nullable=True)
+        lastchange: Mapped[datetime.datetime] = mapped_column(default_factory=datetime.datetime.now)
+
+    async def create_db(filename):
+        asyncEngine = create_async_engine(f"sqlite+aiosqlite:///{filename}")
+        async with asyncEngine.begin() as conn:
+            await conn.run_sync(BModel.metadata.create_all)
+        return sessionmaker(asyncEngine, expire_on_commit=False, class_=AsyncSession)
+
+    source = await create_db(tmp_path / "source.sqlite")
+    target = await create_db(tmp_path / "target.sqlite")
+
+    day = datetime.datetime(2024, 1, 1)
+    item = ItemModel(name="x", code=None, lastchange=day)
+    async with source() as session:
+        session.add(item)
+        await session.commit()
+
+    # NULL ve sloupci s default_factory se nenahradi vygenerovanou hodnotou
+    await ExportModelsDelta(source, [ItemModel], f"{tmp_path / 'full'}")
+    assert await ImportModelsDelta(target, [ItemModel], f"{tmp_path / 'full'}") == {"items": {"upserted": 1, "deleted": 0}}
+    async with target() as session:
+        row = await session.get(ItemModel, item.id)
+        assert (row.name, row.code) == ("x", None)
+
+    # zmena hodnoty na NULL se propise
+    nextday = day + datetime.timedelta(days=1)
+    async with source() as session:
+        changed = await session.get(ItemModel, item.id)
+        changed.name, changed.lastchange = None, nextday
+        await session.commit()
+
+    path = tmp_path / "delta.zip"
+    await ExportModelsDelta(source, [ItemModel], f"{path}", watermarks={"items": day.isoformat()})
+    assert await ImportModelsDelta(target, [ItemModel], f"{path}") == {"items": {"upserted": 1, "deleted": 0}}
+    async with target() as session:
+        row = await session.get(ItemModel, item.id)
+        assert (row.name, row.code, row.lastchange) == (None, None, nextday)
+
+
+@pytest.mark.asyncio
+async def test_import_checkpoint_resume(tmp_path):
+    import json
+    from uoishelpers.feeders import ImportModels
+
+    [async_session_maker, UserModel, *_] = await prepare_in_memory_sqllite()
+
+    class CountingSessionMaker:
+        def __init__(self, failAfter=None):
+            self.calls = 0
+            self.failAfter = failAfter
+
+        def __call__(self):
+            self.calls += 1
+            if self.failAfter is not None and self.calls > self.failAfter:
+                raise ConnectionError("database went away")
+            return async_session_maker()
+
+    data = {'users': [{'id': f'{i}', 'name': f'user {i}'} for i in range(1000)]}
+    checkpoint = tmp_path / "checkpoint.json"
+
+    # spadne pri ctvrte davce
+    with pytest.raises(ConnectionError):
+        await ImportModels(CountingSessionMaker(failAfter=3), [UserModel], data, chunk_size=100, checkpoint=f"{checkpoint}")
+    assert json.loads(checkpoint.read_text())["users"]["chunk"] == 2
+
+    progress = []
+    sessionMaker = CountingSessionMaker()
+    await ImportModels(sessionMaker, [UserModel], data, chunk_size=100, checkpoint=f"{checkpoint}", onProgress=progress.append)
+    # jen zbyvajici davky, bez cteni cele tabulky
+    assert sessionMaker.calls == 7
+    assert progress[0]["rows"] == 300
+    assert progress[-1]["rows"] == progress[-1]["total"] == 1000
+    assert progress[-1]["eta"] == 0
+    state = json.loads(checkpoint.read_text())["users"]
+    assert (state["chunk"], state["done"]) == (9, True)
+
+    # hotovo, opakovani nic nedela
+    sessionMaker = CountingSessionMaker()
+    await ImportModels(sessionMaker, [UserModel], data, chunk_size=100, checkpoint=f"{checkpoint}")
+    assert sessionMaker.calls == 0
+
+    async with async_session_maker() as session:
+        assert await session.scalar(sqlalchemy.select(sqlalchemy.func.count()).select_from(UserModel)) == 1000
+
+
+@pytest.mark.asyncio
+async def test_import_checkpoint_same_as_plain(tmp_path):
+    import uuid
+    import datetime
+    from sqlalchemy.orm import DeclarativeBase, MappedAsDataclass, Mapped, mapped_column
+    from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+    from sqlalchemy.orm import sessionmaker
+    from uoishelpers.feeders import ImportModels
+
+    class BModel(MappedAsDataclass, DeclarativeBase):
+        pass
+
+    class ItemModel(BModel):
+        __tablename__ = 'items'
+
+        id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default_factory=uuid.uuid4)
+        name: Mapped[str] = mapped_column(default=None, nullable=True)
+        lastchange: Mapped[datetime.datetime] = mapped_column(default_factory=datetime.datetime.now)
+
+    async def create_db(filename):
+        asyncEngine = create_async_engine(f"sqlite+aiosqlite:///{filename}")
+        async with asyncEngine.begin() as conn:
+            await conn.run_sync(BModel.metadata.create_all)
+        return sessionmaker(asyncEngine, expire_on_commit=False, class_=AsyncSession)
+
+    # explicitni None u insert-only importu = chybejici hodnota, plati default
+    data = {'items': [{'id': uuid.uuid4(), 'name': 'x', 'lastchange': None}]}
+    imported = []
+    for mode, kwargs in [("plain", {}), ("checkpoint", {"checkpoint": f"{tmp_path / 'checkpoint.json'}"})]:
+        sessionMaker = await create_db(tmp_path / f"{mode}.sqlite")
+        await ImportModels(sessionMaker, [ItemModel], data, **kwargs)
+        async with sessionMaker() as session:
+            row = await session.get(ItemModel, data['items'][0]['id'])
+            assert row.lastchange is not None
+            imported.append(row.name)
+    assert imported == ['x', 'x']
@@ -0,0 +1,177 @@
+import uuid
+import time
+import asyncio
+import datetime
+
+import pytest
+
+from uoishelpers.dataloaders.IDLoader import GlobalTTLCache
+from valkey_standin import ValkeyStandIn
+
+
+@pytest.mark.asyncio
+async def test_valkey_roundtrip():
+    async with ValkeyStandIn() as server:
+        cache = GlobalTTLCache(ttl=20, connection_string=server.url)
+        value = {"id": uuid.uuid4(), "name": "John", "lastchange": datetime.datetime.now()}
+        await cache.set_many({"UserModel:1": value})
+        await cache.flush_writes()
+
+        assert await cache.get_many(["UserModel:1", "UserModel:2"]) == {"UserModel:1": value}
+        await cache.invalidate("UserModel:1")
+        assert await cache.get_many(["UserModel:1"]) == {}
+        await cache.close()
+
+
+@pytest.mark.asyncio
+async def test_valkey_read_deadline():
+    async with ValkeyStandIn(delay=0.5) as server:
+        cache = GlobalTTLCache(ttl=20, connection_string=server.url, read_timeout=0.05)
+        start = time.perf_counter()
+        assert await cache.get_many(["UserModel:1"]) == {}
+        assert time.perf_counter() - start < 0.3
+        assert cache.get_stats()["timeouts"] == 1
+        await cache.close()
+
+
+@pytest.mark.asyncio
+async def test_valkey_circuit_breaker():
+    async with ValkeyStandIn(delay=0.5) as server:
+        cache = GlobalTTLCache(
+            ttl=20, connection_string=server.url,
+            read_timeout=0.05, breaker_threshold=2, breaker_cooldown=0.2
+        )
+        await cache.get_many(["UserModel:1"])
+        await cache.get_many(["UserModel:1"])
+        assert cache.get_stats()["breaker"] == "open"
+
+        # otevreny jistic, Valkey se vubec nevola
+        commands = len(server.commands)
+        assert await cache.get_many(["UserModel:1"]) == {}
+        assert len(server.commands) == commands
+        assert cache.get_stats()["bypassed"] == 1
+
+        # po cooldownu projde zkusebni dotaz a jistic se zavre
+        server.delay = 0
+        await asyncio.sleep(0.25)
+        await cache.get_many(["UserModel:1"])
+        assert cache.get_stats()["breaker"] == "closed"
+        await cache.close()
+
+
+@pytest.mark.asyncio
+async def test_valkey_write_backpressure():
+    async with ValkeyStandIn(delay=0.2) as server:
+        cache = GlobalTTLCache(
+            ttl=20, connection_string=server.url,
+            write_timeout=1.0, max_pending_writes=1
+        )
+        start = time.perf_counter()
+        await cache.set_many({"UserModel:1": {"name": "John"}})
+        # dalsi tik, prvni zapis uz odesel
+        await asyncio.sleep(0)
+        await cache.set_many({"UserModel:2": {"name": "Julia"}})
+        assert time.perf_counter() - start < 0.1
+        assert cache.get_stats()["dropped_writes"] == 1
+
+        await cache.flush_writes()
+        server.delay = 0
+        assert await cache.get_many(["UserModel:1", "UserModel:2"]) == {"UserModel:1": {"name": "John"}}
+        await cache.close()
+
+
+@pytest.mark.asyncio
+async def test_valkey_invalidate_after_inflight_write():
+    async with ValkeyStandIn(set_delay=0.2) as server:
+        cache = GlobalTTLCache(ttl=20, connection_string=server.url, write_timeout=1.0)
+        await cache.set_many({"UserModel:1": {"name": "John"}, "UserModel:2": {"name": "Julia"}})
+        # SET uz odesel, ale jeste nedobehl
+        await asyncio.sleep(0.05)
+        assert cache.get_stats()["pending_writes"] == 1
+
+        # DEL nesmi predbehnout rozpracovany SET stejneho klice
+        await cache.invalidate("UserModel:1")
+        await cache.invalidate_many(["UserModel:2"])
+        await cache.flush_writes()
+        assert await cache.get_many(["UserModel:1", "UserModel:2"]) == {}
+        await cache.close()
+
+
+@pytest.mark.asyncio
+async def test_valkey_coalesced_roundtrips():
+    async with ValkeyStandIn() as server:
+        cache = GlobalTTLCache(ttl=20, connection_string=server.url)
+        # vsechny modely v jednom tiku = jeden pipeline zapis
+        for model in ["UserModel", "GroupModel", "MembershipModel", "RoleTypeModel"]:
+            await cache.set_many({f"{model}:1": {"model": model}})
+        await cache.flush_writes()
+        assert server.commands.count("SET") == 4
+
+        roundtrips = server.roundtrips
+        results = await asyncio.gather(*(
+            cache.get_many([f"{model}:1", f"{model}:2"])
+            for model in ["UserModel", "GroupModel", "MembershipModel", "RoleTypeModel"]
+        ))
+        assert server.roundtrips == roundtrips + 1
+        assert server.commands.count("MGET") == 1
+        assert results[1] == {"GroupModel:1": {"model": "GroupModel"}}
+        assert results[3] == {"RoleTypeModel:1": {"model": "RoleTypeModel"}}
+        await cache.close()
+
+
+@pytest.mark.asyncio
+async def test_memory_byte_budget():
+    cache = GlobalTTLCache(ttl=20, max_bytes=1000)
+    await cache.set_many({f"LinkModel:{i}": {"a": i, "b": i} for i in range(10)})
+    await cache.set_many({"DocumentModel:1": {"description": "x" * 900}})
+
+    stats = cache.get_stats()
+    assert stats["bytes"] <= 1000
+    assert stats["evictions"] > 0
+    assert set(stats["bytes_by_model"]) == {"LinkModel", "DocumentModel"}
+    assert sum(stats["bytes_by_model"].values()) == stats["bytes"]
+
+    # nejstarsi zaznamy vypadly jako prvni
+    assert await cache.get_many(["LinkModel:0"]) == {}
+    assert await cache.get_many(["LinkModel:9"]) == {"LinkModel:9": {"a": 9, "b": 9}}
+
+    await cache.invalidate("DocumentModel:1")
+    assert "DocumentModel" not in cache.get_stats()["bytes_by_model"]
+
+
+@pytest.mark.asyncio
+async def test_memory_no_budget_skips_sizing(monkeypatch):
+    cache = GlobalTTLCache(ttl=20)
+
+    def fail(value):
+        raise AssertionError("velikost se bez rozpoctu nema pocitat")
+
+    monkeypatch.setattr(cache, "_estimate_size", fail)
+    await cache.set_many({f"LinkModel:{i}": {"a": i} for i in range(10)})
+    assert await cache.get_many(["LinkModel:3"]) == {"LinkModel:3": {"a": 3}}
+    assert cache.get_stats()["bytes"] == 0
+
+
+@pytest.mark.asyncio
+async def test_valkey_compression():
+    async with ValkeyStandIn() as server:
+        cache = GlobalTTLCache(ttl=20, connection_string=server.url, compress_threshold=200)
+        big = {"description": "lorem ipsum " * 100}
+        small = {"name": "John"}
+        await cache.set_many({"DocumentModel:1": big, "UserModel:1": small})
+        await cache.flush_writes()
+
+        assert server.data[b"idLoaderCache:DocumentModel:1"][0][:1] == b"\x01"
+        assert server.data[b"idLoaderCache:UserModel:1"][0] == b'{"name":"John"}'
+
+        # zaznam ulozeny starsi verzi (bez komprese)
+        server.data[b"idLoaderCache:UserModel:2"] = (b'{"name":"Julia"}', None)
+
+        result = await cache.get_many(["DocumentModel:1", "UserModel:1", "UserModel:2"])
+        assert result == {"DocumentModel:1": big, "UserModel:1": small, "UserModel:2": {"name": "Julia"}}
+
+        compression = cache.get_stats()["compression"]
+        assert compression["values"] == 1
+        assert compression["ratio"] < 0.5
+        assert compression["decompress_seconds"] > 0
+        await cache.close()
@@ -0,0 +1,194 @@
+import uuid
+import asyncio
+import sqlalchemy
+
+import pytest
+
+from sqlalchemy.orm import DeclarativeBase, MappedAsDataclass, Mapped, mapped_column
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from uoishelpers.dataloaders.IDLoader import IDLoader, GlobalTTLCache
+
+
+async def prepare_in_memory_sqllite():
+    class BModel(MappedAsDataclass, DeclarativeBase):
+        pass
+
+    class UserModel(BModel):
+        __tablename__ = 'users'
+
+        id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default_factory=uuid.uuid4)
+        name: Mapped[str] = mapped_column(default=None, nullable=True)
+        surname: Mapped[str] = mapped_column(default=None, nullable=True)
+
+    asyncEngine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with asyncEngine.begin() as conn:
+        await conn.run_sync(BModel.metadata.create_all)
+
+    async_session_maker = sessionmaker(
+        asyncEngine, expire_on_commit=False, class_=AsyncSession
+    )
+
+    data = [
+        UserModel(id=uuid.uuid4(), name='John', surname='Newbie'),
+        UserModel(id=uuid.uuid4(), name='Julia', surname='Newbie'),
+    ]
+    async with async_session_maker() as session:
+        session.add_all(data)
+        await session.commit()
+
+    return async_session_maker, UserModel, asyncEngine, BModel, [row.id for row in data]
+
+
+@pytest.mark.asyncio
+async def test_idloader_stale_if_error():
+    async_session_maker, UserModel, engine, BModel, ids = await prepare_in_memory_sqllite()
+    cache = GlobalTTLCache(ttl=0.05, stale_ttl=60)
+
+    async with async_session_maker() as session:
+        loader = IDLoader[UserModel](session, shared_cache=cache, asyncio_lock=asyncio.Lock())
+        rows = await loader.load_many(ids)
+        assert [row.name for row in rows] == ['John', 'Julia']
+
+    await asyncio.sleep(0.1)
+    assert await cache.get_many([f"UserModel:{ids[0]}"]) == {}
+
+    # databaze "spadne"
+    async with engine.begin() as conn:
+        await conn.run_sync(BModel.metadata.drop_all)
+
+    async with async_session_maker() as session:
+        loader = IDLoader[UserModel](session, shared_cache=cache, asyncio_lock=asyncio.Lock())
+        with pytest.raises(sqlalchemy.exc.OperationalError):
+            await loader.load(ids[0])
+
+    async with async_session_maker() as session:
+        loader = IDLoader[UserModel](session, shared_cache=cache, asyncio_lock=asyncio.Lock(), stale_if_error=True)
+        unknown = uuid.uuid4()
+        results = await asyncio.gather(
+            loader.load(ids[0]), loader.load(unknown),
+            return_exceptions=True
+        )
+        assert results[0].name == 'John'
+        assert isinstance(results[1], sqlalchemy.exc.OperationalError)
+        assert loader.degraded == {"UserModel": {ids[0]}}
+
+
+@pytest.mark.asyncio
+async def test_idloader_stale_on_timeout():
+    async_session_maker, UserModel, engine, BModel, ids = await prepare_in_memory_sqllite()
+    cache = GlobalTTLCache(ttl=0.05, stale_ttl=60)
+
+    async with async_session_maker() as session:
+        loader = IDLoader[UserModel](session, shared_cache=cache, asyncio_lock=asyncio.Lock())
+        await loader.load(ids[1])
+
+    await asyncio.sleep(0.1)
+
+    # zamek drzi nekdo jiny, db dotaz se nestihne
+    lock = asyncio.Lock()
+    await lock.acquire()
+    async with async_session_maker() as session:
+        loader = IDLoader[UserModel](
+            session, shared_cache=cache, asyncio_lock=lock,
+            stale_if_error=True, db_timeout=0.05
+        )
+        row = await loader.load(ids[1])
+        assert row.name == 'Julia'
+    lock.release()
+
+
+@pytest.mark.asyncio
+async def test_cache_warmup_from_hot_keys(tmp_path):
+    from uoishelpers.dataloaders.LoaderMapBase import LoaderMapBase
+
+    async_session_maker, UserModel, engine, BModel, ids = await prepare_in_memory_sqllite()
+    cache = GlobalTTLCache(ttl=20, hot_keys_sample_rate=1.0)
+
+    async with async_session_maker() as session:
+        loader = IDLoader[UserModel](session, shared_cache=cache, asyncio_lock=asyncio.Lock())
+        await loader.load(ids[1])
+
+    path = tmp_path / "hotkeys.json"
+    assert await cache.save_hot_keys(f"{path}") == {"UserModel": [f"{ids[1]}"]}
+
+    # novy worker, prazdna cache
+    fresh = GlobalTTLCache(ttl=20)
+    result = await LoaderMapBase[BModel].warmup(async_session_maker, shared_cache=fresh, path=f"{path}")
+    assert result == {"UserModel": 1}
+    cached = await fresh.get_many([f"UserModel:{ids[1]}", f"UserModel:{ids[0]}"])
+    assert list(cached) == [f"UserModel:{ids[1]}"]
+
+
+@pytest.mark.asyncio
+async def test_stream_page():
+    async_session_maker, UserModel, engine, BModel, ids = await prepare_in_memory_sqllite()
+    async with async_session_maker() as session:
+        session.add_all([UserModel(name=f"User {i:03}", surname='Bulk') for i in range(250)])
+        await session.commit()
+
+    cache = GlobalTTLCache(ttl=20)
+    async with async_session_maker() as session:
+        loader = IDLoader[UserModel](session, shared_cache=cache, asyncio_lock=asyncio.Lock())
+        names = [
+            row.name async for row in loader.stream_page(
+                where={"surname": {"_eq": "Bulk"}}, orderby="name", chunk_size=100
+            )
+        ]
+        assert len(names) == 250
+        assert names[:2] == ["User 000", "User 001"]
+        assert cache.get_stats()["entries"] == 0
+
+        rows = [row async for row in loader.stream_page(skip=1, limit=1, orderby="name", register=True)]
+        assert [row.name for row in rows] == ["Julia"]
+        assert cache.get_stats()["entries"] == 1
+        assert (await loader.load(rows[0].id)).name == "Julia"
+
+
+@pytest.mark.asyncio
+async def test_stream_page_does_not_hold_lock():
+    async_session_maker, UserModel, engine, BModel, ids = await prepare_in_memory_sqllite()
+    async with async_session_maker() as session:
+        session.add_all([UserModel(name=f"User {i:03}", surname='Bulk') for i in range(30)])
+        await session.commit()
+
+    # vychozi (procesove globalni) zamek, load() uvnitr smycky nesmi uvaznout
+    async with async_session_maker() as session, async_session_maker() as other:
+        loader = IDLoader[UserModel](session, shared_cache=None)
+        otherLoader = IDLoader[UserModel](other, shared_cache=None)
+        names = []
+        async for row in loader.stream_page(where={"surname": {"_eq": "Bulk"}}, orderby="name", chunk_size=10):
+            # jiny request ve stejnem workeru neceka na dokonceni streamu
+            assert (await asyncio.wait_for(otherLoader.load(ids[0]), timeout=1.0)).name == "John"
+            names.append((await asyncio.wait_for(loader.load(row.id), timeout=1.0)).name)
+        assert len(names) == 30
+        assert names[:2] == ["User 000", "User 001"]
+        assert not loader.asyncio_lock.locked()
+
+
+@pytest.mark.asyncio
+async def test_cache_warmup_integer_keys():
+    class BModel(MappedAsDataclass, DeclarativeBase):
+        pass
+
+    class CounterModel(BModel):
+        __tablename__ = 'counters'
+
+        id: Mapped[int] = mapped_column(primary_key=True)
+        name: Mapped[str] = mapped_column(default=None, nullable=True)
+
+    asyncEngine = create_async_engine("sqlite+aiosqlite:///:memory:")
+    async with asyncEngine.begin() as conn:
+        await conn.run_sync(BModel.metadata.create_all)
+    async_session_maker = sessionmaker(asyncEngine, expire_on_commit=False, class_=AsyncSession)
+    async with async_session_maker() as session:
+        session.add_all([CounterModel(id=1, name='one'), CounterModel(id=2, name='two')])
+        await session.commit()
+
+    # hot keys ze souboru prichazeji jako retezce
+    cache = GlobalTTLCache(ttl=20)
+    async with async_session_maker() as session:
+        loader = IDLoader[CounterModel](session, shared_cache=cache, asyncio_lock=asyncio.Lock())
+        assert await loader.warmup(["2", 1]) == 2
+    assert list(await cache.get_many(["CounterModel:1", "CounterModel:2"])) == ["CounterModel:1", "CounterModel:2"]
@@ -0,0 +1,209 @@
+import json
+import uuid
+import typing
+import datetime
+
+import pytest
+import graphql
+import strawberry
+import strawberry.federation
+
+from sqlalchemy import select
+from sqlalchemy.orm import DeclarativeBase, MappedAsDataclass, Mapped, mapped_column
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from uoishelpers.cmds.utils_sdl_2 import get_cruds
+from uoishelpers.cmds.sdltest import (
+    Workload,
+    local_executor,
+    fetch_sdl,
+    run_workload,
+    install_query_counter,
+    build_selection_depth,
+    print_ranking,
+)
+
+
+class BModel(MappedAsDataclass, DeclarativeBase):
+    pass
+
+
+class UserModel(BModel):
+    __tablename__ = "users"
+
+    id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default_factory=uuid.uuid4)
+    name: Mapped[str] = mapped_column(default=None, nullable=True)
+    manager_id: Mapped[uuid.UUID] = mapped_column(default=None, nullable=True)
+    lastchange: Mapped[datetime.datetime] = mapped_column(default_factory=datetime.datetime.now)
+
+
+async def prepare_in_memory_sqllite(filename=":memory:", count=5):
+    asyncEngine = create_async_engine(f"sqlite+aiosqlite:///{filename}")
+    async with asyncEngine.begin() as conn:
+        await conn.run_sync(BModel.metadata.create_all)
+
+    async_session_maker = sessionmaker(asyncEngine, expire_on_commit=False, class_=AsyncSession)
+    async with async_session_maker() as session:
+        boss = UserModel(name="Boss")
+        session.add(boss)
+        session.add_all([UserModel(name=f"User {index}", manager_id=boss.id) for index in range(count - 1)])
+        await session.commit()
+    return async_session_maker
+
+
+@strawberry.federation.type(keys=["id"])
+class UserGQLModel:
+    id: uuid.UUID
+    name: typing.Optional[str] = None
+    lastchange: typing.Optional[datetime.datetime] = None
+    manager_id: typing.Optional[uuid.UUID] = None
+
+    @classmethod
+    def from_row(cls, row):
+        return None if row is None else cls(id=row.id, name=row.name, lastchange=row.lastchange, manager_id=row.manager_id)
+
+    @strawberry.field
+    async def manager(self, info: strawberry.types.Info) -> typing.Optional["UserGQLModel"]:
+        if self.manager_id is None:
+            return None
+        async with info.context["session_maker"]() as session:
+            return UserGQLModel.from_row(await session.get(UserModel, self.manager_id))
+
+
+@strawberry.type
+class UserGQLModelError:
+    msg: str
+
+
+@strawberry.type
+class UserGQLModelDeleteError:
+    msg: typing.Optional[str] = None
+    Entity: typing.Optional[UserGQLModel] = None
+
+
+@strawberry.input
+class UserInsertGQLModel:
+    name: str
+    id: typing.Optional[uuid.UUID] = None
+    manager_id: typing.Optional[uuid.UUID] = None
+
+
+@strawberry.input
+class UserUpdateGQLModel:
+    id: uuid.UUID
+    lastchange: datetime.datetime
+    name: typing.Optional[str] = None
+
+
+@strawberry.input
+class UserDeleteGQLModel:
+    id: uuid.UUID
+    lastchange: datetime.datetime
+
+
+@strawberry.type
+class Query:
+    @strawberry.field
+    async def user_by_id(self, info: strawberry.types.Info, id: uuid.UUID) -> typing.Optional[UserGQLModel]:
+        async with info.context["session_maker"]() as session:
+            return UserGQLModel.from_row(await session.get(UserModel, id))
+
+    @strawberry.field
+    async def user_page(self, info: strawberry.types.Info, skip: int = 0, limit: int = 10) -> typing.List[UserGQLModel]:
+        async with info.context["session_maker"]() as session:
+            rows = (await session.execute(select(UserModel).offset(skip).limit(limit))).scalars()
+            return [UserGQLModel.from_row(row) for row in rows]
+
+
+@strawberry.type
+class Mutation:
+    @strawberry.mutation
+    async def user_insert(self, info: strawberry.types.Info, user: UserInsertGQLModel) -> typing.Union[UserGQLModel, UserGQLModelError]:
+        async with info.context["session_maker"]() as session:
+            row = UserModel(id=user.id or uuid.uuid4(), name=user.name, manager_id=user.manager_id)
+            session.add(row)
+            await session.commit()
+            return UserGQLModel.from_row(row)
+
+    @strawberry.mutation
+    async def user_update(self, info: strawberry.types.Info, user: UserUpdateGQLModel) -> typing.Union[UserGQLModel, UserGQLModelError]:
+        async with info.context["session_maker"]() as session:
+            row = await session.get(UserModel, user.id)
+            if row is None or row.lastchange != user.lastchange:
+                return UserGQLModelError(msg="stale")
+            row.name = user.name
+            row.lastchange = datetime.datetime.now()
+            await session.commit()
+            return UserGQLModel.from_row(row)
+
+    @strawberry.mutation
+    async def user_delete(self, info: strawberry.types.Info, user: UserDeleteGQLModel) -> typing.Optional[UserGQLModelDeleteError]:
+        async with info.context["session_maker"]() as session:
+            row = await session.get(UserModel, user.id)
+            if row is None:
+                return UserGQLModelDeleteError(msg="not found")
+            await session.delete(row)
+            await session.commit()
+            return None
+
+
+schema = strawberry.federation.Schema(query=Query, mutation=Mutation, types=(UserGQLModelDeleteError,))
+
+
+async def create_executor(filename=":memory:"):
+    async_session_maker = await prepare_in_memory_sqllite(filename)
+    return local_executor(schema, lambda: {"session_maker": async_session_maker})
+
+
+@pytest.mark.asyncio
+async def test_workload_discovery_and_depth():
+    sdl_doc = await fetch_sdl(await create_executor())
+    assert get_cruds(sdl_doc)["UserGQLModel"].keys() >= {"read", "readp", "insert", "update", "delete"}
+
+    # hloubka 1 vybira vnoreny objekt jen jako {__typename id}, hloubka 2 ho rozbali
+    shallow = build_selection_depth(sdl_doc, "UserGQLModel", 1)
+    deep = build_selection_depth(sdl_doc, "UserGQLModel", 2)
+    assert "manager { __typename id }" in shallow
+    assert "manager { __typename id name" in deep
+    graphql.parse(f"query {{ userPage {deep} }}")
+
+    readonly = Workload(sdl_doc, depth=2)
+    assert {kind for kind, _ in readonly.keys} == {"readp", "read"}
+    mutating = Workload(sdl_doc, mutations=True)
+    assert {kind for kind, _ in mutating.keys} == {"readp", "read", "insert", "update", "delete"}
+
+    # stejny seed, stejna posloupnost operaci
+    first, second = Workload(sdl_doc, mutations=True, seed=3), Workload(sdl_doc, mutations=True, seed=3)
+    assert [first.choose() for _ in range(50)] == [second.choose() for _ in range(50)]
+
+
+@pytest.mark.asyncio
+async def test_run_workload_ranks_operations(tmp_path):
+    install_query_counter()
+    # soubezne session nad :memory: sdili jedno spojeni a michaji transakce
+    executor = await create_executor(tmp_path / "sdltest.sqlite")
+    sdl_doc = await fetch_sdl(executor)
+
+    workload = Workload(sdl_doc, depth=2, mutations=True, seed=1)
+    results = await run_workload(workload, executor, concurrency=4, requests=200)
+
+    byKind = {result["params"]["kind"]: result for result in results}
+    assert byKind.keys() >= {"readp", "read", "insert"}
+    assert sum(result["ops"] for result in results) <= 200
+    for result in results:
+        assert result["errors"] == 0, result
+        if result["ops"]:
+            assert result["p50"] <= result["p95"] <= result["p99"]
+            assert result["db_queries"] >= 1
+    # strankovani s hloubkou 2 dela dotaz za kazdeho managera
+    assert byKind["readp"]["db_queries"] > byKind["read"]["db_queries"]
+    assert [result["p95"] or 0 for result in results] == sorted((result["p95"] or 0 for result in results), reverse=True)
+    # insert plni seznam vlozenych entit, update a delete s nim pracuji
+    assert workload.created["UserGQLModel"] or byKind["delete"]["ops"]
+
+    output = tmp_path / "ranking.txt"
+    with open(output, "w") as f:
+        print_ranking(results, file=f)
+    assert "most DB queries" in output.read_text()
+    json.dumps(results)
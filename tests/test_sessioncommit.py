@@ -0,0 +1,470 @@
+import uuid
+import types
+import asyncio
+import typing
+
+import pytest
+import strawberry
+
+from sqlalchemy.orm import DeclarativeBase, MappedAsDataclass, Mapped, mapped_column
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+
+from uoishelpers.dataloaders.IDLoader import GlobalTTLCache
+from uoishelpers.dataloaders.LoaderMapBase import LoaderMapBase
+from uoishelpers.schema import SessionCommitExtension
+
+
+class BModel(MappedAsDataclass, DeclarativeBase):
+    pass
+
+
+class UserModel(BModel):
+    __tablename__ = 'users'
+
+    id: Mapped[uuid.UUID] = mapped_column(primary_key=True, default_factory=uuid.uuid4)
+    name: Mapped[str] = mapped_column(default=None, nullable=True)
+
+
+USER_ID = uuid.UUID("2d9dc5ca-a4a2-11ed-b9df-0242ac120003")
+
+
+async def prepare_in_memory_sqllite(filename=":memory:", name="John"):
+    asyncEngine = create_async_engine(f"sqlite+aiosqlite:///{filename}")
+    async with asyncEngine.begin() as conn:
+        await conn.run_sync(BModel.metadata.create_all)
+
+    async_session_maker = sessionmaker(
+        asyncEngine, expire_on_commit=False, class_=AsyncSession
+    )
+    async with async_session_maker() as session:
+        session.add(UserModel(id=USER_ID, name=name))
+        await session.commit()
+    return async_session_maker
+
+
+def create_schema(async_session_maker, loaders_factory, extension=SessionCommitExtension, **extension_kwargs):
+    @strawberry.type
+    class UserGQLModel:
+        id: strawberry.ID
+        name: typing.Optional[str]
+
+    @strawberry.type
+    class Query:
+        @strawberry.field
+        def hello(self) -> str:
+            return "world"
+
+        @strawberry.field
+        async def user(self, info: strawberry.types.Info, id: strawberry.ID) -> typing.Optional[UserGQLModel]:
+            row = await info.context["loaders"].get(UserModel).load(uuid.UUID(id))
+            return None if row is None else UserGQLModel(id=f"{row.id}", name=row.name)
+
+    @strawberry.type
+    class Mutation:
+        @strawberry.mutation
+        async def user_update(self, info: strawberry.types.Info, id: strawberry.ID, name: str, fail: bool = False, boom: bool = False) -> typing.Optional[UserGQLModel]:
+            loader = info.context["loaders"].get(UserModel)
+            row = await loader.update(types.SimpleNamespace(id=uuid.UUID(id), name=name))
+            if boom:
+                raise RuntimeError("boom")
+            if fail:
+                info.context["errors"].append({"msg": "failed", "code": "test", "_input": {}})
+            return UserGQLModel(id=f"{row.id}", name=row.name)
+
+        @strawberry.mutation
+        async def user(self, info: strawberry.types.Info, id: strawberry.ID) -> typing.Optional[UserGQLModel]:
+            row = await info.context["loaders"].get(UserModel).load(uuid.UUID(id))
+            return None if row is None else UserGQLModel(id=f"{row.id}", name=row.name)
+
+    async def session_maker_factory():
+        return async_session_maker
+
+    return strawberry.Schema(
+        query=Query,
+        mutation=Mutation,
+        extensions=[
+            lambda: extension(
+                session_maker_factory=session_maker_factory,
+                loaders_factory=loaders_factory,
+                **extension_kwargs
+            )
+        ],
+    )
+
+
+@pytest.mark.asyncio
+async def test_invalidation_after_commit():
+    async_session_maker = await prepare_in_memory_sqllite()
+    cache = GlobalTTLCache(ttl=20)
+    cache_key = f"UserModel:{USER_ID}"
+
+    def loaders_factory(session):
+        return {"loaders": LoaderMapBase[BModel](session, defer_invalidation=True, shared_cache=cache)}
+
+    schema = create_schema(async_session_maker, loaders_factory)
+    result = await schema.execute(f'{{ user(id: "{USER_ID}") {{ name }} }}', context_value={})
+    assert result.errors is None
+    assert await cache.get_many([cache_key]) == {cache_key: {"id": USER_ID, "name": "John"}}
+
+    # rollback = invalidace se zahodi
+    result = await schema.execute(f'mutation {{ userUpdate(id: "{USER_ID}", name: "Julia", fail: true) {{ name }} }}', context_value={})
+    assert result.errors is None
+    assert cache_key in await cache.get_many([cache_key])
+    async with async_session_maker() as session:
+        assert (await session.get(UserModel, USER_ID)).name == "John"
+
+    # commit = invalidace az po nem
+    result = await schema.execute(f'mutation {{ userUpdate(id: "{USER_ID}", name: "Julia") {{ name }} }}', context_value={})
+    assert result.errors is None
+    assert await cache.get_many([cache_key]) == {}
+
+    result = await schema.execute(f'{{ user(id: "{USER_ID}") {{ name }} }}', context_value={})
+    assert result.data == {"user": {"name": "Julia"}}
+
+
+@pytest.mark.asyncio
+async def test_deferred_invalidation_read_your_writes():
+    async_session_maker = await prepare_in_memory_sqllite()
+    cache = GlobalTTLCache(ttl=20)
+    cache_key = f"UserModel:{USER_ID}"
+
+    def loaders_factory(session):
+        return {"loaders": LoaderMapBase[BModel](session, defer_invalidation=True, shared_cache=cache)}
+
+    schema = create_schema(async_session_maker, loaders_factory)
+    result = await schema.execute(f'{{ user(id: "{USER_ID}") {{ name }} }}', context_value={})
+    assert cache_key in await cache.get_many([cache_key])
+
+    # cteni po zapisu ve stejne operaci nesmi vzit snapshot z globalni cache
+    result = await schema.execute(
+        f'mutation {{ u: userUpdate(id: "{USER_ID}", name: "Julia") {{ name }} r: user(id: "{USER_ID}") {{ name }} }}',
+        context_value={}
+    )
+    assert result.errors is None
+    assert result.data == {"u": {"name": "Julia"}, "r": {"name": "Julia"}}
+    assert await cache.get_many([cache_key]) == {}
+
+    # necommitovana data se do globalni cache nedostanou ani pri rollbacku
+    result = await schema.execute(
+        f'mutation {{ u: userUpdate(id: "{USER_ID}", name: "Jane", fail: true) {{ name }} r: user(id: "{USER_ID}") {{ name }} }}',
+        context_value={}
+    )
+    assert result.data == {"u": {"name": "Jane"}, "r": {"name": "Jane"}}
+    assert await cache.get_many([cache_key]) == {}
+    result = await schema.execute(f'{{ user(id: "{USER_ID}") {{ name }} }}', context_value={})
+    assert result.data == {"user": {"name": "Julia"}}
+
+
+@pytest.mark.asyncio
+async def test_read_replica_routing(tmp_path):
+    from uoishelpers.dataloaders.ReadRouter import ReadRouter
+
+    primary_maker = await prepare_in_memory_sqllite(tmp_path / "primary.sqlite")
+    replica_maker = await prepare_in_memory_sqllite(tmp_path / "replica.sqlite", name="John (replica)")
+
+    async def read_session_maker_factory():
+        return replica_maker
+
+    routers = []
+    def loaders_factory(session, read_session=None):
+        loaders = LoaderMapBase[BModel](session, read_session=read_session, shared_cache=None)
+        routers.append(loaders.read_router)
+        return {"loaders": loaders}
+
+    schema = create_schema(primary_maker, loaders_factory, read_session_maker_factory=read_session_maker_factory)
+
+    result = await schema.execute(f'{{ user(id: "{USER_ID}") {{ name }} }}', context_value={})
+    assert result.data == {"user": {"name": "John (replica)"}}
+    assert routers[-1].decisions == {"replica": 1}
+
+    # po zapisu cte mutace model z primarni DB
+    result = await schema.execute(
+        f'mutation {{ userUpdate(id: "{USER_ID}", name: "Julia") {{ name }} user(id: "{USER_ID}") {{ name }} }}',
+        context_value={}
+    )
+    assert result.errors is None
+    assert result.data == {"userUpdate": {"name": "Julia"}, "user": {"name": "Julia"}}
+    assert routers[-1].decisions == {"primary_written": 1}
+    assert ReadRouter.get_stats()["replica"] >= 1
+
+
+@pytest.mark.asyncio
+async def test_replica_reads_skip_global_cache(tmp_path):
+    primary_maker = await prepare_in_memory_sqllite(tmp_path / "primary.sqlite")
+    replica_maker = await prepare_in_memory_sqllite(tmp_path / "replica.sqlite", name="John (replica)")
+    cache = GlobalTTLCache(ttl=20)
+    cache_key = f"UserModel:{USER_ID}"
+
+    async def read_session_maker_factory():
+        return replica_maker
+
+    def loaders_factory(session, read_session=None):
+        return {"loaders": LoaderMapBase[BModel](session, read_session=read_session, shared_cache=cache)}
+
+    schema = create_schema(primary_maker, loaders_factory, read_session_maker_factory=read_session_maker_factory)
+
+    # snapshot z (mozna zpozdene) repliky se nesdili s ostatnimi requesty
+    result = await schema.execute(f'{{ user(id: "{USER_ID}") {{ name }} }}', context_value={})
+    assert result.data == {"user": {"name": "John (replica)"}}
+    assert await cache.get_many([cache_key]) == {}
+
+    # cteni z primarni DB se cachuje
+    async with primary_maker() as session:
+        loaders = LoaderMapBase[BModel](session, shared_cache=cache)
+        assert (await loaders.get(UserModel).load(USER_ID)).name == "John"
+    assert await cache.get_many([cache_key]) == {cache_key: {"id": USER_ID, "name": "John"}}
+
+
+@pytest.mark.asyncio
+async def test_db_timeout_keeps_session_usable(tmp_path):
+    import time
+    from sqlalchemy import event
+
+    async_session_maker = await prepare_in_memory_sqllite(tmp_path / "slow.sqlite")
+    engine = async_session_maker.kw["bind"].sync_engine
+    slow = {"on": False}
+
+    @event.listens_for(engine, "connect")
+    def connect(dbapi_connection, record):
+        dbapi_connection.create_function("pause", 1, lambda seconds: time.sleep(seconds) or 0)
+
+    @event.listens_for(engine, "before_cursor_execute", retval=True)
+    def slow_select(conn, cursor, statement, parameters, context, executemany):
+        # skutecne pomaly dotaz (sleep bezi ve vlakne aiosqlite), ne jen drzeny zamek
+        if slow["on"] and statement.startswith("SELECT") and "WHERE " in statement:
+            statement = statement.replace("WHERE ", "WHERE pause(0.2) = 0 AND ", 1)
+        return statement, parameters
+
+    # funkce pause se registruje jen na nova spojeni
+    await async_session_maker.kw["bind"].dispose()
+    cache = GlobalTTLCache(ttl=0.05, stale_ttl=60)
+
+    def loaders_factory(session):
+        return {"loaders": LoaderMapBase[BModel](session, shared_cache=cache, stale_if_error=True, db_timeout=0.05)}
+
+    schema = create_schema(async_session_maker, loaders_factory)
+    result = await schema.execute(f'{{ user(id: "{USER_ID}") {{ name }} }}', context_value={})
+    assert result.errors is None
+    await asyncio.sleep(0.1)
+
+    # dotaz trva dele nez db_timeout, nesmi se ale zrusit a rozbit session operace
+    slow["on"] = True
+    result = await schema.execute(
+        f'mutation {{ user(id: "{USER_ID}") {{ name }} userUpdate(id: "{USER_ID}", name: "Jane") {{ name }} }}',
+        context_value={}
+    )
+    slow["on"] = False
+    assert result.errors is None
+    assert result.data == {"user": {"name": "John"}, "userUpdate": {"name": "Jane"}}
+
+    async with async_session_maker() as session:
+        assert (await session.get(UserModel, USER_ID)).name == "Jane"
+
+
+@pytest.mark.asyncio
+async def test_lazy_session():
+    from uoishelpers.schema.LazySession import LazySession
+    from uoishelpers.schema.SessionCommitExtension import DB_LIMITER
+
+    async_session_maker = await prepare_in_memory_sqllite()
+    cache = GlobalTTLCache(ttl=20)
+
+    def loaders_factory(session):
+        return {"loaders": LoaderMapBase[BModel](session, shared_cache=cache)}
+
+    schema = create_schema(async_session_maker, loaders_factory)
+    in_flight = DB_LIMITER.in_flight
+
+    # operace bez DB nebere slot ani neotevira session
+    before = LazySession.totals["opened"]
+    result = await schema.execute('{ hello }', context_value={})
+    assert result.data == {"hello": "world"}
+    result = await schema.execute('{ __schema { queryType { name } } }', context_value={})
+    assert result.errors is None
+    assert LazySession.totals["opened"] == before
+
+    result = await schema.execute(f'{{ user(id: "{USER_ID}") {{ name }} }}', context_value={})
+    assert result.data == {"user": {"name": "John"}}
+    assert LazySession.totals["opened"] == before + 1
+
+    # odpoved z globalni cache uz DB nepotrebuje
+    result = await schema.execute(f'{{ user(id: "{USER_ID}") {{ name }} }}', context_value={})
+    assert result.data == {"user": {"name": "John"}}
+    assert LazySession.totals["opened"] == before + 1
+
+    result = await schema.execute(f'mutation {{ userUpdate(id: "{USER_ID}", name: "Julia") {{ name }} }}', context_value={})
+    assert result.errors is None
+    assert LazySession.totals["opened"] == before + 2
+    async with async_session_maker() as session:
+        assert (await session.get(UserModel, USER_ID)).name == "Julia"
+
+    assert DB_LIMITER.in_flight == in_flight
+
+
+@pytest.mark.asyncio
+async def test_adaptive_limiter():
+    from uoishelpers.schema import AdaptiveLimiter, DBOverloadedError
+
+    limiter = AdaptiveLimiter(initial_limit=2, max_limit=3, queue_timeout=0.05, max_queue=1, latency_floor=0, window=5)
+    await limiter.acquire()
+    await limiter.acquire()
+
+    # fronta s timeoutem
+    with pytest.raises(DBOverloadedError):
+        await limiter.acquire()
+    assert limiter.get_stats()["timeouts"] == 1
+
+    # plna fronta = okamzite odmitnuti
+    waiting = asyncio.create_task(limiter.acquire())
+    await asyncio.sleep(0)
+    assert limiter.queue_depth == 1
+    with pytest.raises(DBOverloadedError):
+        await limiter.acquire()
+    limiter.release()
+    await waiting
+    assert limiter.get_stats()["in_flight"] == 2
+    assert limiter.get_stats()["rejected"] == 2
+
+    # additive increase az po max_limit, multiplicative decrease pri rustu latence
+    for _ in range(10):
+        limiter.observe(0.01)
+    assert limiter.get_stats()["limit"] == 3
+    for _ in range(5):
+        limiter.observe(0.1)
+    assert limiter.get_stats()["limit"] == 2
+    assert limiter.get_stats()["decreases"] == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("adaptive", [False, True])
+async def test_limiter_slot_outside_loader_lock(adaptive):
+    from uoishelpers.schema import AdaptiveLimiter
+    from uoishelpers.schema.LazySession import LazySession
+
+    async_session_maker = await prepare_in_memory_sqllite()
+    limiter = AdaptiveLimiter(initial_limit=1, max_limit=1, queue_timeout=3) if adaptive else asyncio.Semaphore(1)
+
+    async def operation():
+        # vychozi procesove globalni zamek loaderu
+        session = LazySession(async_session_maker, limiter)
+        loader = LoaderMapBase[BModel](session, shared_cache=None).get(UserModel)
+        try:
+            assert (await loader.load(USER_ID)).name == "John"
+            await asyncio.sleep(0.05)
+            assert await loader.load(uuid.uuid4()) is None
+        finally:
+            await session.finish(commit=False)
+
+    # operace bez slotu nesmi cekat ve fronte limiteru se zamkem loaderu v ruce
+    start = asyncio.get_running_loop().time()
+    await asyncio.wait_for(asyncio.gather(operation(), operation()), timeout=1.0)
+    assert asyncio.get_running_loop().time() - start < 1.0
+
+
+@pytest.mark.asyncio
+async def test_db_semaphore_alias():
+    from uoishelpers.schema.SessionCommitExtension import DB_SEMAPHORE, DB_LIMITER
+    from uoishelpers.schema import AdaptiveLimiter
+
+    assert DB_SEMAPHORE is DB_LIMITER
+    in_flight = DB_SEMAPHORE.in_flight
+    async with DB_SEMAPHORE:
+        assert DB_SEMAPHORE.in_flight == in_flight + 1
+    assert DB_SEMAPHORE.in_flight == in_flight
+
+    limiter = AdaptiveLimiter(initial_limit=1)
+    assert not limiter.locked()
+    async with limiter:
+        assert limiter.locked()
+    assert not limiter.locked()
+
+
+def test_adaptive_limiter_mixed_costs():
+    import random
+    from uoishelpers.schema import AdaptiveLimiter
+
+    def simulate(latencies, limiter):
+        for latency in latencies:
+            limiter.observe(latency)
+        return limiter.get_stats()["limit"]
+
+    rng = random.Random(0)
+    # zdrava DB se smisenou zatezi (10 % dotazu 20 ms, resp. 20 % 50 ms) limit nesnizuje
+    for share, slow in ((0.1, 0.02), (0.2, 0.05)):
+        latencies = [slow if rng.random() < share else rng.uniform(0.001, 0.003) for _ in range(5000)]
+        assert simulate(latencies, AdaptiveLimiter(initial_limit=10, max_limit=20)) == 20
+
+    # trvaly rust latence (pretizeni) limit snizi
+    limiter = AdaptiveLimiter(initial_limit=10, max_limit=20)
+    simulate([rng.uniform(0.001, 0.003) for _ in range(500)], limiter)
+    assert simulate([rng.uniform(0.02, 0.04) for _ in range(500)], limiter) < 10
+
+
+@pytest.mark.asyncio
+async def test_db_overload_is_graphql_error():
+    from uoishelpers.schema import AdaptiveLimiter
+
+    async_session_maker = await prepare_in_memory_sqllite()
+    limiter = AdaptiveLimiter(initial_limit=1, queue_timeout=0.05)
+
+    def loaders_factory(session):
+        return {"loaders": LoaderMapBase[BModel](session, shared_cache=None)}
+
+    schema = create_schema(async_session_maker, loaders_factory, db_limiter=limiter)
+    await limiter.acquire()
+    result = await schema.execute(f'{{ user(id: "{USER_ID}") {{ name }} hello }}', context_value={})
+    assert result.data == {"user": None, "hello": "world"}
+    assert result.errors[0].extensions == {"code": "DB_OVERLOADED"}
+    limiter.release()
+
+    result = await schema.execute(f'{{ user(id: "{USER_ID}") {{ name }} }}', context_value={})
+    assert result.data == {"user": {"name": "John"}}
+    assert limiter.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_mutation_savepoints():
+    from uoishelpers.schema import SavepointSessionCommitExtension
+
+    async_session_maker = await prepare_in_memory_sqllite()
+
+    def loaders_factory(session):
+        return {"loaders": LoaderMapBase[BModel](session, shared_cache=None)}
+
+    async def name_in_db():
+        async with async_session_maker() as session:
+            return (await session.get(UserModel, USER_ID)).name
+
+    schema = create_schema(async_session_maker, loaders_factory, extension=SavepointSessionCommitExtension)
+    result = await schema.execute(
+        f'''mutation {{
+            a: userUpdate(id: "{USER_ID}", name: "A") {{ name }}
+            b: userUpdate(id: "{USER_ID}", name: "B", fail: true) {{ name }}
+            c: userUpdate(id: "{USER_ID}", name: "C", boom: true) {{ name }}
+        }}''',
+        context_value={}
+    )
+    assert result.data == {"a": {"name": "A"}, "b": {"name": "B"}, "c": None}
+    assert [error.message for error in result.errors] == ["boom"]
+    # b a c vraceny jen ve svych savepointech, a je commitnuto
+    assert await name_in_db() == "A"
+
+    # bez savepointu vraci chyba celou operaci
+    schema = create_schema(async_session_maker, loaders_factory)
+    result = await schema.execute(
+        f'''mutation {{
+            a: userUpdate(id: "{USER_ID}", name: "D") {{ name }}
+            b: userUpdate(id: "{USER_ID}", name: "E", fail: true) {{ name }}
+        }}''',
+        context_value={}
+    )
+    assert await name_in_db() == "A"
+
+    # vnorena pole a query zustavaji synchronni (zadny coroutine navic na kazde pole)
+    from graphql import OperationType
+    extension = SavepointSessionCommitExtension(session_maker_factory=None, loaders_factory=loaders_factory)
+    nested = types.SimpleNamespace(path=types.SimpleNamespace(prev=object()), operation=types.SimpleNamespace(operation=OperationType.MUTATION))
+    query = types.SimpleNamespace(path=types.SimpleNamespace(prev=None), operation=types.SimpleNamespace(operation=OperationType.QUERY))
+    assert extension.resolve(lambda root, info: "value", None, nested) == "value"
+    assert extension.resolve(lambda root, info: "value", None, query) == "value"
@@ -0,0 +1,109 @@
+"""Minimalní RESP2 server pro testy GlobalTTLCache.
+
+Umí GET, MGET, SET (EX), DEL, PING, ostatní příkazy potvrdí `+OK`.
+`delay` zpoždí každou odpověď (simulace pomalého / pozastaveného uzlu),
+`set_delay` pozdrží provedení SET (zápis doběhne až po příkazech z jiných spojení),
+`commands` a `roundtrips` počítají provoz.
+"""
+import asyncio
+import time
+
+
+class ValkeyStandIn:
+    def __init__(self, delay: float = 0.0, set_delay: float = 0.0):
+        self.delay = delay
+        self.set_delay = set_delay
+        self.data = {}
+        self.commands = []
+        self.roundtrips = 0
+        self._server = None
+
+    @property
+    def url(self):
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"redis://{host}:{port}/0"
+
+    async def __aenter__(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        return self
+
+    async def __aexit__(self, *exc):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _read_command(self, reader):
+        line = await reader.readline()
+        if not line:
+            return None
+        assert line[:1] == b"*", line
+        count = int(line[1:-2])
+        args = []
+        for _ in range(count):
+            header = await reader.readline()
+            size = int(header[1:-2])
+            args.append((await reader.readexactly(size + 2))[:-2])
+        return args
+
+    def _encode(self, value):
+        if value is None:
+            return b"$-1\r\n"
+        if isinstance(value, int):
+            return b":%d\r\n" % value
+        if isinstance(value, list):
+            return b"*%d\r\n" % len(value) + b"".join(self._encode(v) for v in value)
+        if isinstance(value, str):
+            return b"+%s\r\n" % value.encode()
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+
+    def _get(self, key):
+        item = self.data.get(key)
+        if item is None:
+            return None
+        value, exp = item
+        if exp is not None and exp <= time.time():
+            self.data.pop(key, None)
+            return None
+        return value
+
+    def _execute(self, args):
+        name = args[0].upper().decode()
+        self.commands.append(name)
+        if name == "GET":
+            return self._get(args[1])
+        if name == "MGET":
+            return [self._get(k) for k in args[1:]]
+        if name == "SET":
+            exp = None
+            opts = [a.upper() for a in args[3:]]
+            if b"EX" in opts:
+                exp = time.time() + int(args[3 + opts.index(b"EX") + 1])
+            self.data[args[1]] = (args[2], exp)
+            return "OK"
+        if name == "DEL":
+            return sum(1 for k in args[1:] if self.data.pop(k, None) is not None)
+        if name == "PING":
+            return "PONG"
+        return "OK"
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                args = await self._read_command(reader)
+                if args is None:
+                    break
+                batch = [args]
+                # pipeline: vsechny prikazy, ktere uz dorazily, jsou jeden round trip
+                while reader._buffer:
+                    batch.append(await self._read_command(reader))
+                if self.set_delay and any(args[0].upper() == b"SET" for args in batch):
+                    await asyncio.sleep(self.set_delay)
+                replies = [self._execute(args) for args in batch]
+                self.roundtrips += 1
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                writer.write(b"".join(self._encode(r) for r in replies))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            pass
+        finally:
+            writer.close()
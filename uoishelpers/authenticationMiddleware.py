@@ -7,21 +7,140 @@ from starlette.middleware.authentication import AuthenticationMiddleware
 import aiohttp
 import jwt
 import json
+import time
+import asyncio
+import hashlib
 import logging
+import collections
+
+try:
+    import valkey.asyncio as valkey
+except ImportError:
+    valkey = None
 
 JWTPUBLICKEY = "http://localhost:8000/oauth/publickey"
 JWTRESOLVEUSERPATH = "http://localhost:8000/oauth/userinfo"
 
+
+class TokenCache:
+    """Cache vysledku overeni JWT (dekodovane claims a userinfo z autority).
+
+    Klic je sha256 tokenu, zaznam plati do `exp` tokenu, nejdele `max_ttl` sekund.
+    Cachuji se jen uspesne overene tokeny. In-memory vrstva drzi nejvyse `maxsize`
+    zaznamu (LRU), `maxsize=0` cache vypne. Volitelna Valkey vrstva (`connection_string`)
+    sdili zaznamy mezi workery, klice v ni obsahuji otisk verejneho klice, takze po
+    rotaci klice stare zaznamy nejsou dosazitelne a vyprsi samy.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 10_000,
+        max_ttl: float = 300.0,
+        *,
+        connection_string: str = None,
+        prefix: str = "jwtCache:",
+        timeout: float = 0.1,
+    ):
+        self.maxsize = maxsize
+        self.max_ttl = max_ttl
+        self.prefix = prefix
+        self.timeout = timeout
+        self._data = collections.OrderedDict()  # (otisk klice, hash tokenu) -> (expires_at, value)
+        self._stats = {"hits": 0, "misses": 0, "valkey_hits": 0, "evictions": 0, "clears": 0, "errors": 0}
+        self._use_valkey = connection_string is not None and valkey is not None and maxsize > 0
+        self._client = valkey.from_url(connection_string, decode_responses=True) if self._use_valkey else None
+
+    @staticmethod
+    def _key(token: str, publickey: bytes):
+        return hashlib.sha256(publickey).hexdigest()[:16], hashlib.sha256(token.encode()).hexdigest()
+
+    async def get(self, token: str, publickey: bytes):
+        """Vraci {"claims": ..., "userinfo": ...} nebo None."""
+        if self.maxsize <= 0:
+            return None
+        key = self._key(token, publickey)
+        item = self._data.get(key, None)
+        now = time.time()
+        if item is not None:
+            expires_at, value = item
+            if expires_at > now:
+                self._data.move_to_end(key)
+                self._stats["hits"] += 1
+                return value
+            self._data.pop(key, None)
+
+        if self._use_valkey:
+            try:
+                raw = await asyncio.wait_for(self._client.get(f"{self.prefix}{key[0]}:{key[1]}"), self.timeout)
+            except Exception as e:
+                logging.debug(f"TokenCache valkey get failed {e}")
+                self._stats["errors"] += 1
+                raw = None
+            if raw is not None:
+                value = json.loads(raw)
+                expires_at = self._expires_at(value["claims"], now)
+                if expires_at > now:
+                    self._store(key, expires_at, value)
+                    self._stats["valkey_hits"] += 1
+                    return value
+
+        self._stats["misses"] += 1
+        return None
+
+    async def set(self, token: str, publickey: bytes, claims: dict, userinfo: dict) -> None:
+        if self.maxsize <= 0:
+            return
+        now = time.time()
+        expires_at = self._expires_at(claims, now)
+        if expires_at <= now:
+            return
+        key = self._key(token, publickey)
+        value = {"claims": claims, "userinfo": userinfo}
+        self._store(key, expires_at, value)
+
+        if self._use_valkey:
+            try:
+                await asyncio.wait_for(
+                    self._client.set(f"{self.prefix}{key[0]}:{key[1]}", json.dumps(value), ex=max(1, int(expires_at - now))),
+                    self.timeout
+                )
+            except Exception as e:
+                logging.debug(f"TokenCache valkey set failed {e}")
+                self._stats["errors"] += 1
+
+    def clear(self) -> None:
+        """Zahodi in-memory zaznamy (volano pri rotaci verejneho klice)."""
+        self._data.clear()
+        self._stats["clears"] += 1
+
+    def get_stats(self) -> dict:
+        return {**self._stats, "backend": "valkey" if self._use_valkey else "memory", "entries": len(self._data)}
+
+    def _expires_at(self, claims, now):
+        exp = claims.get("exp", None)
+        expires_at = now + self.max_ttl
+        return expires_at if exp is None else min(expires_at, float(exp))
+
+    def _store(self, key, expires_at, value):
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self._stats["evictions"] += 1
+
+
 class BasicAuthBackend(AuthenticationBackend):
     def __init__(self, 
         JWTPUBLICKEY = JWTPUBLICKEY,
-        JWTRESOLVEUSERPATH = JWTRESOLVEUSERPATH
+        JWTRESOLVEUSERPATH = JWTRESOLVEUSERPATH,
+        tokenCache: TokenCache = None
         ) -> None:
 
         # super().__init__()
         self.publickey = None
         self.JWTPUBLICKEY = JWTPUBLICKEY
         self.JWTRESOLVEUSERPATH = JWTRESOLVEUSERPATH
+        self.tokenCache = TokenCache() if tokenCache is None else tokenCache
 
     async def getPublicKey(self):
         async with aiohttp.ClientSession() as session:
@@ -32,9 +151,12 @@ class BasicAuthBackend(AuthenticationBackend):
 
                 # publickey = await resp.read()
                 publickey = await resp.text()
-        self.publickey = publickey.replace('"', '').replace('\\n', '\n')
-        print('got key', self.publickey)
-        self.publickey = self.publickey.encode()
+        publickey = publickey.replace('"', '').replace('\\n', '\n').encode()
+        print('got key', publickey)
+        if self.publickey is not None and self.publickey != publickey:
+            # rotace klice, overene tokeny stareho klice uz neplati
+            self.tokenCache.clear()
+        self.publickey = publickey
         return self.publickey
 
     async def authenticate(self, conn):
@@ -69,6 +191,11 @@ class BasicAuthBackend(AuthenticationBackend):
         publickey = self.publickey
         if publickey is None:
             publickey = await self.getPublicKey()
+
+        # 2A. token uz byl overen (a uzivatel dohledan)
+        cached = await self.tokenCache.get(jwtsource, publickey)
+        if cached is not None:
+            return AuthCredentials(["authenticated"]), cached["userinfo"]
         
         # 3. overit jwt (lokalne)
         for i in range(2):
@@ -107,7 +234,8 @@ class BasicAuthBackend(AuthenticationBackend):
 
         if user_id is None:
             raise AuthenticationError(f"Unknown user")
-            
+
+        await self.tokenCache.set(jwtsource, self.publickey, jwtdecoded, userinfo)
         print("# SUCCESS #######################################")
         return AuthCredentials(["authenticated"]), userinfo
     
@@ -149,15 +277,18 @@ def createAuthentizationSentinel(
         queriesWOAuthentization = [apolloQuery, graphiQLQuery, vsCodeQuery],
         JWTPUBLICKEY = JWTPUBLICKEYURL,
         JWTRESOLVEUSERPATH = JWTRESOLVEUSERPATHURL,
-        onAuthenticationError = lambda item: JSONResponse(f"{item} unauthorized")
+        onAuthenticationError = lambda item: JSONResponse(f"{item} unauthorized"),
+        tokenCache: TokenCache = None
 ):
     class Sentinel:
         def __init__(self,
             JWTPUBLICKEY = JWTPUBLICKEY,
-            JWTRESOLVEUSERPATH = JWTRESOLVEUSERPATH):
+            JWTRESOLVEUSERPATH = JWTRESOLVEUSERPATH,
+            tokenCache = tokenCache):
             self.JWTPUBLICKEY = JWTPUBLICKEY
             self.JWTRESOLVEUSERPATH = JWTRESOLVEUSERPATH
             self.publickey = None
+            self.tokenCache = TokenCache() if tokenCache is None else tokenCache
 
         async def __call__(self, request: Request, item: Item) -> Any:
             try:
@@ -183,9 +314,12 @@ def createAuthentizationSentinel(
                     # publickey = await resp.read()
                     publickey = await resp.text()
                     logging.debug(f"Sentinel has got public key \n {publickey}")
-            self.publickey = publickey.replace('"', '').replace('\\n', '\n')
-            print('got key', self.publickey)
-            self.publickey = self.publickey.encode()
+            publickey = publickey.replace('"', '').replace('\\n', '\n').encode()
+            print('got key', publickey)
+            if self.publickey is not None and self.publickey != publickey:
+                # rotace klice, overene tokeny stareho klice uz neplati
+                self.tokenCache.clear()
+            self.publickey = publickey
             return self.publickey
 
         async def authenticate(self, request: Request):
@@ -228,6 +362,12 @@ def createAuthentizationSentinel(
             logging.debug(f'have public key')
             print(f'have public key')
 
+            # 2A. token uz byl overen (a uzivatel dohledan)
+            cached = await self.tokenCache.get(jwtsource, publickey)
+            if cached is not None:
+                request.scope["user"] = {"id": cached["userinfo"]["id"]}
+                return None
+
             # 3. overit jwt (lokalne)
             for i in range(2):
                 try:
@@ -252,6 +392,7 @@ def createAuthentizationSentinel(
             logging.debug("3A. pokud jwt obsahuje user.id, vzit jej primo")
             user_id = jwtdecoded.get("user_id", None)
             print("some user?", user_id)
+            userinfo = {"id": user_id}
 
             # 4. pouzit jwt jako parametr pro identifikaci uzivatele u autority
             if user_id is None:
@@ -280,5 +421,6 @@ def createAuthentizationSentinel(
             print("# SUCCESS #######################################")
             if user_id is None:
                 raise AuthenticationError(f"Unknown user")
+            await self.tokenCache.set(jwtsource, self.publickey, jwtdecoded, userinfo)
             return None
     return Sentinel()
\ No newline at end of file
@@ -1,2 +1,495 @@
-def sdltest():
-    pass
\ No newline at end of file
+"""Zatezovy test odvozeny ze SDL.
+
+Z `_service { sdl }` (nebo souboru) se pres `get_cruds` zjisti page, scalar, insert,
+update a delete operace vsech typu. Z nich se sestavi vazeny, opakovatelny (`--seed`)
+workload: cteni s nastavitelnou hloubkou vnoreni (`--depth`) a mutace se vstupy
+odvozenymi z nactenych entit (mutuji se jen entity vlozene behem behu).
+Workload se pousti proti lokalnimu schematu (`--schema modul:schema`) nebo HTTP
+endpointu (`--url`) a operace se seradi podle latence a poctu DB dotazu
+(pocet dotazu jen pro lokalni schema, pocita se pres SQLAlchemy event).
+
+    sdltest --schema main:schema --depth 2 --requests 2000 --concurrency 16
+    sdltest --url http://localhost:8000/gql --token <jwt> --mutations --output sdltest.json
+"""
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+import datetime
+import importlib
+import contextvars
+import collections
+
+import graphql
+from graphql.language import (
+    DocumentNode,
+    ObjectTypeDefinitionNode,
+    InputObjectTypeDefinitionNode,
+    UnionTypeDefinitionNode,
+    EnumTypeDefinitionNode,
+    NonNullTypeNode,
+)
+
+from .utils_sdl_2 import (
+    sdlQuery,
+    get_cruds,
+    get_scalar_names,
+    unwrap_type,
+    build_query_page,
+    build_query_scalar,
+    build_expanded_mutation,
+    build_input_type_params_list,
+)
+
+DEFAULT_WEIGHTS = {"readp": 4, "read": 8, "insert": 1, "update": 1, "delete": 1}
+
+# pocitadlo DB dotazu aktualni operace (asyncio task dedi kontext)
+_query_counter = contextvars.ContextVar("sdltest_query_counter", default=None)
+_listening = False
+
+
+def _count_queries(*args, **kwargs):
+    counter = _query_counter.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+def install_query_counter():
+    """Zaregistruje globalni SQLAlchemy listener, ktery pocita dotazy po operacich."""
+    global _listening
+    if _listening:
+        return
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    event.listen(Engine, "before_cursor_execute", _count_queries)
+    _listening = True
+
+
+# ========================
+# Sestaveni dotazu
+# ========================
+
+def _definitions(sdl_doc, kind):
+    return {d.name.value: d for d in sdl_doc.definitions if isinstance(d, kind)}
+
+
+def build_selection_depth(sdl_doc: DocumentNode, type_name: str, depth: int) -> str:
+    """Selection set pro typ `type_name` vnoreny do hloubky `depth`.
+    Pole s povinnymi argumenty se vynechavaji, v posledni urovni se objekty
+    vybiraji jen jako `{ __typename id }` (jako `build_selection_optional`)."""
+    objects = _definitions(sdl_doc, ObjectTypeDefinitionNode)
+    unions = _definitions(sdl_doc, UnionTypeDefinitionNode)
+    leaves = get_scalar_names(sdl_doc) | set(_definitions(sdl_doc, EnumTypeDefinitionNode))
+
+    def selection(name, level):
+        type_def = objects.get(name, None)
+        if type_def is None:
+            return "{ __typename }" if name in unions else ""
+        parts = ["__typename"]
+        for field in type_def.fields or []:
+            if field.name.value.startswith("__"):
+                continue
+            if any(isinstance(arg.type, NonNullTypeNode) for arg in (field.arguments or [])):
+                continue
+            base = unwrap_type(field.type).name.value
+            if base in leaves:
+                parts.append(field.name.value)
+            elif base in unions:
+                parts.append(f"{field.name.value} {{ __typename }}")
+            elif base in objects:
+                if level >= depth:
+                    if any(f.name.value == "id" for f in objects[base].fields or []):
+                        parts.append(f"{field.name.value} {{ __typename id }}")
+                else:
+                    parts.append(f"{field.name.value} {selection(base, level + 1)}")
+        return f"{{ {' '.join(parts)} }}"
+
+    return selection(type_name, 1)
+
+
+def build_read_queries(sdl_doc: DocumentNode, type_name: str, ops: dict, depth: int = 1):
+    """Vraci {"readp": query, "read": query} pro typ, pri depth 1 beze zmeny oproti utils_sdl_2."""
+    result = {}
+    page_op = (ops.get("readp", None) or [None])[0]
+    read_op = (ops.get("read", None) or [None])[0]
+    if depth <= 1:
+        if page_op is not None:
+            result["readp"] = (page_op, build_query_page(sdl_doc, page_op))
+        if read_op is not None:
+            result["read"] = (read_op, build_query_scalar(sdl_doc, read_op))
+        return result
+    selection = build_selection_depth(sdl_doc, type_name, depth)
+    if page_op is not None:
+        result["readp"] = (page_op, f"query {page_op} {{ {page_op}{selection} }}")
+    if read_op is not None:
+        result["read"] = (read_op, f"query {read_op}Read($id: UUID!) {{ {read_op}(id: $id){selection} }}")
+    return result
+
+
+def _mutation_input(sdl_doc: DocumentNode, mutation_name: str):
+    """Definice vstupniho INPUT_OBJECT mutace (jediny argument)."""
+    mutation_def = _definitions(sdl_doc, ObjectTypeDefinitionNode).get("Mutation", None)
+    field = next((f for f in (mutation_def.fields or []) if f.name.value == mutation_name), None) if mutation_def else None
+    if field is None or len(field.arguments or []) != 1:
+        return None
+    return _definitions(sdl_doc, InputObjectTypeDefinitionNode).get(unwrap_type(field.arguments[0].type).name.value, None)
+
+
+def _generate_value(rng, type_str, name, enums):
+    base = type_str.strip("[]!")
+    if base in enums:
+        return rng.choice(enums[base])
+    if base in ("UUID", "ID"):
+        return f"{uuid.UUID(int=rng.getrandbits(128), version=4)}"
+    if base == "Int":
+        return rng.randint(0, 100)
+    if base == "Float":
+        return round(rng.uniform(0, 100), 3)
+    if base == "Boolean":
+        return rng.random() < 0.8
+    if base in ("DateTime", "Date"):
+        value = datetime.datetime(2025, 1, 1) + datetime.timedelta(days=rng.randint(0, 365))
+        return value.isoformat() if base == "DateTime" else value.date().isoformat()
+    return f"{name} {rng.getrandbits(32):08x}"
+
+
+def generate_insert_variables(sdl_doc: DocumentNode, mutation_name: str, template: dict, rng) -> dict:
+    """Promenne insert mutace: hodnoty sdilenych poli z `template` (existujici entita,
+    zachova platne cizi klice), ostatni povinna pole generovana podle typu, nove `id`."""
+    enums = {name: [v.name.value for v in d.values or []] for name, d in _definitions(sdl_doc, EnumTypeDefinitionNode).items()}
+    input_def = _mutation_input(sdl_doc, mutation_name)
+    params = build_input_type_params_list(sdl_doc, input_def.name.value) if input_def else {}
+    variables = {}
+    for name, type_str in (params or {}).items():
+        if name == "lastchange":
+            continue
+        if name == "id":
+            variables[name] = f"{uuid.UUID(int=rng.getrandbits(128), version=4)}"
+        elif template.get(name, None) is not None and not isinstance(template[name], (dict, list)):
+            value = template[name]
+            # retezce se odlisi, aby se nevkladaly duplicity
+            variables[name] = f"{value} {rng.getrandbits(16):04x}" if type_str.strip("!") == "String" else value
+        elif type_str.endswith("!"):
+            variables[name] = _generate_value(rng, type_str, name, enums)
+    return variables
+
+
+def _update_field(sdl_doc: DocumentNode, mutation_name: str, entity: dict):
+    """Pole, ktere update mutace meni (prvni nepovinny String, ktery entita vraci)."""
+    input_def = _mutation_input(sdl_doc, mutation_name)
+    params = build_input_type_params_list(sdl_doc, input_def.name.value) if input_def else {}
+    for name, type_str in (params or {}).items():
+        if name not in ("id", "lastchange") and type_str.strip("!") == "String" and name in entity:
+            return name
+    return None
+
+
+# ========================
+# Workload
+# ========================
+
+class Workload:
+    """Vazeny, opakovatelny workload nad operacemi z `get_cruds`.
+
+    Operace jsou dvojice (kind, typename), kind je readp, read, insert, update nebo delete.
+    Vaha druhu (`weights`) se deli mezi typy. Vysledky cteni plni zasobnik entit
+    (sablony pro insert, id pro read), insert plni seznam vlozenych entit, ktere pak
+    update a delete pouzivaji (po dobu operace je entita ze seznamu vyjmuta, neuspesny
+    update ji zahodi). Operace, ktera zatim nema data (read bez id, update bez
+    vlozene entity), se preskoci a zapocita jako `skipped`.
+    """
+
+    def __init__(self, sdl_doc: DocumentNode, depth: int = 1, weights=None, mutations: bool = False, seed: int = 0, types=None):
+        self.sdl_doc = sdl_doc
+        self.depth = depth
+        self.rng = random.Random(seed)
+        self.entities = collections.defaultdict(list)  # typename -> entity dicts z cteni
+        self.created = collections.defaultdict(list)   # typename -> entity vlozene timto behem
+        self.deleted = set()                           # id smazanych entit
+        weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        if not mutations:
+            weights = {kind: weight for kind, weight in weights.items() if kind in ("readp", "read")}
+
+        self.operations = {}
+        cruds = get_cruds(sdl_doc)
+        for typename, ops in cruds.items():
+            if types and typename not in types:
+                continue
+            if "readp" not in ops:
+                # bez strankovaciho dotazu nejsou data pro ostatni operace
+                continue
+            for kind, (name, query) in build_read_queries(sdl_doc, typename, ops, depth).items():
+                if query:
+                    self.operations[(kind, typename)] = {"name": name, "query": query}
+            for kind in ("insert", "update", "delete"):
+                if kind in weights and ops.get(kind, None):
+                    name = ops[kind][0]
+                    query = build_expanded_mutation(sdl_doc, name)
+                    if query:
+                        self.operations[(kind, typename)] = {"name": name, "query": query}
+
+        per_kind = collections.Counter(kind for kind, _ in self.operations)
+        self.keys = [key for key in self.operations if weights.get(key[0], 0) > 0]
+        self.weights = [weights[kind] / per_kind[kind] for kind, _ in self.keys]
+
+    def choose(self):
+        return self.rng.choices(self.keys, self.weights)[0]
+
+    def prepare(self, key):
+        """Vraci (query, variables) nebo None, pokud operace zatim nema data."""
+        kind, typename = key
+        operation = self.operations[key]
+        if kind == "readp":
+            return operation["query"], {}
+        if kind == "read":
+            pool = self.entities[typename]
+            if not pool:
+                return None
+            return operation["query"], {"id": self.rng.choice(pool)["id"]}
+        if kind == "insert":
+            pool = self.entities[typename]
+            template = self.rng.choice(pool) if pool else {}
+            return operation["query"], generate_insert_variables(self.sdl_doc, operation["name"], template, self.rng)
+        pool = self.created[typename]
+        if not pool:
+            return None
+        # entita se ze seznamu vyjme, aby ji soubezne nemenily dve operace (lastchange)
+        entity = pool.pop(self.rng.randrange(len(pool)))
+        if kind == "delete":
+            self.deleted.add(entity["id"])
+            self.entities[typename] = [item for item in self.entities[typename] if item["id"] != entity["id"]]
+            return operation["query"], {"id": entity["id"], "lastchange": entity["lastchange"]}
+        variables = {"id": entity["id"], "lastchange": entity["lastchange"]}
+        field = _update_field(self.sdl_doc, operation["name"], entity)
+        if field is not None:
+            variables[field] = f"{entity[field]} {self.rng.getrandbits(16):04x}"
+        return operation["query"], variables
+
+    def record(self, key, variables, result):
+        """Zpracuje odpoved, vraci True pri uspechu."""
+        kind, typename = key
+        if not result or result.get("errors", None) or result.get("data", None) is None:
+            return False
+        value = result["data"].get(self.operations[key]["name"], None)
+        if kind == "readp":
+            if isinstance(value, list):
+                entities = [item for item in value if isinstance(item, dict) and "id" in item and item["id"] not in self.deleted]
+                self.entities[typename] = entities or self.entities[typename]
+            return True
+        if kind == "read":
+            # id mohlo byt mezitim smazano soubeznym delete
+            return value is not None or variables["id"] in self.deleted
+        if kind == "delete":
+            # uspesny delete vraci None (viz test_delete)
+            return value is None
+        if not isinstance(value, dict) or "Error" in f"{value.get('__typename', '')}":
+            return False
+        # insert i update vraci entitu s novym lastchange, ktera se vraci do seznamu
+        if "id" in value and "lastchange" in value:
+            self.created[typename].append(value)
+        return True
+
+
+# ========================
+# Spousteni
+# ========================
+
+def local_executor(schema, context_getter=None):
+    """Executor nad strawberry schematem, `context_getter` je (async) funkce vracejici context."""
+    async def executor(query, variable_values=None):
+        context = {}
+        if context_getter is not None:
+            context = context_getter()
+            if asyncio.iscoroutine(context):
+                context = await context
+        result = await schema.execute(query=query, variable_values=variable_values, context_value=context)
+        response = {"data": result.data}
+        if result.errors:
+            response["errors"] = [{"msg": error.message, "path": error.path} for error in result.errors]
+        return response
+    return executor
+
+
+def http_executor(session, url, token=None):
+    """Executor nad HTTP endpointem (aiohttp session), `token` jde do cookie i hlavicky."""
+    headers = {} if token is None else {"Authorization": f"Bearer {token}"}
+    cookies = {} if token is None else {"authorization": token}
+
+    async def executor(query, variable_values=None):
+        payload = {"query": query, "variables": variable_values or {}}
+        async with session.post(url, json=payload, headers=headers, cookies=cookies) as response:
+            if response.status != 200:
+                return {"data": None, "errors": [{"msg": f"HTTP {response.status}"}]}
+            return await response.json()
+    return executor
+
+
+async def fetch_sdl(executor) -> DocumentNode:
+    result = await executor(query=sdlQuery, variable_values={})
+    assert not result.get("errors", None), f"cannot read sdl {result.get('errors')}"
+    return graphql.parse(result["data"]["_service"]["sdl"])
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, int(round(fraction * len(values) + 0.5)) - 1))]
+
+
+async def run_workload(workload: Workload, executor, concurrency: int = 8, requests: int = 1000, duration: float = None, warmup: bool = True):
+    """Spusti workload, vraci seznam statistik po operacich serazeny podle p95 latence.
+
+    `warmup` nejdriv jednou (sekvencne) zavola kazdy strankovaci dotaz a insert,
+    aby ostatni operace mely data. Warm-up se nemeri."""
+    samples = collections.defaultdict(list)  # key -> [(latency, ok, queries)]
+    skipped = collections.Counter()
+
+    async def call(key):
+        prepared = workload.prepare(key)
+        if prepared is None:
+            skipped[key] += 1
+            return None
+        query, variables = prepared
+        counter = [0]
+        token = _query_counter.set(counter)
+        start = time.perf_counter()
+        try:
+            result = await executor(query=query, variable_values=variables)
+        except Exception as e:
+            result = {"data": None, "errors": [{"msg": f"{e}"}]}
+        finally:
+            _query_counter.reset(token)
+        latency = time.perf_counter() - start
+        return latency, workload.record(key, variables, result), counter[0]
+
+    if warmup:
+        for kind in ("readp", "insert"):
+            for key in [key for key in workload.keys if key[0] == kind]:
+                await call(key)
+        skipped.clear()
+
+    remaining = [requests]
+    deadline = None if duration is None else time.perf_counter() + duration
+
+    async def worker():
+        while True:
+            if deadline is not None:
+                if time.perf_counter() >= deadline:
+                    return
+            elif remaining[0] <= 0:
+                return
+            else:
+                remaining[0] -= 1
+            key = workload.choose()
+            sample = await call(key)
+            if sample is not None:
+                samples[key].append(sample)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    seconds = time.perf_counter() - start
+
+    results = []
+    for key in set(samples) | set(skipped):
+        items = samples.get(key, [])
+        latencies = sorted(latency for latency, _, _ in items)
+        queries = [count for _, _, count in items]
+        results.append({
+            "name": "sdltest",
+            "params": {"kind": key[0], "type": key[1], "operation": workload.operations[key]["name"], "depth": workload.depth},
+            "ops": len(items),
+            "errors": sum(1 for _, ok, _ in items if not ok),
+            "skipped": skipped[key],
+            "seconds": seconds,
+            "ops_per_second": len(items) / seconds if seconds > 0 else 0.0,
+            "p50": _percentile(latencies, 0.50),
+            "p95": _percentile(latencies, 0.95),
+            "p99": _percentile(latencies, 0.99),
+            "db_queries": sum(queries) / len(queries) if queries else None,
+        })
+    results.sort(key=lambda item: -(item["p95"] or 0.0))
+    return results
+
+
+def print_ranking(results, top=10, file=sys.stdout):
+    def fmt(value, scale=1000.0):
+        return f"{value * scale:9.2f}" if value is not None else f"{'-':>9}"
+
+    print(f"{'kind':<7} {'operation':<36} {'count':>6} {'err':>5} {'skip':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'queries':>9}", file=file)
+    for result in results:
+        params = result["params"]
+        print(
+            f"{params['kind']:<7} {params['operation']:<36} {result['ops']:>6} {result['errors']:>5} {result['skipped']:>5} "
+            f"{fmt(result['p50'])} {fmt(result['p95'])} {fmt(result['p99'])} {fmt(result['db_queries'], 1.0)}",
+            file=file
+        )
+    slowest = [result for result in results if result["p95"] is not None][:top]
+    if slowest:
+        print(f"\nslowest by p95: {', '.join(result['params']['operation'] for result in slowest)}", file=file)
+    heaviest = sorted((result for result in results if result["db_queries"]), key=lambda result: -result["db_queries"])[:top]
+    if heaviest:
+        ranked = [f"{result['params']['operation']} ({result['db_queries']:.1f})" for result in heaviest]
+        print(f"most DB queries: {', '.join(ranked)}", file=file)
+
+
+def _import(path):
+    module_name, _, attribute = path.partition(":")
+    module = importlib.import_module(module_name)
+    return getattr(module, attribute or "schema")
+
+
+async def _main(args):
+    weights = {}
+    for item in args.weights or []:
+        kind, _, weight = item.partition("=")
+        weights[kind] = float(weight)
+
+    if args.schema:
+        install_query_counter()
+        sys.path.insert(0, ".")
+        executor = local_executor(_import(args.schema), _import(args.context) if args.context else None)
+        return await _run(args, executor, weights)
+
+    import aiohttp
+    async with aiohttp.ClientSession() as session:
+        return await _run(args, http_executor(session, args.url, args.token), weights)
+
+
+async def _run(args, executor, weights):
+    if args.sdl:
+        with open(args.sdl, "r", encoding="utf-8") as f:
+            sdl_doc = graphql.parse(f.read())
+    else:
+        sdl_doc = await fetch_sdl(executor)
+    workload = Workload(sdl_doc, depth=args.depth, weights=weights, mutations=args.mutations, seed=args.seed, types=args.types)
+    return await run_workload(workload, executor, concurrency=args.concurrency, requests=args.requests, duration=args.duration)
+
+
+def sdltest(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--schema", help="lokalni strawberry schema, modul:atribut")
+    target.add_argument("--url", default="http://localhost:8000/gql", help="GraphQL endpoint")
+    parser.add_argument("--context", help="funkce vracejici context pro lokalni schema, modul:atribut")
+    parser.add_argument("--token", help="JWT pro HTTP endpoint")
+    parser.add_argument("--sdl", help="SDL ze souboru misto _service { sdl }")
+    parser.add_argument("--depth", type=int, default=1, help="hloubka vnoreni cteni")
+    parser.add_argument("--mutations", action="store_true", help="zapnout insert / update / delete")
+    parser.add_argument("--weights", nargs="*", help="vahy druhu operaci, napr. readp=4 read=8 insert=1")
+    parser.add_argument("--types", nargs="*", help="omezit workload na tyto typy")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--duration", type=float, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--output", help="ulozi vysledky do JSON souboru")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(_main(args))
+    print_ranking(results, top=args.top)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"meta": {"depth": args.depth, "seed": args.seed, "concurrency": args.concurrency}, "results": results}, f, indent=2, default=str)
@@ -0,0 +1,248 @@
+"""Generator syntetickych dat podle SQLAlchemy modelu (pro zatezove testy a benchmarky).
+
+Prochazi `BaseModel.registry.mappers`, tabulky generuje v poradi dle cizich klicu
+(`feeders._importPlan`), cizi klice odkazuji na jiz vygenerovana id. Vystupem jsou
+davky radku (`iterSyntheticRows`), ktere lze rovnou vlozit do databaze
+(`generateIntoDatabase`) nebo zapsat do JSON souboru ve tvaru pro `ImportModels`
+/ `ImportJsonFile` (`generateJsonFile`).
+"""
+import json
+import uuid
+import random
+import decimal
+import logging
+import datetime
+
+import sqlalchemy
+
+from .feeders import _importPlan, _insertStatement
+
+
+_FIRSTNAMES = ["Jan", "Petr", "Jana", "Eva", "Pavel", "Lucie", "Martin", "Tereza", "Jiri", "Katerina", "Tomas", "Anna"]
+_SURNAMES = ["Novak", "Svoboda", "Novotny", "Dvorak", "Cerny", "Prochazka", "Kucera", "Vesely", "Horak", "Nemec"]
+_WORDS = ["alfa", "beta", "gama", "delta", "sigma", "omega", "projekt", "skupina", "katedra", "ustav", "plan", "akce"]
+
+_NOW = datetime.datetime(2025, 1, 1)
+
+
+def _uuid(rng):
+    return uuid.UUID(int=rng.getrandbits(128), version=4)
+
+
+def _pastDatetime(rng, scaleDays=365.0):
+    # exponencialni rozdeleni, vetsina hodnot je nedavnych
+    return _NOW - datetime.timedelta(days=rng.expovariate(1.0 / scaleDays), seconds=rng.randrange(86400))
+
+
+def _stringValue(rng, column, index):
+    name = column.name.lower()
+    if name in ("name", "firstname"):
+        value = rng.choice(_FIRSTNAMES)
+    elif name in ("surname", "lastname"):
+        value = rng.choice(_SURNAMES)
+    elif "email" in name:
+        value = f"{rng.choice(_FIRSTNAMES).lower()}.{rng.choice(_SURNAMES).lower()}.{index}@example.com"
+    elif name.endswith("_id"):
+        value = f"{_uuid(rng)}"
+    else:
+        value = f"{rng.choice(_WORDS)} {rng.choice(_WORDS)} {index}"
+    length = getattr(column.type, "length", None)
+    return value[:length] if length else value
+
+
+def _columnGenerator(column):
+    """Vraci funkci (rng, index, row) -> hodnota podle typu a jmena sloupce"""
+    columnType = column.type
+    if isinstance(columnType, sqlalchemy.Enum):
+        enums = list(columnType.enums)
+        return lambda rng, index, row: rng.choice(enums)
+    try:
+        pythonType = columnType.python_type
+    except NotImplementedError:
+        pythonType = None
+    name = column.name.lower()
+
+    if pythonType is bool:
+        return lambda rng, index, row: rng.random() < 0.8
+    if pythonType is int:
+        # lognormalni rozdeleni, male hodnoty caste, obcas velke
+        return lambda rng, index, row: int(rng.lognormvariate(3, 1.5))
+    if pythonType is float:
+        return lambda rng, index, row: rng.gauss(100.0, 25.0)
+    if pythonType is decimal.Decimal:
+        return lambda rng, index, row: decimal.Decimal(f"{rng.gauss(1000.0, 250.0):.2f}")
+    if pythonType is uuid.UUID:
+        return lambda rng, index, row: _uuid(rng)
+    if pythonType is datetime.datetime:
+        if name == "enddate":
+            return lambda rng, index, row: (row.get("startdate", None) or _pastDatetime(rng)) + datetime.timedelta(days=rng.randrange(1, 730))
+        if name == "lastchange":
+            return lambda rng, index, row: _pastDatetime(rng, scaleDays=30.0)
+        return lambda rng, index, row: _pastDatetime(rng)
+    if pythonType is datetime.date:
+        return lambda rng, index, row: _pastDatetime(rng).date()
+    if pythonType is str:
+        return lambda rng, index, row: _stringValue(rng, column, index)
+    if pythonType in (dict, list):
+        return lambda rng, index, row: pythonType()
+    return None
+
+
+def _tableCounts(modelIndex, plan, counts, defaultCount, fanout):
+    """Pocet radku pro kazdou tabulku, explicitni `counts`, jinak podle `fanout` k rodici, jinak `defaultCount`"""
+    result = {}
+    for level in plan:
+        for tableName in level:
+            if tableName in counts:
+                result[tableName] = counts[tableName]
+                continue
+            table = modelIndex[tableName].__table__
+            derived = [
+                result.get(fk.column.table.name, defaultCount) * fanout[f"{tableName}.{fk.parent.name}"]
+                for fk in table.foreign_keys
+                if f"{tableName}.{fk.parent.name}" in fanout and fk.column.table is not table
+            ]
+            result[tableName] = max(derived) if derived else defaultCount
+    return result
+
+
+def iterSyntheticRows(BaseModel, counts=None, defaultCount=100, fanout=None, generators=None, seed=0, batchSize=10_000, nullRatio=0.1):
+    """Generuje radky pro vsechny modely `BaseModel`, vraci dvojice (tableName, [row, ...]) po `batchSize`.
+
+    counts      {tableName: pocet radku}, ostatni tabulky maji `defaultCount` nebo pocet odvozeny z fanout
+    fanout      {"tabulka.sloupec": k} pocet potomku na jednoho rodice pres dany cizi klic
+                (pro odkaz tabulky na sebe vznikne strom s k potomky na uzel)
+    generators  {"tabulka.sloupec": f(rng, index, row)} vlastni generatory hodnot
+    nullRatio   podil NULL v nepovinnych sloupcich (mimo cizi klice s fanout)
+
+    V pameti se drzi jen seznamy id vygenerovanych tabulek (pro cizi klice).
+    """
+    counts = counts or {}
+    fanout = fanout or {}
+    generators = generators or {}
+    rng = random.Random(seed)
+    DBModels = [mapper.class_ for mapper in BaseModel.registry.mappers if hasattr(mapper.class_, "__table__")]
+    modelIndex = dict((DBModel.__tablename__, DBModel) for DBModel in DBModels)
+    plan = _importPlan(DBModels)
+    tableCounts = _tableCounts(modelIndex, plan, counts, defaultCount, fanout)
+    ids = {}
+
+    for level in plan:
+        for tableName in level:
+            table = modelIndex[tableName].__table__
+            count = tableCounts[tableName]
+            foreignKeys = {fk.parent.name: fk for fk in table.foreign_keys}
+            columns = []
+            for column in table.columns:
+                key = f"{tableName}.{column.name}"
+                if key in generators:
+                    columns.append((column, "custom", generators[key]))
+                elif column.name in foreignKeys:
+                    columns.append((column, "fk", foreignKeys[column.name]))
+                elif column.primary_key and column.name == "id":
+                    columns.append((column, "id", None))
+                else:
+                    columns.append((column, "value", _columnGenerator(column)))
+
+            tableIds = ids[tableName] = []
+            batch = []
+            for index in range(count):
+                row = {}
+                for column, kind, generator in columns:
+                    if kind == "id":
+                        value = _uuid(rng) if _isUuid(column) else f"{_uuid(rng)}"
+                        tableIds.append(value)
+                    elif kind == "custom":
+                        value = generator(rng, index, row)
+                    elif kind == "fk":
+                        value = _foreignKeyValue(rng, table, column, generator, index, ids, fanout, nullRatio)
+                    elif generator is None or (column.nullable and rng.random() < nullRatio):
+                        value = None
+                    else:
+                        value = generator(rng, index, row)
+                    row[column.name] = value
+                batch.append(row)
+                if len(batch) >= batchSize:
+                    yield tableName, batch
+                    batch = []
+            if batch:
+                yield tableName, batch
+            logging.info(f"iterSyntheticRows {tableName}: {count} rows")
+
+
+def _isUuid(column):
+    try:
+        return column.type.python_type is uuid.UUID
+    except NotImplementedError:
+        return False
+
+
+def _foreignKeyValue(rng, table, column, fk, index, ids, fanout, nullRatio):
+    key = f"{table.name}.{column.name}"
+    if fk.column.table is table:
+        # odkaz na sebe: strom, rodic je vzdy drive vygenerovany radek
+        tableIds = ids[table.name]
+        current = len(tableIds) - 1
+        if current == 0:
+            return None
+        k = fanout.get(key, None)
+        if k is not None:
+            return tableIds[(current - 1) // k]
+        if rng.random() < 0.2:
+            return None
+        return tableIds[rng.randrange(current)]
+
+    parentIds = ids.get(fk.column.table.name, None) if fk.column.name == "id" else None
+    if not parentIds:
+        # rodicovska tabulka neni v modelech (nebo cyklus)
+        return None
+    k = fanout.get(key, None)
+    if k is not None:
+        return parentIds[(index // k) % len(parentIds)]
+    if column.nullable and rng.random() < nullRatio:
+        return None
+    return parentIds[rng.randrange(len(parentIds))]
+
+
+async def generateIntoDatabase(sessionMaker, BaseModel, **kwargs):
+    """Vygeneruje data (viz `iterSyntheticRows`) a vlozi je Core bulk insertem, kazdou davku
+    ve vlastni transakci. Tabulky uz musi existovat. Vraci {tableName: pocet radku}."""
+    modelIndex = dict((mapper.class_.__tablename__, mapper.class_) for mapper in BaseModel.registry.mappers)
+    result = {}
+    for tableName, batch in iterSyntheticRows(BaseModel, **kwargs):
+        table = modelIndex[tableName].__table__
+        async with sessionMaker() as session:
+            async with session.begin():
+                statement = _insertStatement(session.get_bind().dialect.name, table)
+                await session.execute(statement, batch)
+        result[tableName] = result.get(tableName, 0) + len(batch)
+    return result
+
+
+def generateJsonFile(path, BaseModel, **kwargs):
+    """Vygeneruje data (viz `iterSyntheticRows`) a postupne je zapise do JSON souboru
+    {"tabulka": [{...}, ...]} pro `ImportModels` / `ImportJsonFile`. Vraci {tableName: pocet radku}."""
+    result = {}
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("{")
+        currentTable = None
+        for tableName, batch in iterSyntheticRows(BaseModel, **kwargs):
+            if tableName != currentTable:
+                if currentTable is not None:
+                    f.write("],")
+                f.write(f"{json.dumps(tableName)}:[")
+                currentTable = tableName
+            else:
+                f.write(",")
+            f.write(",".join(json.dumps(row, default=_jsonDefault) for row in batch))
+            result[tableName] = result.get(tableName, 0) + len(batch)
+        if currentTable is not None:
+            f.write("]")
+        f.write("}")
+    return result
+
+
+def _jsonDefault(value):
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    return f"{value}"
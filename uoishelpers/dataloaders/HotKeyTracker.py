@@ -0,0 +1,35 @@
+import random
+import collections
+from typing import Dict, Iterable, List, Optional
+
+
+class HotKeyTracker:
+    """Vzorkuje klíče čtené z globální cache a drží přibližný top-N nejčtenějších klíčů pro každý model.
+
+    Klíče mají tvar `Model:id` (viz `make_entity_cache_key`). Počítadlo je omezené
+    na `limit` klíčů, při přetečení se ponechají jen ty nejčastější.
+    """
+
+    def __init__(self, sample_rate: float = 0.01, top: int = 1000, limit: int = 100_000):
+        self.sample_rate = sample_rate
+        self.top = top
+        self.limit = limit
+        self._counts = collections.Counter()
+
+    def record(self, keys: Iterable[str]) -> None:
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return
+        self._counts.update(keys)
+        if len(self._counts) > self.limit:
+            self._counts = collections.Counter(dict(self._counts.most_common(self.limit // 2)))
+
+    def hot_keys(self, top: Optional[int] = None) -> Dict[str, List[str]]:
+        """Vrací {model: [id, ...]} seřazené od nejčtenějšího, nejvýše `top` id na model."""
+        top = self.top if top is None else top
+        result = {}
+        for key, _ in self._counts.most_common():
+            model_name, raw_id = key.split(":", 1)
+            ids = result.setdefault(model_name, [])
+            if len(ids) < top:
+                ids.append(raw_id)
+        return result
@@ -1,5 +1,7 @@
 import os
+import sys
 import json
+import logging
 import functools
 import uuid
 from typing import TypeVar, Generic, Type, Dict, Awaitable, Optional, Any, Iterable
@@ -14,6 +16,8 @@ import asyncio
 import time
 from dataclasses import fields, is_dataclass
 
+from .HotKeyTracker import HotKeyTracker
+
 
 
 # class GlobalTTLCache:
@@ -60,6 +64,60 @@ try:
 except ImportError:
     valkey = None
 
+try:
+    import lz4.frame as lz4frame
+except ImportError:
+    lz4frame = None
+
+import zlib
+
+# hlavickovy bajt komprimovanych hodnot ve Valkey, JSON nikdy nezacina bajtem < 0x20
+COMPRESSION_CODECS = {
+    "zlib": (b"\x01", lambda data: zlib.compress(data, 1), zlib.decompress),
+}
+if lz4frame is not None:
+    COMPRESSION_CODECS["lz4"] = (b"\x02", lz4frame.compress, lz4frame.decompress)
+COMPRESSION_HEADERS = {header: decompress for header, _, decompress in COMPRESSION_CODECS.values()}
+
+
+class CircuitBreaker:
+    """Po `threshold` chybách za sebou se otevře a `cooldown` sekund vše odmítá.
+    Potom propustí jeden zkušební požadavek (half-open), úspěch jej zavře, neúspěch znovu otevře."""
+
+    def __init__(self, threshold: int = 5, cooldown: float = 10.0):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self._probing or time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if self._probing or time.monotonic() - self.opened_at < self.cooldown:
+            return False
+        self._probing = True
+        return True
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+        self._probing = False
+
 
 class GlobalTTLCache:
     def __init__(
@@ -70,10 +128,73 @@ class GlobalTTLCache:
         connection_string: Optional[str] = None,
         prefix: str = "idLoaderCache:",
         decode_responses: bool = True,
+        stale_ttl: float = 0.0,
+        read_timeout: Optional[float] = 0.1,
+        write_timeout: Optional[float] = 0.5,
+        max_pending_writes: int = 64,
+        breaker_threshold: int = 5,
+        breaker_cooldown: float = 10.0,
+        coalesce: bool = True,
+        coalesce_window: float = 0.0,
+        max_bytes: Optional[int] = None,
+        compress_threshold: Optional[int] = None,
+        compression: str = "zlib",
+        hot_keys_sample_rate: float = 0.0,
+        hot_keys_top: int = 1000,
     ):
         self.ttl = ttl
         self.maxsize = maxsize
+        # pametovy rozpocet in-memory vrstvy (velikost serializovanych hodnot), None = bez limitu;
+        # bez rozpoctu se velikosti nepocitaji (serializace kazde hodnoty je draha) a statistiky bytu jsou 0
+        self.max_bytes = max_bytes
         self.prefix = prefix
+        # jak dlouho po expiraci se snapshot jeste drzi pro stale-if-error (0 = vypnuto)
+        self.stale_ttl = stale_ttl
+
+        # deadliny pro volani Valkey, pomala cache nesmi zdrzet request vic nez DB
+        self.read_timeout = read_timeout
+        self.write_timeout = write_timeout
+        self.max_pending_writes = max_pending_writes
+        self.breaker = CircuitBreaker(threshold=breaker_threshold, cooldown=breaker_cooldown)
+        self._pending_writes = set()
+        # task -> klice, ktere zapisuje (invalidace na ne musi pockat)
+        self._pending_write_keys = {}
+
+        # slucovani get_many / set_many ze vsech loaderu do jednoho round tripu
+        # coalesce_window = 0 znamena "do konce aktualniho tiku event loopu"
+        self.coalesce = coalesce
+        self.coalesce_window = coalesce_window
+        self._read_queue = []  # [(full_keys, future)]
+        self._read_handle = None
+        self._write_buffer = {}  # key -> serialized value
+        self._write_handle = None
+
+        self._stats = {
+            "roundtrips": 0,
+            "coalesced_reads": 0,
+            "timeouts": 0,
+            "errors": 0,
+            "bypassed": 0,
+            "dropped_writes": 0,
+            "evictions": 0,
+        }
+
+        # komprese hodnot nad compress_threshold bajtu (jen Valkey), None = vypnuto
+        self.compress_threshold = compress_threshold
+        if compress_threshold is not None and compression not in COMPRESSION_CODECS:
+            raise ValueError(f"Unknown or unavailable compression codec {compression}, use one of {list(COMPRESSION_CODECS)}")
+        self.compression = compression
+        self._compression_stats = {
+            "values": 0,
+            "raw_bytes": 0,
+            "stored_bytes": 0,
+            "compress_seconds": 0.0,
+            "decompress_seconds": 0.0,
+        }
+
+        # vzorkovani nejctenejsich klicu pro warm-up po restartu (0 = vypnuto)
+        self.hot_keys = HotKeyTracker(sample_rate=hot_keys_sample_rate, top=hot_keys_top)
+        self._hot_keys_task = None
 
         self._use_valkey = connection_string is not None and valkey is not None
 
@@ -81,14 +202,18 @@ class GlobalTTLCache:
         if self._use_valkey:
             self._client = valkey.from_url(
                 connection_string,
-                decode_responses=decode_responses,
+                # komprimovane hodnoty jsou binarni, dekodovani resi _decode
+                decode_responses=decode_responses and compress_threshold is None,
             )
             print(f"GlobalTTLCache using Valkey at {connection_string}")
         else:
             self._client = None
 
         # --- In-memory backend ---
-        self._data = {}
+        self._data = {}  # key -> (expires_at, value), poradi vlozeni = poradi vyhazovani
+        self._sizes = {}  # key -> priblizna velikost v bajtech
+        self._bytes = 0
+        self._bytes_by_model = {}
         self._lock = asyncio.Lock()
 
     # ========================
@@ -101,6 +226,74 @@ class GlobalTTLCache:
     def _full_key(self, key: str) -> str:
         return f"{self.prefix}{key}"
 
+    def _stale_key(self, key: str) -> str:
+        return f"{self.prefix}stale:{key}"
+
+    def _model_name(self, key: str) -> str:
+        return key.split(":", 1)[0]
+
+    def _pop_entry(self, key: str) -> None:
+        """Odebere záznam z in-memory vrstvy a odečte jeho velikost (volat pod zámkem)."""
+        if self._data.pop(key, None) is None:
+            return
+        size = self._sizes.pop(key, 0)
+        self._bytes -= size
+        model_name = self._model_name(key)
+        remaining = self._bytes_by_model.get(model_name, 0) - size
+        if remaining > 0:
+            self._bytes_by_model[model_name] = remaining
+        else:
+            self._bytes_by_model.pop(model_name, None)
+
+    def _estimate_size(self, value: Any) -> int:
+        try:
+            return len(self._serialize(value).encode("utf-8"))
+        except (TypeError, ValueError):
+            # neserializovatelna hodnota (napr. ORM instance), hruby odhad
+            return sys.getsizeof(value)
+
+    def _put_entry(self, key: str, exp: float, value: Any) -> None:
+        self._pop_entry(key)
+        size = self._estimate_size(value) if self.max_bytes is not None else 0
+        self._data[key] = (exp, value)
+        self._sizes[key] = size
+        self._bytes += size
+        model_name = self._model_name(key)
+        self._bytes_by_model[model_name] = self._bytes_by_model.get(model_name, 0) + size
+
+    def _evict(self) -> None:
+        """Vyhazuje nejstarší záznamy, dokud nejsou splněny limity maxsize a max_bytes."""
+        while self._data and (
+            len(self._data) > self.maxsize
+            or (self.max_bytes is not None and self._bytes > self.max_bytes)
+        ):
+            self._pop_entry(next(iter(self._data)))
+            self._stats["evictions"] += 1
+
+    async def _valkey_call(self, factory, timeout, default=None):
+        """Zavolá `factory()` (coroutine nad Valkey) s deadlinem a přes circuit breaker.
+        Při timeoutu, chybě nebo otevřeném jističi vrací `default`."""
+        if not self.breaker.allow():
+            self._stats["bypassed"] += 1
+            return default
+        self._stats["roundtrips"] += 1
+        try:
+            if timeout is None:
+                result = await factory()
+            else:
+                result = await asyncio.wait_for(factory(), timeout=timeout)
+        except asyncio.TimeoutError:
+            self._stats["timeouts"] += 1
+            self.breaker.failure()
+            return default
+        except Exception as e:
+            self._stats["errors"] += 1
+            self.breaker.failure()
+            logging.warning(f"GlobalTTLCache valkey call failed: {e!r}")
+            return default
+        self.breaker.success()
+        return result
+
     def _json_default(self, value: Any):
         if isinstance(value, uuid.UUID):
             return {"__type__": "uuid", "value": str(value)}
@@ -136,6 +329,34 @@ class GlobalTTLCache:
     def _deserialize(self, raw: str) -> Any:
         return json.loads(raw, object_hook=self._json_object_hook)
 
+    def _encode(self, value: Any):
+        """Serializace pro Valkey, hodnoty nad `compress_threshold` komprimuje a označí hlavičkou."""
+        raw = self._serialize(value)
+        if self.compress_threshold is None:
+            return raw
+        data = raw.encode("utf-8")
+        if len(data) < self.compress_threshold:
+            return data
+        header, compress, _ = COMPRESSION_CODECS[self.compression]
+        start = time.perf_counter()
+        compressed = header + compress(data)
+        stats = self._compression_stats
+        stats["compress_seconds"] += time.perf_counter() - start
+        stats["values"] += 1
+        stats["raw_bytes"] += len(data)
+        stats["stored_bytes"] += len(compressed)
+        return compressed
+
+    def _decode(self, raw) -> Any:
+        """Opak `_encode`, zvládá str, nekomprimované bajty i komprimované hodnoty."""
+        if isinstance(raw, bytes):
+            decompress = COMPRESSION_HEADERS.get(raw[:1], None)
+            if decompress is not None:
+                start = time.perf_counter()
+                raw = decompress(raw[1:])
+                self._compression_stats["decompress_seconds"] += time.perf_counter() - start
+        return self._deserialize(raw)
+
     # def _serialize(self, value: Any) -> str:
     #     return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
 
@@ -150,15 +371,24 @@ class GlobalTTLCache:
         keys = list(keys)
         if not keys:
             return {}
+        self.hot_keys.record(keys)
 
         # --- Valkey path ---
         if self._use_valkey:
             full_keys = [self._full_key(k) for k in keys]
-            values = await self._client.mget(full_keys)
+            # timeout / otevreny jistic = vse miss, loader pokracuje do DB
+            if self.coalesce:
+                values = await self._coalesced_mget(full_keys)
+            else:
+                values = await self._valkey_call(
+                    lambda: self._client.mget(full_keys),
+                    self.read_timeout,
+                    default=[None] * len(keys),
+                )
 
             # print(f"GlobalTTLCache get_many for keys {keys} returned {values}")
             return {
-                k: self._deserialize(v)
+                k: self._decode(v)
                 for k, v in zip(keys, values)
                 if v is not None
             }
@@ -177,7 +407,48 @@ class GlobalTTLCache:
 
                 exp, val = item
                 if exp <= now:
-                    self._data.pop(k, None)
+                    if exp + self.stale_ttl <= now:
+                        self._pop_entry(k)
+                    continue
+
+                hit[k] = val
+
+        return hit
+
+    async def get_many_stale(self, keys: Iterable[str]) -> dict[str, Any]:
+        """Vrací snapshoty, které jsou platné nebo expirované nejvýše před `stale_ttl` sekundami.
+        Slouží jako záloha, když databáze neodpovídá (stale-if-error)."""
+        keys = list(keys)
+        if not keys or self.stale_ttl <= 0:
+            return {}
+
+        # --- Valkey path ---
+        if self._use_valkey:
+            stale_keys = [self._stale_key(k) for k in keys]
+            values = await self._valkey_call(
+                lambda: self._client.mget(stale_keys),
+                self.read_timeout,
+                default=[None] * len(keys),
+            )
+            return {
+                k: self._decode(v)
+                for k, v in zip(keys, values)
+                if v is not None
+            }
+
+        # --- In-memory path ---
+        now = self._now()
+        hit = {}
+
+        async with self._lock:
+            for k in keys:
+                item = self._data.get(k)
+                if not item:
+                    continue
+
+                exp, val = item
+                if exp + self.stale_ttl <= now:
+                    self._pop_entry(k)
                     continue
 
                 hit[k] = val
@@ -190,38 +461,207 @@ class GlobalTTLCache:
 
         # --- Valkey path ---
         if self._use_valkey:
-            ttl_seconds = max(1, int(self.ttl))
-
-            async with self._client.pipeline(transaction=False) as pipe:
-                for key, value in mapping.items():
-                    await pipe.set(
-                        self._full_key(key),
-                        self._serialize(value),
-                        ex=ttl_seconds,
-                    )
-                await pipe.execute()
+            # fire-and-forget, pri prilis mnoha rozpracovanych zapisech se zapis zahodi
+            if len(self._pending_writes) >= self.max_pending_writes:
+                self._stats["dropped_writes"] += 1
+                return
+            raw_mapping = {key: self._encode(value) for key, value in mapping.items()}
+            if self.coalesce:
+                self._write_buffer.update(raw_mapping)
+                if self._write_handle is None:
+                    self._write_handle = self._schedule(self._start_write_flush)
+            else:
+                self._start_write(raw_mapping)
             return
 
         # --- In-memory path ---
         now = self._now()
 
         async with self._lock:
-            if len(self._data) > self.maxsize:
-                self._data.clear()
-
             exp = now + self.ttl
             for k, v in mapping.items():
-                self._data[k] = (exp, v)
+                self._put_entry(k, exp, v)
+            self._evict()
+
+    def _schedule(self, callback):
+        loop = asyncio.get_running_loop()
+        if self.coalesce_window > 0:
+            return loop.call_later(self.coalesce_window, callback)
+        return loop.call_soon(callback)
+
+    async def _coalesced_mget(self, full_keys):
+        future = asyncio.get_running_loop().create_future()
+        self._read_queue.append((full_keys, future))
+        if self._read_handle is None:
+            self._read_handle = self._schedule(self._start_read_flush)
+        return await future
+
+    def _start_read_flush(self):
+        self._read_handle = None
+        batch, self._read_queue = self._read_queue, []
+        if batch:
+            asyncio.ensure_future(self._flush_reads(batch))
+
+    async def _flush_reads(self, batch):
+        """Jeden MGET pro všechny get_many, které se sešly v okně, výsledky rozdělí zpět."""
+        unique_keys = list(dict.fromkeys(k for full_keys, _ in batch for k in full_keys))
+        self._stats["coalesced_reads"] += len(batch)
+        try:
+            values = await self._valkey_call(
+                lambda: self._client.mget(unique_keys),
+                self.read_timeout,
+                default=[None] * len(unique_keys),
+            )
+            found = dict(zip(unique_keys, values))
+            for full_keys, future in batch:
+                if not future.done():
+                    future.set_result([found.get(k) for k in full_keys])
+        except BaseException as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            raise
+
+    def _start_write_flush(self):
+        self._write_handle = None
+        raw_mapping, self._write_buffer = self._write_buffer, {}
+        if raw_mapping:
+            self._start_write(raw_mapping)
+
+    def _start_write(self, raw_mapping):
+        task = asyncio.ensure_future(
+            self._valkey_call(lambda: self._write_many(raw_mapping), self.write_timeout)
+        )
+        self._pending_writes.add(task)
+        self._pending_write_keys[task] = frozenset(raw_mapping)
+        task.add_done_callback(self._write_done)
+
+    def _write_done(self, task):
+        self._pending_writes.discard(task)
+        self._pending_write_keys.pop(task, None)
+
+    async def _await_writes_of(self, keys) -> None:
+        """Počká na rozpracované zápisy těchto klíčů. SET běží na jiném spojení z poolu
+        a mohl by doběhnout až po DEL, v cache by pak zůstal starý snapshot celé TTL."""
+        keys = set(keys)
+        tasks = [task for task, written in self._pending_write_keys.items() if not keys.isdisjoint(written)]
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _write_many(self, raw_mapping: dict[str, Any]) -> None:
+        ttl_seconds = max(1, int(self.ttl))
+        stale_seconds = ttl_seconds + int(self.stale_ttl)
+
+        async with self._client.pipeline(transaction=False) as pipe:
+            for key, raw in raw_mapping.items():
+                await pipe.set(
+                    self._full_key(key),
+                    raw,
+                    ex=ttl_seconds,
+                )
+                if self.stale_ttl > 0:
+                    # stinova kopie, prezije hlavni klic o stale_ttl
+                    await pipe.set(
+                        self._stale_key(key),
+                        raw,
+                        ex=stale_seconds,
+                    )
+            await pipe.execute()
+
+    async def flush_writes(self) -> None:
+        """Počká na dokončení rozpracovaných (fire-and-forget) zápisů."""
+        if self._write_handle is not None:
+            self._write_handle.cancel()
+            self._start_write_flush()
+        if self._pending_writes:
+            await asyncio.gather(*self._pending_writes, return_exceptions=True)
+
+    def get_stats(self) -> dict[str, Any]:
+        return {
+            **self._stats,
+            "backend": "valkey" if self._use_valkey else "memory",
+            "entries": len(self._data),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "bytes_by_model": dict(self._bytes_by_model),
+            "compression": self._get_compression_stats(),
+            "pending_writes": len(self._pending_writes),
+            "breaker": self.breaker.state,
+        }
+
+    def _get_compression_stats(self) -> dict[str, Any]:
+        stats = self._compression_stats
+        return {
+            **stats,
+            "codec": self.compression if self.compress_threshold is not None else None,
+            "threshold": self.compress_threshold,
+            "ratio": stats["stored_bytes"] / stats["raw_bytes"] if stats["raw_bytes"] else None,
+        }
+
+    # ========================
+    # Hot keys (warm-up)
+    # ========================
+
+    def _hot_keys_key(self) -> str:
+        return f"{self.prefix}hotkeys"
+
+    async def save_hot_keys(self, path: Optional[str] = None) -> dict[str, list[str]]:
+        """Uloží aktuální top-N klíče do souboru `path`, bez `path` do Valkey."""
+        hot_keys = self.hot_keys.hot_keys()
+        raw = json.dumps(hot_keys, separators=(",", ":"))
+        if path is not None:
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(raw)
+        elif self._use_valkey:
+            await self._valkey_call(
+                lambda: self._client.set(self._hot_keys_key(), raw),
+                self.write_timeout,
+            )
+        return hot_keys
+
+    async def load_hot_keys(self, path: Optional[str] = None) -> dict[str, list[str]]:
+        """Načte klíče uložené `save_hot_keys`, chybějící snapshot = prázdný slovník."""
+        raw = None
+        if path is not None:
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    raw = f.read()
+        elif self._use_valkey:
+            raw = await self._valkey_call(
+                lambda: self._client.get(self._hot_keys_key()),
+                self.read_timeout,
+            )
+        return json.loads(raw) if raw else {}
+
+    def start_hot_keys_snapshots(self, interval: float = 300.0, path: Optional[str] = None):
+        """Spustí periodické ukládání hot keys na pozadí."""
+        async def snapshot_loop():
+            while True:
+                await asyncio.sleep(interval)
+                try:
+                    await self.save_hot_keys(path)
+                except Exception as e:
+                    logging.warning(f"GlobalTTLCache hot keys snapshot failed: {e!r}")
+
+        if self._hot_keys_task is None:
+            self._hot_keys_task = asyncio.ensure_future(snapshot_loop())
+        return self._hot_keys_task
 
     async def invalidate(self, key: str) -> None:
         # --- Valkey ---
         if self._use_valkey:
-            await self._client.delete(self._full_key(key))
+            # zapis cekajici na flush by invalidaci prepsal, rozbehnuty musi dobehnout pred DEL
+            self._write_buffer.pop(key, None)
+            await self._await_writes_of([key])
+            await self._valkey_call(
+                lambda: self._client.delete(self._full_key(key), self._stale_key(key)),
+                self.write_timeout,
+            )
             return
 
         # --- Memory ---
         async with self._lock:
-            self._data.pop(key, None)
+            self._pop_entry(key)
 
     async def invalidate_many(self, keys: Iterable[str]) -> None:
         keys = list(keys)
@@ -230,19 +670,73 @@ class GlobalTTLCache:
 
         # --- Valkey ---
         if self._use_valkey:
-            await self._client.delete(*[self._full_key(k) for k in keys])
+            for k in keys:
+                self._write_buffer.pop(k, None)
+            await self._await_writes_of(keys)
+            await self._valkey_call(
+                lambda: self._client.delete(
+                    *[self._full_key(k) for k in keys],
+                    *[self._stale_key(k) for k in keys],
+                ),
+                self.write_timeout,
+            )
             return
 
         # --- Memory ---
         async with self._lock:
             for k in keys:
-                self._data.pop(k, None)
+                self._pop_entry(k)
 
     async def close(self) -> None:
+        if self._hot_keys_task is not None:
+            self._hot_keys_task.cancel()
+            self._hot_keys_task = None
         if self._use_valkey and self._client:
+            await self.flush_writes()
             await self._client.aclose()
 
 
+class CacheInvalidationQueue:
+    """Odložené invalidace globální cache pro jednu GraphQL operaci.
+
+    IDLoader do fronty jen přidává klíče, `SessionCommitExtension` je po úspěšném
+    commitu provede jedním `invalidate_many` (volitelně i opožděně podruhé),
+    při rollbacku je zahodí.
+    """
+
+    def __init__(self):
+        self._keys = {}  # cache -> set of keys
+        self._tasks = set()
+
+    def __len__(self):
+        return sum(len(keys) for keys in self._keys.values())
+
+    def add(self, cache, key: str) -> None:
+        self._keys.setdefault(cache, set()).add(key)
+
+    def pending(self, cache, key: str) -> bool:
+        """Ceka klic na invalidaci? (zapsano v teto operaci, snapshot v cache je stary)"""
+        return key in self._keys.get(cache, ())
+
+    def discard(self) -> None:
+        self._keys = {}
+
+    async def flush(self, second_delete_delay: Optional[float] = None) -> None:
+        pending, self._keys = self._keys, {}
+        for cache, keys in pending.items():
+            await cache.invalidate_many(keys)
+        if pending and second_delete_delay:
+            # druhy delete smaze snapshot, ktery mezitim ulozil soubezny request ze stare transakce
+            task = asyncio.ensure_future(self._delayed_flush(pending, second_delete_delay))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _delayed_flush(self, pending, delay):
+        await asyncio.sleep(delay)
+        for cache, keys in pending.items():
+            await cache.invalidate_many(keys)
+
+
 def update(destination, source=None, extraValues={}, UNSET=strawberry.UNSET):
     """Updates destination's attributes with source's attributes.
     Attributes with value None are not updated."""
@@ -267,6 +761,15 @@ GLOBAL_ENTITY_CACHE = GlobalTTLCache(
 
 GLOBAL_ASYNCIO_LOCK = asyncio.Lock()
 
+async def _acquire_db_slot(session):
+    """Získá slot DB limiteru (`LazySession.acquire`) ještě před vstupem do `asyncio_lock`.
+    Operace bez slotu by jinak čekala ve frontě limiteru se zámkem v ruce a operace,
+    které sloty drží, by se ke svému dalšímu dotazu nedostaly."""
+    acquire = getattr(session, "acquire", None)
+    if acquire is not None:
+        await acquire()
+    return session
+
 def detach_entity(entity):
     if entity is None:
         return None
@@ -286,6 +789,10 @@ def parse_entity_cache_key(key: str) -> tuple[str, uuid.UUID]:
 
 class IDLoader(DataLoader[uuid.UUID, T], Generic[T]):
     dbModel: Type[T] = None
+    # stale-if-error: pri chybe / prekroceni db_timeout vrat expirovane snapshoty z globalni cache
+    stale_if_error: bool = False
+    # deadline na cekani na DB slot a zamek loaderu, rozbehnuty dotaz se neprerusuje
+    db_timeout: Optional[float] = None
 
     @classmethod
     @functools.cache
@@ -300,16 +807,30 @@ class IDLoader(DataLoader[uuid.UUID, T], Generic[T]):
         
     @classmethod
     @functools.cache
-    def createFkeySpecificLoader(cls, fkey: str, session=None, shared_cache=None):
+    def createFkeySpecificLoader(cls, fkey: str, session=None, shared_cache=None, read_router=None):
         """Vytvoří novou podtřídu IDLoader s přednastaveným fkey."""
-        result = FKeyLoader[cls.dbModel](session=session, foreignKeyName=fkey, asyncio_lock=GLOBAL_ASYNCIO_LOCK, shared_cache=shared_cache)
+        result = FKeyLoader[cls.dbModel](session=session, foreignKeyName=fkey, asyncio_lock=GLOBAL_ASYNCIO_LOCK, shared_cache=shared_cache, read_router=read_router)
         return result
 
-    def __init__(self, session, cache_map=None, shared_cache=GLOBAL_ENTITY_CACHE, asyncio_lock=GLOBAL_ASYNCIO_LOCK):
+    def __init__(
+        self, session, cache_map=None, shared_cache=GLOBAL_ENTITY_CACHE, asyncio_lock=GLOBAL_ASYNCIO_LOCK,
+        *, stale_if_error: Optional[bool] = None, db_timeout: Optional[float] = None, degraded: Optional[dict] = None,
+        invalidation_queue: Optional[CacheInvalidationQueue] = None, read_router=None
+    ):
         super().__init__(cache=True, cache_map=cache_map)
         self.global_entity_cache = shared_cache
         self.asyncio_lock = asyncio_lock
         self.session = session
+        if stale_if_error is not None:
+            self.stale_if_error = stale_if_error
+        if db_timeout is not None:
+            self.db_timeout = db_timeout
+        # model name -> set of ids served from stale snapshots (sdileno pres LoaderMapBase)
+        self.degraded = {} if degraded is None else degraded
+        # je-li zadana, invalidace globalni cache se odkladaji az za commit
+        self.invalidation_queue = invalidation_queue
+        # ReadRouter, cteni mohou jit na repliku (zapisy vzdy self.session)
+        self.read_router = read_router
         if not self.dbModel:
             raise ValueError("Model must be specified using IDLoader[Model]")
         # print(f"IDLoader initialized for model: {self.dbModel.__name__}")
@@ -319,9 +840,40 @@ class IDLoader(DataLoader[uuid.UUID, T], Generic[T]):
             pass
         pass
 
-    def _invalidate_global(self, id):
-        if self.global_entity_cache:
-            return self.global_entity_cache.invalidate(make_entity_cache_key(self.dbModel, id))
+    def _read_session(self):
+        if self.read_router is None:
+            return self.session
+        return self.read_router.session_for(self.dbModel)
+
+    def _mark_written(self):
+        if self.read_router is not None:
+            self.read_router.mark_written(self.dbModel)
+
+    def _pending_invalidation(self, cache_key) -> bool:
+        return self.invalidation_queue is not None and self.invalidation_queue.pending(self.global_entity_cache, cache_key)
+
+    def _reads_replica(self) -> bool:
+        return self.read_router is not None and self.read_router.is_replica(self.dbModel)
+
+    async def _cache_rows(self, rows, replica=False):
+        """Uloží řádky do globální cache jako snapshoty, kromě necommitovaných zápisů této operace.
+        Řádky z repliky (`replica=True`) se neukládají, mohou být zastaralé a cache by je
+        ostatním requestům držela celé TTL."""
+        if not self.global_entity_cache or replica:
+            return
+        to_cache = {make_entity_cache_key(self.dbModel, row.id): detach_entity(row) for row in rows}
+        await self.global_entity_cache.set_many({
+            key: value for key, value in to_cache.items() if not self._pending_invalidation(key)
+        })
+
+    async def _invalidate_global(self, id):
+        if not self.global_entity_cache:
+            return
+        key = make_entity_cache_key(self.dbModel, id)
+        if self.invalidation_queue is not None:
+            self.invalidation_queue.add(self.global_entity_cache, key)
+            return
+        await self.global_entity_cache.invalidate(key)
 
     async def batch_load_fn(self, keys):
         # 1) nejdřív zkus session identity_map (to už děláš)
@@ -335,7 +887,11 @@ class IDLoader(DataLoader[uuid.UUID, T], Generic[T]):
 
         # 2) globální cache (vrací DETACHED snapshoty)
         if self.global_entity_cache:
-            cache_keys = [make_entity_cache_key(self.dbModel, k) for k in missing_keys]
+            # klice zapsane v teto operaci (odlozena invalidace) cache obchazi
+            cache_keys = [
+                cache_key for cache_key in (make_entity_cache_key(self.dbModel, k) for k in missing_keys)
+                if not self._pending_invalidation(cache_key)
+            ]
             dbModel = self.dbModel
             cached = await self.global_entity_cache.get_many(cache_keys)
             cached_by_id = {parse_entity_cache_key(k)[1]: dbModel(**v) for k, v in cached.items()}  # (Model,id) -> snapshot
@@ -348,17 +904,20 @@ class IDLoader(DataLoader[uuid.UUID, T], Generic[T]):
         data_db = {}
         if missing_keys:
             stmt = select(self.dbModel).where(self.dbModel.id.in_(missing_keys))
-            
-            async with self.asyncio_lock:
-                res = await self.session.execute(stmt)
-                rows = list(res.scalars())
+            replica = self._reads_replica()
 
-            data_db = {row.id: row for row in rows}
+            try:
+                rows = await self._fetch_rows(stmt)
+            except Exception as e:
+                if not (self.stale_if_error and self.global_entity_cache):
+                    raise
+                data_db = await self._load_stale(missing_keys, e)
+                rows = []
+
+            data_db.update({row.id: row for row in rows})
 
             # uložit do globální cache jako snapshot
-            if self.global_entity_cache:
-                to_cache = {make_entity_cache_key(self.dbModel, row.id): detach_entity(row) for row in rows}
-                await self.global_entity_cache.set_many(to_cache)
+            await self._cache_rows(rows, replica=replica)
 
         # 4) slož výsledek v pořadí keys
         result = []
@@ -371,6 +930,42 @@ class IDLoader(DataLoader[uuid.UUID, T], Generic[T]):
                 result.append(data_db.get(k))    # ORM instance (aktuální request)
         return result
     
+    async def _fetch_rows(self, stmt):
+        session = self._read_session()
+
+        async def wait():
+            await _acquire_db_slot(session)
+            await self.asyncio_lock.acquire()
+
+        if self.db_timeout is None:
+            await wait()
+        else:
+            # deadline plati jen pro cekani na slot a zamek; zruseni rozbehnuteho execute
+            # by zneplatnilo spojeni session (PendingRollbackError) a selhal by i commit operace
+            await asyncio.wait_for(wait(), timeout=self.db_timeout)
+        try:
+            res = await session.execute(stmt)
+            return list(res.scalars())
+        finally:
+            self.asyncio_lock.release()
+
+    async def _load_stale(self, keys, error):
+        """Degradovaný režim, vrací expirované snapshoty z globální cache.
+        Klíče bez jakékoliv kopie v cache dostanou výjimku `error`."""
+        dbModel = self.dbModel
+        cache_keys = {k: make_entity_cache_key(dbModel, k) for k in keys}
+        stale = await self.global_entity_cache.get_many_stale(cache_keys.values())
+
+        result = {}
+        for k, cache_key in cache_keys.items():
+            value = stale.get(cache_key, None)
+            result[k] = dbModel(**value) if value is not None else error
+        served = [k for k, v in result.items() if v is not error]
+        if served:
+            self.degraded.setdefault(dbModel.__name__, set()).update(served)
+        logging.warning(f"IDLoader[{dbModel.__name__}] degraded, {len(served)}/{len(keys)} served stale: {error!r}")
+        return result
+
     async def insert(self, entity, extraAttributes={}):
         if isinstance(entity, self.dbModel):
             newdbrow = entity
@@ -382,6 +977,8 @@ class IDLoader(DataLoader[uuid.UUID, T], Generic[T]):
             newdbrow.id = uuid.uuid4()
             
         await self._invalidate_global(newdbrow.id)
+        self._mark_written()
+        await _acquire_db_slot(self.session)
         async with self.asyncio_lock:
             self.session.add(newdbrow)
             self.registerResult(newdbrow)
@@ -393,7 +990,9 @@ class IDLoader(DataLoader[uuid.UUID, T], Generic[T]):
     async def update(self, entity, extraValues={}):
         session = self.session
         result = None
+        self._mark_written()
 
+        await _acquire_db_slot(session)
         async with self.asyncio_lock:
             rowToUpdate = await session.get(self.dbModel, entity.id)
             if rowToUpdate is None:
@@ -413,12 +1012,15 @@ class IDLoader(DataLoader[uuid.UUID, T], Generic[T]):
 
             # NEVOLAT commit!
             await self._invalidate_global(rowToUpdate.id)
+            self.clear(rowToUpdate.id)
             self.registerResult(rowToUpdate)
         return rowToUpdate
     
     async def delete(self, id):
         await self._invalidate_global(id)
+        self._mark_written()
         stmt = delete(self.dbModel).where(self.dbModel.id == id)
+        await _acquire_db_slot(self.session)
         async with self.asyncio_lock:
             await self.session.execute(stmt)
         
@@ -432,15 +1034,16 @@ class IDLoader(DataLoader[uuid.UUID, T], Generic[T]):
     
     async def execute_select(self, statement):
         #print(statement)
+        replica = self._reads_replica()
+        session = await _acquire_db_slot(self._read_session())
         async with self.asyncio_lock:
-            rows = await self.session.execute(statement)
+            rows = await session.execute(statement)
             result = [
                 self.registerResult(row)
                 for row in rows.scalars()
             ]
             if self.global_entity_cache:
-                to_cache = {make_entity_cache_key(self.dbModel, row.id): detach_entity(row) for row in result}
-                await self.global_entity_cache.set_many(to_cache)
+                await self._cache_rows(result, replica=replica)
             else:
                 for row in result:
                     self.registerResult(row)
@@ -452,7 +1055,7 @@ class IDLoader(DataLoader[uuid.UUID, T], Generic[T]):
             
             for key, value in filters.items():
                 break
-            fkeyloader = cls.createFkeySpecificLoader(fkey=key, session=self.session, shared_cache=self.global_entity_cache)
+            fkeyloader = cls.createFkeySpecificLoader(fkey=key, session=self.session, shared_cache=self.global_entity_cache, read_router=self.read_router)
             results = await fkeyloader.load(value)
             registeredresults = (self.registerResult(result) for result in results)
 
@@ -461,7 +1064,39 @@ class IDLoader(DataLoader[uuid.UUID, T], Generic[T]):
             statement = select(self.dbModel).filter_by(**filters)
             return await self.execute_select(statement)        
 
-    async def page(self, skip=0, limit=10, where=None, orderby=None, desc=None, extendedfilter=None):
+    async def stream_select(self, statement, chunk_size=1000, register=False):
+        """Asynchronní iterátor přes výsledek `statement` čtený po dávkách (`yield_per`).
+
+        Řádky se nedrží v paměti, pamět je úměrná `chunk_size`. S `register=True` se každá
+        dávka zaregistruje v loaderu a uloží do globální cache (loader pak ale řádky drží).
+        `asyncio_lock` se drží jen po dobu načtení dávky, ne přes `yield`, takže konzument
+        smí mezi řádky volat `load()` apod. Otevřený stream ale drží kurzor na spojení
+        session, session proto po dobu iterace nesdílej se souběžnými tasky (jiné requesty,
+        `asyncio.gather`), pro export použij vlastní session.
+        """
+        statement = statement.execution_options(yield_per=chunk_size)
+        replica = self._reads_replica()
+        session = await _acquire_db_slot(self._read_session())
+        async with self.asyncio_lock:
+            result = await session.stream_scalars(statement)
+        try:
+            partitions = result.partitions(chunk_size).__aiter__()
+            while True:
+                async with self.asyncio_lock:
+                    chunk = await anext(partitions, None)
+                if chunk is None:
+                    break
+                if register:
+                    for row in chunk:
+                        self.registerResult(row)
+                    await self._cache_rows(chunk, replica=replica)
+                for row in chunk:
+                    yield row
+        finally:
+            async with self.asyncio_lock:
+                await result.close()
+
+    def _page_statement(self, skip=0, limit=10, where=None, orderby=None, desc=None, extendedfilter=None):
         if where is not None:
             statement = prepareSelect(self.dbModel, where, extendedfilter)
         elif extendedfilter is not None:
@@ -478,9 +1113,35 @@ class IDLoader(DataLoader[uuid.UUID, T], Generic[T]):
                     statement = statement.order_by(column.desc())
                 else:
                     statement = statement.order_by(column.asc())
+        return statement
 
+    async def page(self, skip=0, limit=10, where=None, orderby=None, desc=None, extendedfilter=None):
+        statement = self._page_statement(skip=skip, limit=limit, where=where, orderby=orderby, desc=desc, extendedfilter=extendedfilter)
         return await self.execute_select(statement)
 
+    async def stream_page(self, skip=0, limit=None, where=None, orderby=None, desc=None, extendedfilter=None, chunk_size=1000, register=False):
+        """Jako `page`, ale vrací asynchronní iterátor (viz `stream_select`), `limit=None` = bez omezení."""
+        statement = self._page_statement(skip=skip, limit=limit, where=where, orderby=orderby, desc=desc, extendedfilter=extendedfilter)
+        async for row in self.stream_select(statement, chunk_size=chunk_size, register=register):
+            yield row
+
+    async def warmup(self, ids, chunk_size=5000):
+        """Načte zadaná id několika velkými `IN` dotazy a uloží je do globální cache."""
+        # hot keys jsou ulozene jako retezce, prevadi se podle typu primarniho klice (UUID, int, ...)
+        try:
+            pk_type = self.dbModel.id.type.python_type
+        except NotImplementedError:
+            pk_type = None
+        if pk_type is not None:
+            ids = [id if isinstance(id, pk_type) else pk_type(f"{id}") for id in ids]
+        else:
+            ids = list(ids)
+        count = 0
+        for start in range(0, len(ids), chunk_size):
+            statement = select(self.dbModel).where(self.dbModel.id.in_(ids[start:start + chunk_size]))
+            count += len(await self.execute_select(statement))
+        return count
+
     def getModel(self):
         """Vrací model, pro který je tento IDLoader určen."""
         return self.dbModel
@@ -504,9 +1165,10 @@ class FKeyLoader(DataLoader, Generic[T]):
             {"dbModel": item}
         )
         
-    def __init__(self, session, foreignKeyName, asyncio_lock=GLOBAL_ASYNCIO_LOCK, cache_map=None, shared_cache=None):
+    def __init__(self, session, foreignKeyName, asyncio_lock=GLOBAL_ASYNCIO_LOCK, cache_map=None, shared_cache=None, read_router=None):
         super().__init__()
         self.session = session
+        self.read_router = read_router
         self.foreignKeyName = foreignKeyName
         self.asyncio_lock = asyncio_lock
         self.cache_map = cache_map
@@ -519,7 +1181,8 @@ class FKeyLoader(DataLoader, Generic[T]):
     async def batch_load_fn(self, keys):
         _keys = [*keys]
         #print('batch_load_fn', keys, flush=True)
-        session = self.session
+        replica = self.read_router is not None and self.read_router.is_replica(self.dbModel)
+        session = self.session if self.read_router is None else self.read_router.session_for(self.dbModel)
         
         statement = (
             select(self.dbModel)
@@ -527,6 +1190,7 @@ class FKeyLoader(DataLoader, Generic[T]):
             .filter(self.foreignKeyNameAttribute.in_(_keys))
         )
 
+        await _acquire_db_slot(session)
         async with self.asyncio_lock:
             rows = await session.execute(statement)
             rows = rows.scalars()
@@ -542,7 +1206,8 @@ class FKeyLoader(DataLoader, Generic[T]):
                 groupedResults[self.foreignKeyName] = groupedResult
             groupedResult.append(row)
 
-        if self.shared_cache is not None:
+        # radky z repliky mohou byt zastarale, do sdilene cache se neukladaji
+        if self.shared_cache is not None and not replica:
             await self.shared_cache.set_many({make_entity_cache_key(self.dbModel, row.id): detach_entity(row) for row in rows})
             
         #print(groupedResults)
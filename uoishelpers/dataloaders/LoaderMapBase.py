@@ -1,7 +1,9 @@
-from .IDLoader import IDLoader
+from .IDLoader import IDLoader, CacheInvalidationQueue, GLOBAL_ENTITY_CACHE
+from .ReadRouter import ReadRouter
 
 
 import typing
+import logging
 import functools
 from typing import Type, Dict
 
@@ -20,11 +22,23 @@ class LoaderMapBase(typing.Generic[T]):
             {"BaseModel": item}
         )
 
-    def __init__(self, session):
+    def __init__(self, session, defer_invalidation=False, read_session=None, **loader_kwargs):
         BaseModel = type(self).BaseModel
         self.session = session
+        # model name -> ids served from stale cache (stale_if_error), spolecne pro vsechny loadery
+        self.degraded = {}
+        # defer_invalidation: invalidace globalni cache az po commitu (flush dela SessionCommitExtension)
+        self.invalidation_queue = CacheInvalidationQueue() if defer_invalidation else None
+        # read_session: read-only session (replika), cteni zapsanych modelu zustavaji na primarni
+        self.read_router = ReadRouter(session, read_session) if read_session is not None else None
+        self.loader_kwargs = {
+            **loader_kwargs,
+            "degraded": self.degraded,
+            "invalidation_queue": self.invalidation_queue,
+            "read_router": self.read_router,
+        }
         self._all: Dict[typing.Any, IDLoader] = {
-            DBModel.class_: IDLoader[DBModel.class_](session)
+            DBModel.class_: IDLoader[DBModel.class_](session, **self.loader_kwargs)
             for DBModel in BaseModel.registry.mappers
         }        
 
@@ -41,6 +55,26 @@ class LoaderMapBase(typing.Generic[T]):
         result = self._all.get(model)
         if result is None:
             print(f"Creating new IDLoader for model: {model}")
-            result = IDLoader[model](self.session)
+            result = IDLoader[model](self.session, **self.loader_kwargs)
             self._all[model] = result
-        return result  
+        return result
+
+    def clear_all(self) -> None:
+        """Vyprázdní cache všech loaderů (např. po rollbacku savepointu)."""
+        for loader in self._all.values():
+            loader.clear_all()
+
+    @classmethod
+    async def warmup(cls, session_maker, shared_cache=GLOBAL_ENTITY_CACHE, path=None, chunk_size=5000):
+        """Startup hook, nahraje do `shared_cache` klíče uložené `GlobalTTLCache.save_hot_keys`.
+        Volat před tím, než worker nahlásí připravenost."""
+        hot_keys = await shared_cache.load_hot_keys(path)
+        result = {}
+        async with session_maker() as session:
+            loaders = cls(session, shared_cache=shared_cache)
+            for model_name, ids in hot_keys.items():
+                if not any(m.class_.__name__ == model_name for m in cls.BaseModel.registry.mappers):
+                    continue
+                result[model_name] = await loaders.get(model_name).warmup(ids, chunk_size=chunk_size)
+        logging.info(f"LoaderMapBase warmup loaded {result}")
+        return result
@@ -0,0 +1,42 @@
+import collections
+
+
+class ReadRouter:
+    """Směruje čtení IDLoaderů mezi primární session a read-only session (replikou).
+
+    Čtení jde na repliku, dokud operace daný model nezapsala. Jakmile IDLoader
+    provede insert / update / delete, čtení tohoto modelu zůstávají do konce
+    operace na primární session (read-your-writes).
+
+    `decisions` počítá rozhodnutí pro jednu operaci, `totals` za celý proces.
+    """
+
+    totals = collections.Counter()
+
+    def __init__(self, session, read_session=None):
+        self.session = session
+        self.read_session = read_session
+        self.written_models = set()
+        self.decisions = collections.Counter()
+
+    def mark_written(self, model) -> None:
+        self.written_models.add(model)
+
+    def is_replica(self, model) -> bool:
+        """Půjde čtení modelu na repliku? (bez započtení do statistik)"""
+        return self.read_session is not None and model not in self.written_models
+
+    def session_for(self, model):
+        if self.read_session is None:
+            decision, session = "primary", self.session
+        elif model in self.written_models:
+            decision, session = "primary_written", self.session
+        else:
+            decision, session = "replica", self.read_session
+        self.decisions[decision] += 1
+        ReadRouter.totals[decision] += 1
+        return session
+
+    @classmethod
+    def get_stats(cls) -> dict:
+        return dict(cls.totals)
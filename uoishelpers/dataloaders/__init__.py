@@ -410,6 +410,8 @@ def createLoadersAuto(asyncSessionMaker, BaseModel, extra={}):
     return Loaders()
 
 def readJsonFile(jsonFileName):
+    """Nacte cely JSON soubor do pameti, typy odhaduje podle jmen klicu.
+    Pro velke soubory je vhodnejsi `uoishelpers.feeders.ImportJsonFile` (streamovane, typy dle modelu)."""
     def datetime_parser(json_dict):
         for (key, value) in json_dict.items():
             if key in ["startdate", "enddate", "lastchange", "created"]:
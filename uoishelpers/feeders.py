@@ -1,132 +1,296 @@
+import os
+import json
+import time
+import hashlib
+import uuid
+import decimal
+import asyncio
+import logging
+import zipfile
+import datetime
+import tempfile
+import itertools
+import dataclasses
+import sqlalchemy
 from sqlalchemy.future import select
 
 
-async def putPredefinedStructuresIntoTable(
-    asyncSessionMaker, DBModel, structureFunction
-):
-    """Zabezpeci prvotni inicicalizaci zaznamu v databazi
-    DBModel zprostredkovava tabulku,
-    structureFunction() dava data, ktera maji byt ulozena,
-    predpoklada se list of dicts, pricemz dict obsahuje elementarni datove typy
-    """
-    #print("putPredefinedStructuresIntoTable")
-    tableName = DBModel.__tablename__
-    # column names
-    cols = [col.name for col in DBModel.metadata.tables[tableName].columns]
-    # print(cols)
+def _insertStatement(dialectName, table):
+    """INSERT, ktery preskoci radky s jiz existujicim id (PostgreSQL, SQLite),
+    pro ostatni dialekty obycejny INSERT (radky jsou predem odfiltrovane podle id)"""
+    if dialectName == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        return insert(table).on_conflict_do_nothing(index_elements=["id"])
+    if dialectName == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        return insert(table).on_conflict_do_nothing(index_elements=["id"])
+    return sqlalchemy.insert(table)
+
+
+def _defaultFactories(DBModel, cols):
+    """default_factory z dataclass modelu (MappedAsDataclass) se nepropisuje do Column.default,
+    Core INSERT je tedy musi doplnit sam"""
+    if not dataclasses.is_dataclass(DBModel):
+        return {}
+    return {
+        field.name: field.default_factory
+        for field in dataclasses.fields(DBModel)
+        if field.default_factory is not dataclasses.MISSING and field.name in cols
+    }
+
+
+def _rowMapper(DBModel):
+    """Vraci funkci, ktera z item vybere jen atributy, ktere jsou v DBModel (zbytek je ignorovan),
+    a doplni hodnoty z dataclass default_factory"""
+    cols = [col.name for col in DBModel.__table__.columns]
+    defaultFactories = _defaultFactories(DBModel, cols)
 
     def mapToCols(item):
-        """
-        z item vybere jen atributy, ktere jsou v DBModel,
-        zbytek je ignorovan"""
         result = {}
         for col in cols:
             value = item.get(col, None)
             if value is None:
-                continue
+                factory = defaultFactories.get(col, None)
+                if factory is None:
+                    continue
+                value = factory()
             result[col] = value
         return result
+    return mapToCols
 
-    # ocekavane typy
-    externalIdTypes = structureFunction()
 
-    # dotaz do databaze
-    stmt = select(DBModel)
+def _upsertRowMapper(DBModel):
+    """Jako `_rowMapper`, ale sloupec obsazeny v item se prenese i s hodnotou None
+    (zmena na NULL se musi propsat), default_factory jen pro sloupce, ktere v item chybi"""
+    cols = [col.name for col in DBModel.__table__.columns]
+    defaultFactories = _defaultFactories(DBModel, cols)
+
+    def mapToCols(item):
+        result = {}
+        for col in cols:
+            if col in item:
+                result[col] = item[col]
+            elif col in defaultFactories:
+                result[col] = defaultFactories[col]()
+        return result
+    return mapToCols
+
+
+async def _existingIds(asyncSessionMaker, DBModel):
+    """Mnozina id (jako str) ulozenych v tabulce, dotaz jen na sloupec id"""
     async with asyncSessionMaker() as session:
-        dbSet = await session.execute(stmt)
-        dbRows = list(dbSet.scalars())
+        dbSet = await session.execute(select(DBModel.__table__.c.id))
+        return set(f"{id}" for id in dbSet.scalars())
 
-    # extrakce dat z vysledku dotazu
-    # vezmeme si jen atribut id,
-    # id je typu uuid, tak jej zkovertujeme na string
-    idsInDatabase = [f"{row.id}" for row in dbRows]
 
-    #print('found in database', idsInDatabase)
-    #print(dbRows[3].name)
-    # zjistime, ktera id nejsou v databazi
-    unsavedRows = list(
-        filter(
-            lambda row: not (f'{row["id"]}' in idsInDatabase),
-            externalIdTypes
+_stagingCounter = itertools.count()
+
+
+def _canCopy(session):
+    """COPY ... FROM STDIN je k dispozici pro PostgreSQL pres asyncpg"""
+    dialect = session.get_bind().dialect
+    return dialect.name == "postgresql" and dialect.driver == "asyncpg"
+
+
+async def _copyRows(session, table, rows, columns):
+    """PostgreSQL (asyncpg): COPY radku do docasne tabulky a INSERT ... SELECT ... ON CONFLICT DO NOTHING,
+    bez ORM instanci. Docasna tabulka zanika s koncem transakce. Vraci pocet vlozenych.
+    COPY obchazi SQLAlchemy, hodnoty se proto prevadi bind procesory sloupcu
+    (JSON, Enum, TypeDecorator) stejne jako pri INSERTu."""
+    dialect = session.get_bind().dialect
+    preparer = dialect.identifier_preparer
+    target = preparer.format_table(table)
+    staging = f"_staging_{table.name}_{next(_stagingCounter)}"
+    cols = ", ".join(preparer.quote(column) for column in columns)
+    # CREATE TABLE AS nekopiruje NOT NULL, chybejici sloupce doplni defaulty ciloveho INSERTu
+    await session.execute(sqlalchemy.text(
+        f"CREATE TEMP TABLE {preparer.quote(staging)} ON COMMIT DROP AS SELECT {cols} FROM {target} WITH NO DATA"
+    ))
+    connection = await session.connection()
+    rawConnection = await connection.get_raw_connection()
+    processors = [table.c[column].type.dialect_impl(dialect).bind_processor(dialect) for column in columns]
+    records = [
+        tuple(
+            row[column] if process is None else process(row[column])
+            for column, process in zip(columns, processors)
         )
-    )
+        for row in rows
+    ]
+    await rawConnection.driver_connection.copy_records_to_table(staging, records=records, columns=list(columns))
+    result = await session.execute(sqlalchemy.text(
+        f"INSERT INTO {target} ({cols}) SELECT {cols} FROM {preparer.quote(staging)} ON CONFLICT (id) DO NOTHING"
+    ))
+    return max(result.rowcount, 0)
 
-    async def saveChunk(rows):
-        # pro vsechna neulozena id vytvorime entity
-        # omezime se jen na atributy, ktere jsou definovane v modelu
-        mappedUnsavedRows = list(map(mapToCols, rows))
-        rowsToAdd = [DBModel(**row) for row in mappedUnsavedRows]
 
-        # a vytvorene entity jednou operaci vlozime do databaze
-        async with asyncSessionMaker() as session:
-            async with session.begin():
-                session.add_all(rowsToAdd)
-            await session.commit()
-
-    if len(unsavedRows) > 0:
-        # je co ukladat
-        if "_chunk" in unsavedRows[0]:
-            # existuje informace o rozfazovani ukladani do tabulky
-            nextPhase = [*unsavedRows]
-            while len(nextPhase) > 0:
-                # zjistime nejmensi cislo poradi ukladani
-                chunkNumber = min(map(lambda item: item.get("_chunk", 0), nextPhase))
-                # filtrujeme radky, ktere maji toto cislo
-                toSave = list(
-                    filter(
-                        lambda item: item.get("_chunk", 0) == chunkNumber,
-                        nextPhase
-                    )
-                )
-                # ostatni nechame na pozdeji
-                nextPhase = list(
-                    filter(
-                        lambda item: item.get("_chunk", 0) != chunkNumber,
-                        nextPhase
-                    )
-                )
-                # ulozime vybrane
-                await saveChunk(toSave)
-        else:
-            # vsechny zaznamy mohou byt ulozeny soucasne, 
-            # ukladame po blocich
-            while (len(unsavedRows) > 0):
-                rowsToSave = unsavedRows[:30]
-                await saveChunk(rowsToSave)
-                unsavedRows = unsavedRows[30:]
-
-    # jeste jednou se dotazeme do databaze
-    stmt = select(DBModel)
+async def _insertGroups(session, statement, rows, levelOf, mapToCols, copy=False, copy_threshold=100):
+    """Vlozi radky jednim executemany (s `copy=True` a dost radky pres COPY) pro kazdou skupinu
+    se stejnymi klici, vraci pocet vlozenych"""
+    # executemany vyzaduje stejne klice ve vsech radcich
+    groups = {}
+    for row in rows:
+        mapped = mapToCols(row)
+        groups.setdefault((levelOf(row), tuple(mapped)), []).append(mapped)
+    inserted = 0
+    for key in sorted(groups, key=lambda key: key[0]):
+        group = groups[key]
+        if copy and len(group) >= copy_threshold:
+            inserted += await _copyRows(session, statement.table, group, key[1])
+            continue
+        result = await session.execute(statement, group)
+        inserted += max(result.rowcount, 0)
+    return inserted
+
+
+async def _insertRows(asyncSessionMaker, DBModel, unsavedRows, chunk_size=1000, levelOf=None, onChunk=None):
+    """Vlozi radky v jedne transakci po `chunk_size`, vraci pocet vlozenych,
+    `onChunk(pocet)` je volano po kazde davce"""
+    if levelOf is None:
+        levelOf = lambda item: item.get("_chunk", 0)
+    if not unsavedRows:
+        return 0
+    table = DBModel.__table__
+    mapToCols = _rowMapper(DBModel)
+
+    # rozfazovani ukladani do tabulky (_chunk, uroven v hierarchii)
+    unsavedRows = sorted(unsavedRows, key=levelOf)
+
+    inserted = 0
     async with asyncSessionMaker() as session:
-        dbSet = await session.execute(stmt)
-        dbRows = dbSet.scalars()
-
-    # extrakce dat z vysledku dotazu
-    idsInDatabase = [f"{row.id}" for row in dbRows]
-
-    # znovu zaznamy, ktere dosud ulozeny nejsou,
-    # mely by byt ulozeny vsechny, takze prazdny list
-    unsavedRows = list(
-        filter(
-            lambda row: not (f'{row["id"]}' in idsInDatabase),
-            externalIdTypes
-        )
-    )
+        async with session.begin():
+            statement = _insertStatement(session.get_bind().dialect.name, table)
+            copy = _canCopy(session)
+            for start in range(0, len(unsavedRows), chunk_size):
+                rows = unsavedRows[start:start + chunk_size]
+                inserted += await _insertGroups(session, statement, rows, levelOf, mapToCols, copy=copy)
+                if onChunk is not None:
+                    onChunk(len(rows))
+    return inserted
+
+
+def _upsertStatement(dialectName, table, keys):
+    """INSERT ... ON CONFLICT (id) DO UPDATE pro PostgreSQL a SQLite, jinak None.
+    Radky se shodnym `lastchange` se neprepisuji."""
+    if dialectName == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialectName == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    statement = insert(table)
+    values = {key: statement.excluded[key] for key in keys if key != "id"}
+    if not values:
+        return statement.on_conflict_do_nothing(index_elements=["id"])
+    where = None
+    if "lastchange" in values:
+        where = table.c.lastchange.is_distinct_from(statement.excluded.lastchange)
+    return statement.on_conflict_do_update(index_elements=["id"], set_=values, where=where)
+
+
+async def _upsertRows(asyncSessionMaker, DBModel, rows, chunk_size=1000, levelOf=None):
+    """Vlozi nove a aktualizuje existujici radky (podle id) v jedne transakci, vraci pocet zmenenych"""
+    if levelOf is None:
+        levelOf = lambda item: item.get("_chunk", 0)
+    if not rows:
+        return 0
+    table = DBModel.__table__
+    mapToCols = _upsertRowMapper(DBModel)
+    rows = sorted(rows, key=levelOf)
+
+    changed = 0
+    async with asyncSessionMaker() as session:
+        async with session.begin():
+            dialectName = session.get_bind().dialect.name
+            for start in range(0, len(rows), chunk_size):
+                groups = {}
+                for row in rows[start:start + chunk_size]:
+                    mapped = mapToCols(row)
+                    groups.setdefault((levelOf(row), tuple(mapped)), []).append(mapped)
+                for key in sorted(groups, key=lambda key: key[0]):
+                    group = groups[key]
+                    keys = key[1]
+                    statement = _upsertStatement(dialectName, table, keys)
+                    if statement is not None:
+                        result = await session.execute(statement, group)
+                        changed += max(result.rowcount, 0)
+                        continue
+                    # obecny dialekt: UPDATE existujicich, INSERT novych
+                    ids = [row["id"] for row in group]
+                    existing = set(f"{id}" for id in (await session.execute(
+                        select(table.c.id).where(table.c.id.in_(ids))
+                    )).scalars())
+                    toUpdate = [row for row in group if f'{row["id"]}' in existing]
+                    toInsert = [row for row in group if f'{row["id"]}' not in existing]
+                    if toUpdate and len(keys) > 1:
+                        # jmena bindparam se nesmi shodovat se sloupci
+                        statement = (
+                            sqlalchemy.update(table)
+                            .where(table.c.id == sqlalchemy.bindparam("_key_id"))
+                            .values({key: sqlalchemy.bindparam(f"_value_{key}") for key in keys if key != "id"})
+                        )
+                        await session.execute(statement, [
+                            {"_key_id": row["id"], **{f"_value_{key}": value for key, value in row.items() if key != "id"}}
+                            for row in toUpdate
+                        ])
+                    if toInsert:
+                        await session.execute(sqlalchemy.insert(table), toInsert)
+                    changed += len(group)
+    return changed
+
+
+async def putPredefinedStructuresIntoTable(
+    asyncSessionMaker, DBModel, structureFunction, chunk_size=1000, levelOf=None, onChunk=None
+):
+    """Zabezpeci prvotni inicicalizaci zaznamu v databazi
+    DBModel zprostredkovava tabulku,
+    structureFunction() dava data, ktera maji byt ulozena,
+    predpoklada se list of dicts, pricemz dict obsahuje elementarni datove typy
 
-    # ted by melo byt pole prazdne
-    if not (len(unsavedRows) == 0): print("SOMETHING is REALLY WRONG")
+    Do databaze se ptame jen na id, chybejici radky se vkladaji hromadne
+    (INSERT ... ON CONFLICT DO NOTHING, na PostgreSQL s asyncpg pres COPY)
+    po `chunk_size` v jedne transakci, bez vytvareni ORM instanci.
+    levelOf(row) urcuje poradi ukladani (nizsi drive), vychozi je `_chunk`,
+    onChunk(pocet) hlasi zpracovane radky.
+    Vraci pocet vlozenych radku.
+    """
+    #print("putPredefinedStructuresIntoTable")
+    table = DBModel.__table__
+
+    # ocekavane typy
+    externalIdTypes = structureFunction()
 
-    # print(structureFunction(), 'On the input')
-    # print(dbRowsDicts, 'Defined in database')
-    # nyni vsechny entity mame v pameti a v databazi synchronizovane
-    # print(structureFunction())
-    pass
+    # dotaz do databaze, jen na id
+    idsInDatabase = await _existingIds(asyncSessionMaker, DBModel)
+
+    # zjistime, ktera id nejsou v databazi
+    unsavedRows = [row for row in externalIdTypes if f'{row["id"]}' not in idsInDatabase]
+    if onChunk is not None and len(unsavedRows) < len(externalIdTypes):
+        onChunk(len(externalIdTypes) - len(unsavedRows))
+    inserted = await _insertRows(asyncSessionMaker, DBModel, unsavedRows, chunk_size=chunk_size, levelOf=levelOf, onChunk=onChunk)
+
+    # kontrola, pocitame, nenacitame
+    expectedIds = list({f'{row["id"]}': row["id"] for row in externalIdTypes}.values())
+    found = 0
+    async with asyncSessionMaker() as session:
+        for start in range(0, len(expectedIds), chunk_size):
+            ids = expectedIds[start:start + chunk_size]
+            stmt = select(sqlalchemy.func.count()).select_from(table).where(table.c.id.in_(ids))
+            found += await session.scalar(stmt)
+
+    # ted by mely byt ulozene vsechny
+    if found != len(expectedIds):
+        logging.warning(f"putPredefinedStructuresIntoTable {table.name}: expected {len(expectedIds)} rows, found {found}")
+        print("SOMETHING is REALLY WRONG")
+
+    return inserted
 
 
 async def ExportModels(sessionMaker, DBModels):
     """returns a dict of lists of dict
     it is a dict of tables (list) containing a rows (dict)
     DBModels defines a list of models to export
+
+    holds everything in memory, for large databases use `ExportModelsToNDJSON`
     """
 
     def ToDict(dbRow, cols):
@@ -153,10 +317,194 @@ async def ExportModels(sessionMaker, DBModels):
     return result
 
 
-async def ImportModels(sessionMaker, DBModels, jsonData):
+def _dependencies(modelIndex):
+    """{tableName: tabulky z modelIndex, na ktere odkazuje cizim klicem (krome sebe)}"""
+    return {
+        tableName: set(
+            fk.column.table.name for fk in DBModel.__table__.foreign_keys
+            if fk.column.table.name in modelIndex and fk.column.table.name != tableName
+        )
+        for tableName, DBModel in modelIndex.items()
+    }
+
+
+def _importPlan(DBModels):
+    """Rozdeli tabulky do urovni podle cizich klicu, tabulky jedne urovne na sobe nezavisi.
+    Cyklicke zavislosti (mimo odkazy tabulky na sebe) se ukladaji postupne na konci."""
+    modelIndex = dict((DBModel.__tablename__, DBModel) for DBModel in DBModels)
+    dependencies = _dependencies(modelIndex)
+    levels = []
+    done = set()
+    while len(done) < len(modelIndex):
+        level = [
+            tableName for tableName in modelIndex
+            if tableName not in done and dependencies[tableName] <= done
+        ]
+        if not level:
+            # cyklus, zbytek v poradi dle metadat
+            sortedTables = [table.name for table in DBModels[0].metadata.sorted_tables]
+            rest = [tableName for tableName in modelIndex if tableName not in done]
+            rest.sort(key=lambda tableName: sortedTables.index(tableName) if tableName in sortedTables else len(sortedTables))
+            logging.warning(f"ImportModels: cyclic foreign keys among {rest}, importing sequentially")
+            levels.extend([tableName] for tableName in rest)
+            break
+        levels.append(level)
+        done.update(level)
+    return levels
+
+
+def _selfReferenceLevels(DBModel, rows):
+    """Pro tabulky odkazujici samy na sebe (napr. mastergroup_id) vraci funkci row -> uroven,
+    radek je ulozen az po radku, na ktery odkazuje. Bez odkazu na sebe vraci None."""
+    table = DBModel.__table__
+    selfColumns = [fk.parent.name for fk in table.foreign_keys if fk.column.table is table]
+    if not selfColumns:
+        return None
+    rowIndex = {f'{row["id"]}': row for row in rows}
+    levels = {}
+
+    def parentsOf(item):
+        row = rowIndex[item]
+        parents = (f"{row[col]}" for col in selfColumns if row.get(col, None) is not None)
+        return [parent for parent in parents if parent in rowIndex and parent != item]
+
+    def levelOfId(id):
+        # iterativne (post-order), hierarchie muze byt hluboka; cyklus v datech se prerusi
+        stack, onStack = [id], {id}
+        while stack:
+            item = stack[-1]
+            pending = [parent for parent in parentsOf(item) if parent not in levels and parent not in onStack]
+            if pending:
+                stack.append(pending[0])
+                onStack.add(pending[0])
+                continue
+            stack.pop()
+            onStack.discard(item)
+            levels[item] = 1 + max((levels.get(parent, 0) for parent in parentsOf(item)), default=-1)
+        return levels[id]
+
+    return lambda row: row["_chunk"] if "_chunk" in row else levelOfId(f'{row["id"]}')
+
+
+class ImportProgress:
+    """Prubeh importu, rychlost (radky/s) a odhad zbyvajiciho casu.
+
+    `onProgress(info)` dostane dict s klici table, rows, total, rate, eta (sekundy);
+    bez callbacku se prubeh loguje nejvyse jednou za `logInterval` sekund.
+    """
+
+    def __init__(self, total, onProgress=None, logInterval=5.0):
+        self.total = total
+        self.rows = 0
+        self.onProgress = onProgress
+        self.logInterval = logInterval
+        self.started = time.monotonic()
+        self._logged = self.started
+
+    def update(self, tableName, rows):
+        self.rows += rows
+        now = time.monotonic()
+        elapsed = max(now - self.started, 1e-9)
+        rate = self.rows / elapsed
+        eta = (self.total - self.rows) / rate if rate > 0 else None
+        info = {"table": tableName, "rows": self.rows, "total": self.total, "rate": rate, "eta": eta}
+        if self.onProgress is not None:
+            self.onProgress(info)
+        elif now - self._logged >= self.logInterval or self.rows >= self.total:
+            self._logged = now
+            logging.info(
+                f"import {tableName}: {self.rows}/{self.total} rows, {rate:.0f} rows/s"
+                + ("" if eta is None else f", ETA {eta:.0f} s")
+            )
+        return info
+
+
+class _Checkpoint:
+    """Soubor s postupem importu: {tableName: {"chunk": index, "hash": hash radku davky, "done": bool}}.
+    Zapisuje se atomicky (docasny soubor + os.replace) po kazde commitnute davce."""
+
+    def __init__(self, path):
+        self.path = f"{path}"
+        self.state = {}
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.state = json.load(f)
+
+    def table(self, tableName):
+        return self.state.get(tableName, None)
+
+    def record(self, tableName, chunk, rowHash, done=False):
+        self.state[tableName] = {"chunk": chunk, "hash": rowHash, "done": done}
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            json.dump(self.state, f)
+        os.replace(temporary, self.path)
+
+
+def _chunkHash(rows):
+    return hashlib.sha1(json.dumps(rows, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+async def _importTableCheckpointed(sessionMaker, DBModel, rows, checkpoint, chunk_size=1000, levelOf=None, progress=None):
+    """Import tabulky po davkach (kazda ve vlastni transakci) s checkpointem po kazdem commitu.
+
+    Davky se pocitaji nad vstupnimi radky (serazenymi dle urovne), ne nad chybejicimi,
+    pri opakovanem spusteni se stejnym vstupem se pokracuje za posledni zaznamenanou davkou
+    (pokud sedi jeji hash) bez cteni tabulky. Davka commitnuta bez zapsaneho checkpointu
+    se pri opakovani nezdvoji (ON CONFLICT DO NOTHING, jinde filtr podle id)."""
+    if levelOf is None:
+        levelOf = lambda item: item.get("_chunk", 0)
+    tableName = DBModel.__tablename__
+    table = DBModel.__table__
+    mapToCols = _rowMapper(DBModel)
+    rows = sorted(rows, key=levelOf)
+    chunks = [rows[start:start + chunk_size] for start in range(0, len(rows), chunk_size)]
+
+    first = 0
+    state = checkpoint.table(tableName)
+    if state is not None and state["chunk"] < len(chunks) and _chunkHash(chunks[state["chunk"]]) == state["hash"]:
+        if state["done"] and state["chunk"] == len(chunks) - 1:
+            if progress is not None:
+                progress.update(tableName, len(rows))
+            return 0
+        first = state["chunk"] + 1
+        if progress is not None:
+            progress.update(tableName, sum(len(chunk) for chunk in chunks[:first]))
+    elif state is not None:
+        logging.warning(f"import {tableName}: checkpoint does not match the input, starting from the beginning")
+
+    inserted = 0
+    for index in range(first, len(chunks)):
+        chunk = chunks[index]
+        async with sessionMaker() as session:
+            async with session.begin():
+                dialectName = session.get_bind().dialect.name
+                statement = _insertStatement(dialectName, table)
+                if dialectName not in ("postgresql", "sqlite"):
+                    existing = set(f"{id}" for id in (await session.execute(
+                        select(table.c.id).where(table.c.id.in_([row["id"] for row in chunk]))
+                    )).scalars())
+                    chunk = [row for row in chunk if f'{row["id"]}' not in existing]
+                inserted += await _insertGroups(session, statement, chunk, levelOf, mapToCols, copy=_canCopy(session))
+        checkpoint.record(tableName, index, _chunkHash(chunks[index]), done=index == len(chunks) - 1)
+        if progress is not None:
+            progress.update(tableName, len(chunks[index]))
+    return inserted
+
+
+async def ImportModels(sessionMaker, DBModels, jsonData, parallelism=4, chunk_size=1000, checkpoint=None, onProgress=None):
     """imports all data from json structure
     DBModels contains a list of sqlalchemy models
     jsonData data to import
+
+    Tables are imported in levels derived from foreign keys (`_importPlan`),
+    independent tables of one level concurrently (each on its own connection),
+    at most `parallelism` at once (SQLite is always imported sequentially).
+    Self-referencing rows are ordered by their level in the hierarchy.
+
+    With `checkpoint` (a file path) every chunk is committed separately and recorded,
+    a rerun with the same input resumes after the last committed chunk.
+    Progress (rows/s, ETA) goes to `onProgress(info)` or to logging, see `ImportProgress`.
     """
 
     # create index of all models,
@@ -164,14 +512,483 @@ async def ImportModels(sessionMaker, DBModels, jsonData):
     # value is a model (sqlalchemy model)
     modelIndex = dict((DBModel.__tablename__, DBModel) for DBModel in DBModels)
 
-    for tableName, DBModel in modelIndex.items():  # iterate over all models
+    bind = getattr(sessionMaker, "kw", {}).get("bind", None)
+    if getattr(getattr(bind, "dialect", None), "name", None) == "sqlite":
+        # SQLite ma jedineho zapisovatele
+        parallelism = 1
+    semaphore = asyncio.Semaphore(max(parallelism, 1))
+
+    progress = ImportProgress(
+        sum(len(jsonData.get(tableName, None) or []) for tableName in modelIndex),
+        onProgress=onProgress
+    )
+    if checkpoint is not None:
+        checkpoint = _Checkpoint(checkpoint)
+
+    async def importTable(tableName):
+        DBModel = modelIndex[tableName]
         # get the appropriate data
         listData = jsonData.get(tableName, None)
         if listData is None:
             # data does not exists for current model
-            continue
+            return
+        levelOf = _selfReferenceLevels(DBModel, listData)
         # save data - all rows into a table,
         # if a row with same id exists, do not save it nor update it
-        await putPredefinedStructuresIntoTable(
-            sessionMaker, DBModel, lambda: listData
-        )
+        async with semaphore:
+            if checkpoint is not None:
+                await _importTableCheckpointed(
+                    sessionMaker, DBModel, listData, checkpoint,
+                    chunk_size=chunk_size, levelOf=levelOf, progress=progress
+                )
+            else:
+                await putPredefinedStructuresIntoTable(
+                    sessionMaker, DBModel, lambda: listData,
+                    chunk_size=chunk_size, levelOf=levelOf,
+                    onChunk=lambda rows: progress.update(tableName, rows)
+                )
+
+    for level in _importPlan(DBModels):
+        await asyncio.gather(*(importTable(tableName) for tableName in level))
+
+
+_toJson = {
+    uuid.UUID: str,
+    datetime.datetime: datetime.datetime.isoformat,
+    datetime.date: datetime.date.isoformat,
+    datetime.time: datetime.time.isoformat,
+    decimal.Decimal: str,
+}
+
+_fromJson = {
+    uuid.UUID: uuid.UUID,
+    datetime.datetime: datetime.datetime.fromisoformat,
+    datetime.date: datetime.date.fromisoformat,
+    datetime.time: datetime.time.fromisoformat,
+    decimal.Decimal: decimal.Decimal,
+}
+
+
+def _columnTypes(DBModel):
+    """[(jmeno sloupce, python typ nebo None)] v poradi sloupcu tabulky"""
+    result = []
+    for column in DBModel.__table__.columns:
+        try:
+            pythonType = column.type.python_type
+        except NotImplementedError:
+            pythonType = None
+        result.append((column.name, pythonType))
+    return result
+
+
+def _rowSerializer(DBModel):
+    """Predkompilovany prevod radku (Row ze select(*table.columns)) na radek NDJSON"""
+    converters = [(name, _toJson.get(pythonType, None)) for name, pythonType in _columnTypes(DBModel)]
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=str).encode
+
+    def serialize(row):
+        return encode({
+            name: value if value is None or convert is None else convert(value)
+            for (name, convert), value in zip(converters, row)
+        })
+    return serialize
+
+
+def _rowParser(DBModel):
+    """Predkompilovany prevod hodnot z JSON (str) na typy sloupcu modelu (UUID, DateTime, ...)"""
+    converters = [
+        (name, _fromJson[pythonType]) for name, pythonType in _columnTypes(DBModel)
+        if pythonType in _fromJson
+    ]
+
+    def parse(row):
+        for name, convert in converters:
+            value = row.get(name, None)
+            if value == "":
+                row[name] = None
+            elif isinstance(value, str):
+                row[name] = convert(value)
+        return row
+    return parse
+
+
+class _NDJSONTarget:
+    """Cil exportu, adresar nebo `*.zip` archiv"""
+
+    def __init__(self, path):
+        self.path = path
+        self.archive = zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) if f"{path}".endswith(".zip") else None
+        if self.archive is None:
+            os.makedirs(path, exist_ok=True)
+
+    def open(self, fileName):
+        return self.archive.open(fileName, "w") if self.archive is not None else open(os.path.join(self.path, fileName), "wb")
+
+    def close(self):
+        if self.archive is not None:
+            self.archive.close()
+
+
+class _NDJSONSource:
+    """Zdroj importu, adresar nebo `*.zip` archiv"""
+
+    def __init__(self, path):
+        self.path = path
+        self.archive = zipfile.ZipFile(path) if f"{path}".endswith(".zip") else None
+
+    def open(self, fileName):
+        """otevreny soubor (binarne) nebo None, pokud neexistuje"""
+        if self.archive is not None:
+            return self.archive.open(fileName) if fileName in self.archive.namelist() else None
+        fileName = os.path.join(self.path, fileName)
+        return open(fileName, "rb") if os.path.exists(fileName) else None
+
+    def close(self):
+        if self.archive is not None:
+            self.archive.close()
+
+
+async def _exportTable(sessionMaker, DBModel, target, statement, chunk_size=1000, onProgress=None, onChunk=None):
+    """Zapise vysledek `statement` (select(*table.columns)...) do `<tablename>.ndjson`, vraci pocet radku"""
+    table = DBModel.__table__
+    serialize = _rowSerializer(DBModel)
+    count = 0
+    with target.open(f"{table.name}.ndjson") as stream:
+        async with sessionMaker() as session:
+            rows = await session.stream(statement.execution_options(yield_per=chunk_size))
+            async for chunk in rows.partitions(chunk_size):
+                stream.write("".join(serialize(row) + "\n" for row in chunk).encode("utf-8"))
+                count += len(chunk)
+                if onChunk is not None:
+                    onChunk(chunk)
+                if onProgress is not None:
+                    onProgress(table.name, count)
+    return count
+
+
+async def ExportModelsToNDJSON(sessionMaker, DBModels, path, chunk_size=1000, onProgress=None):
+    """Streamovany export tabulek do NDJSON, pamet nezavisi na velikosti tabulek.
+
+    `path` je adresar (soubor `<tablename>.ndjson` pro kazdou tabulku) nebo `*.zip` archiv
+    se stejnymi soubory. Radky se ctou serverovym kurzorem po `chunk_size` (`yield_per`),
+    `onProgress(tableName, rowsDone)` je volano po kazde davce. Vraci {tableName: pocet radku}.
+    """
+    target = _NDJSONTarget(path)
+    result = {}
+    try:
+        for DBModel in DBModels:
+            table = DBModel.__table__
+            count = await _exportTable(
+                sessionMaker, DBModel, target, select(*table.columns),
+                chunk_size=chunk_size, onProgress=onProgress
+            )
+            result[table.name] = count
+            logging.info(f"ExportModelsToNDJSON {table.name}: {count} rows")
+    finally:
+        target.close()
+    return result
+
+
+async def _importRowStream(sessionMaker, DBModel, rows, batch_size=1000, onProgress=None, upsert=False):
+    """Vlozi radky z iteratoru `rows` (dicty s typovanymi hodnotami) po `batch_size`,
+    jen ty, jejichz id v tabulce jeste neni (s `upsert=True` i zmenene existujici radky).
+    Tabulky odkazujici samy na sebe se nactou cele, aby je slo seradit podle urovne
+    v hierarchii. Vraci pocet vlozenych (zmenenych) radku."""
+    tableName = DBModel.__tablename__
+    existing = set() if upsert else await _existingIds(sessionMaker, DBModel)
+    saveRows = _upsertRows if upsert else _insertRows
+    table = DBModel.__table__
+    selfReferencing = any(fk.column.table is table for fk in table.foreign_keys)
+    inserted = 0
+    read = 0
+    batch = []
+    for row in rows:
+        read += 1
+        if f'{row["id"]}' in existing:
+            continue
+        batch.append(row)
+        if not selfReferencing and len(batch) >= batch_size:
+            inserted += await saveRows(sessionMaker, DBModel, batch, chunk_size=batch_size)
+            batch = []
+            if onProgress is not None:
+                onProgress(tableName, read)
+    inserted += await saveRows(
+        sessionMaker, DBModel, batch, chunk_size=batch_size,
+        levelOf=_selfReferenceLevels(DBModel, batch)
+    )
+    if onProgress is not None:
+        onProgress(tableName, read)
+    logging.info(f"import {tableName}: {inserted} of {read} rows saved")
+    return inserted
+
+
+async def ImportModelsFromNDJSON(sessionMaker, DBModels, path, batch_size=1000, onProgress=None):
+    """Streamovany import souboru z `ExportModelsToNDJSON` (adresar nebo `*.zip`).
+
+    Tabulky se zpracuji v poradi dle cizich klicu (`_importPlan`), radky se ctou po radcich
+    a vkladaji po `batch_size` (viz `_importRowStream`).
+    Vraci {tableName: pocet vlozenych radku}.
+    """
+    modelIndex = dict((DBModel.__tablename__, DBModel) for DBModel in DBModels)
+    source = _NDJSONSource(path)
+    result = {}
+    try:
+        for level in _importPlan(DBModels):
+            for tableName in level:
+                DBModel = modelIndex[tableName]
+                stream = source.open(f"{tableName}.ndjson")
+                if stream is None:
+                    continue
+                parse = _rowParser(DBModel)
+                with stream:
+                    rows = (parse(json.loads(line)) for line in stream if line.strip())
+                    result[tableName] = await _importRowStream(
+                        sessionMaker, DBModel, rows, batch_size=batch_size, onProgress=onProgress
+                    )
+    finally:
+        source.close()
+    return result
+
+
+def _parseWatermark(value):
+    if value is None or isinstance(value, datetime.datetime):
+        return value
+    return datetime.datetime.fromisoformat(value)
+
+
+async def ExportModelsDelta(
+    sessionMaker, DBModels, path, watermarks=None, tombstones=None,
+    overlap=datetime.timedelta(0), chunk_size=1000, onProgress=None
+):
+    """Rozdilovy export do NDJSON (stejny format jako `ExportModelsToNDJSON`).
+
+    Exportuji se jen radky s `lastchange > watermark - overlap`, `watermarks` je
+    {tableName: datetime nebo iso str} z predchoziho exportu (chybi = cela tabulka).
+    `overlap` kryje transakce commitnute pozdeji s drivejsim lastchange, import je idempotentni.
+    Tabulky bez sloupce lastchange se exportuji cele.
+    `tombstones` {tableName: [id, ...]} jsou smazane radky, zapisi se do `<tablename>.deleted.ndjson`.
+    Nove watermarky se ulozi do `_watermarks.json` a vraci se {tableName: iso str nebo None}.
+    """
+    watermarks = watermarks or {}
+    tombstones = tombstones or {}
+    target = _NDJSONTarget(path)
+    newWatermarks = {}
+    try:
+        for DBModel in DBModels:
+            table = DBModel.__table__
+            statement = select(*table.columns)
+            watermark = _parseWatermark(watermarks.get(table.name, None))
+            lastchange = table.c.get("lastchange", None)
+            latest = [watermark]
+            onChunk = None
+            if lastchange is not None:
+                if watermark is not None:
+                    statement = statement.where(lastchange > watermark - overlap)
+                position = list(table.columns).index(lastchange)
+
+                def onChunk(chunk, position=position, latest=latest):
+                    values = [row[position] for row in chunk if row[position] is not None]
+                    if values:
+                        latest[0] = max(values) if latest[0] is None else max(latest[0], *values)
+
+            count = await _exportTable(
+                sessionMaker, DBModel, target, statement,
+                chunk_size=chunk_size, onProgress=onProgress, onChunk=onChunk
+            )
+            newWatermarks[table.name] = None if latest[0] is None else latest[0].isoformat()
+
+            deleted = tombstones.get(table.name, None)
+            if deleted:
+                with target.open(f"{table.name}.deleted.ndjson") as stream:
+                    stream.write("".join(json.dumps({"id": f"{id}"}) + "\n" for id in deleted).encode("utf-8"))
+            logging.info(f"ExportModelsDelta {table.name}: {count} changed rows, {len(deleted or [])} deleted")
+
+        with target.open("_watermarks.json") as stream:
+            stream.write(json.dumps(newWatermarks).encode("utf-8"))
+    finally:
+        target.close()
+    return newWatermarks
+
+
+async def ImportModelsDelta(sessionMaker, DBModels, path, batch_size=1000, onProgress=None):
+    """Import rozdiloveho exportu (`ExportModelsDelta`).
+
+    Radky se hromadne upsertuji (INSERT ... ON CONFLICT DO UPDATE, radky se shodnym
+    lastchange se neprepisuji) v poradi dle cizich klicu, potom se v opacnem poradi
+    smazou radky z `<tablename>.deleted.ndjson`.
+    Vraci {tableName: {"upserted": n, "deleted": m}}.
+    """
+    modelIndex = dict((DBModel.__tablename__, DBModel) for DBModel in DBModels)
+    plan = _importPlan(DBModels)
+    source = _NDJSONSource(path)
+    result = {}
+    try:
+        for level in plan:
+            for tableName in level:
+                DBModel = modelIndex[tableName]
+                stream = source.open(f"{tableName}.ndjson")
+                if stream is None:
+                    continue
+                parse = _rowParser(DBModel)
+                with stream:
+                    rows = (parse(json.loads(line)) for line in stream if line.strip())
+                    upserted = await _importRowStream(
+                        sessionMaker, DBModel, rows, batch_size=batch_size, onProgress=onProgress, upsert=True
+                    )
+                result.setdefault(tableName, {"upserted": 0, "deleted": 0})["upserted"] = upserted
+
+        for level in reversed(plan):
+            for tableName in level:
+                DBModel = modelIndex[tableName]
+                stream = source.open(f"{tableName}.deleted.ndjson")
+                if stream is None:
+                    continue
+                table = DBModel.__table__
+                parse = _rowParser(DBModel)
+                deleted = 0
+                with stream:
+                    ids = [parse(json.loads(line))["id"] for line in stream if line.strip()]
+                async with sessionMaker() as session:
+                    async with session.begin():
+                        for start in range(0, len(ids), batch_size):
+                            statement = sqlalchemy.delete(table).where(table.c.id.in_(ids[start:start + batch_size]))
+                            deleted += max((await session.execute(statement)).rowcount, 0)
+                result.setdefault(tableName, {"upserted": 0, "deleted": 0})["deleted"] = deleted
+    finally:
+        source.close()
+    return result
+
+
+class _JsonStream:
+    """Postupne cteni JSON hodnot ze souboru (JSONDecoder.raw_decode nad klouzavym bufferem)"""
+
+    def __init__(self, f, bufferSize):
+        self.f = f
+        self.bufferSize = bufferSize
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self):
+        chunk = self.f.read(self.bufferSize)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def peek(self):
+        """dalsi ne-bily znak (bez posunu), "" na konci souboru"""
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in " \t\r\n":
+                self.position += 1
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+            if not self._fill():
+                return ""
+
+    def take(self, expected):
+        char = self.peek()
+        if char == "" or char not in expected:
+            raise ValueError(f"invalid JSON at {self.f.name}: expected one of {expected!r}, got {char!r}")
+        self.position += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+                # hodnota na konci bufferu (napr. cislo) muze pokracovat v dalsim bloku
+                if end < len(self.buffer) or self.eof:
+                    self.position = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+
+def iterJsonTables(jsonFileName, bufferSize=1 << 16):
+    """Postupne cte JSON soubor tvaru {"tabulka": [{...}, ...], ...} a vraci dvojice (tableName, row).
+
+    Pamet je umerna velikosti jednoho radku, hodnoty se nekonvertuji (viz `_rowParser`).
+    Klice, jejichz hodnota neni seznam, se preskoci.
+    """
+    with open(jsonFileName, "r", encoding="utf-8") as f:
+        stream = _JsonStream(f, bufferSize)
+        stream.take("{")
+        if stream.peek() == "}":
+            return
+        while True:
+            tableName = stream.value()
+            stream.take(":")
+            if stream.peek() == "[":
+                stream.take("[")
+                if stream.peek() == "]":
+                    stream.take("]")
+                else:
+                    while True:
+                        yield tableName, stream.value()
+                        if stream.take(",]") == "]":
+                            break
+            else:
+                stream.value()
+            if stream.take(",}") == "}":
+                return
+
+
+async def ImportJsonFile(sessionMaker, DBModels, jsonFileName, batch_size=1000, onProgress=None):
+    """Streamovany import JSON souboru tvaru {"tabulka": [{...}, ...]} (nahrada `readJsonFile` + `ImportModels`).
+
+    Hodnoty se prevadi podle typu sloupcu modelu (UUID, DateTime, ...), ne podle jmen klicu.
+    Radky se predavaji do databaze po `batch_size`. Tabulka, jejiz zavislosti (cizi klice)
+    jeste nebyly naimportovany, se odlozi do docasneho NDJSON souboru a naimportuje
+    po prvnim pruchodu v poradi dle `_importPlan`. Vraci {tableName: pocet vlozenych radku}.
+    """
+    modelIndex = dict((DBModel.__tablename__, DBModel) for DBModel in DBModels)
+    dependencies = _dependencies(modelIndex)
+    done = set()
+    deferred = {}
+    result = {}
+    try:
+        for tableName, items in itertools.groupby(iterJsonTables(jsonFileName), key=lambda item: item[0]):
+            DBModel = modelIndex.get(tableName, None)
+            rows = (row for _, row in items)
+            if DBModel is None:
+                # data pro neznamou tabulku
+                for _ in rows:
+                    pass
+                continue
+            if dependencies[tableName] <= done and tableName not in deferred:
+                parse = _rowParser(DBModel)
+                result[tableName] = result.get(tableName, 0) + await _importRowStream(
+                    sessionMaker, DBModel, (parse(row) for row in rows),
+                    batch_size=batch_size, onProgress=onProgress
+                )
+                done.add(tableName)
+            else:
+                spool = deferred.get(tableName, None)
+                if spool is None:
+                    spool = deferred[tableName] = tempfile.TemporaryFile("w+", encoding="utf-8")
+                for row in rows:
+                    spool.write(json.dumps(row))
+                    spool.write("\n")
+
+        for level in _importPlan(DBModels):
+            for tableName in level:
+                spool = deferred.get(tableName, None)
+                if spool is None:
+                    continue
+                spool.seek(0)
+                parse = _rowParser(modelIndex[tableName])
+                result[tableName] = result.get(tableName, 0) + await _importRowStream(
+                    sessionMaker, modelIndex[tableName], (parse(json.loads(line)) for line in spool),
+                    batch_size=batch_size, onProgress=onProgress
+                )
+    finally:
+        for spool in deferred.values():
+            spool.close()
+    return result
@@ -45,7 +45,7 @@ def build_batch_query_with_ast(base_query_str, ids):
         new_field = FieldNode(
             alias=NameNode(value=alias_name),
             name=field.name,
-            arguments=new_arguments,
+            arguments=tuple(new_arguments),
             selection_set=field.selection_set
         )
         aliased_fields.append(new_field)
@@ -59,11 +59,12 @@ def build_batch_query_with_ast(base_query_str, ids):
     new_op = OperationDefinitionNode(
         operation=OperationType.QUERY,
         name=base_op.name,
-        variable_definitions=new_variable_definitions or None,
-        selection_set=SelectionSetNode(selections=aliased_fields)
+        variable_definitions=tuple(new_variable_definitions) or None,
+        selection_set=SelectionSetNode(selections=tuple(aliased_fields))
     )
 
-    doc = DocumentNode(definitions=[new_op])
+    # graphql-core 3.3 vyzaduje seznamy uzlu jako tuple
+    doc = DocumentNode(definitions=(new_op,))
     return print_ast(doc)
 
 
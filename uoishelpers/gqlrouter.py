@@ -52,6 +52,9 @@ def MountGuardedGQL(app, mountpoint="/gql", schema=None, get_context=None, DEMO=
             return {"data": None, "errors": [{"msg": f"{e}"}]}
         # logging.info(f"schema execute result \n{schemaresult}")
         result = {"data": schemaresult.data}
+        if schemaresult.extensions:
+            # napr. {"degraded": {...}} ze SessionCommitExtension
+            result["extensions"] = schemaresult.extensions
         if schemaresult.errors:
             result["errors"] = [
                 {
@@ -87,4 +90,129 @@ def MountGuardedGQL(app, mountpoint="/gql", schema=None, get_context=None, DEMO=
             logging.info(f"sentinel skippend because of DEMO mode for query={item} for user {request.scope['user']}")
             return await serveGQLRequest(request, item)
 
-    pass
\ No newline at end of file
+    pass
+
+class ExportItem(BaseModel):
+    model: str
+    where: dict = None
+    after: str = None
+    limit: int = None
+    format: str = "ndjson"
+
+
+def MountStreamingExport(app, mountpoint="/export", BaseModel=None, session_maker_factory=None, DEMO="False", sentinel=defaultSentinel, chunk_size=1000, models=None, permission=None):
+    """Připojí route pro hromadný export jednoho modelu jako NDJSON nebo CSV.
+
+    POST `{"model": "UserModel", "where": {...}, "after": "<id>", "limit": 10000, "format": "ndjson"}`
+    `where` má stejný tvar jako pro `prepareSelect`, řádky jsou seřazené podle `id`
+    a `after` je keyset (id posledního řádku předchozí dávky). Data se čtou
+    serverovým kurzorem (`IDLoader.stream_select`) a posílají průběžně.
+
+    Export obchází RBAC GraphQL polí, exportovat lze jen modely z povinného seznamu
+    `models` (třídy nebo jména), ostatní vrací 404. Volitelný `permission(request, model, item)`
+    (i async) rozhoduje pro konkrétního uživatele (po sentinelu je v `request.scope["user"]`),
+    False = 403. Chyba DB během streamování se zaloguje a odpověď skončí řádkem
+    `{"errors": [...]}` (NDJSON), resp. `# export failed: ...` (CSV).
+    """
+    import csv
+    import io
+    import json
+    import uuid
+    import asyncio
+    from fastapi.responses import StreamingResponse
+    from sqlalchemy import select
+    from .dataloaders.IDLoader import IDLoader, prepareSelect
+
+    assert BaseModel is not None
+    assert session_maker_factory is not None
+    assert models is not None, "MountStreamingExport needs an explicit list of exportable models"
+    allowed = {model if isinstance(model, str) else model.__name__ for model in models}
+    models = {
+        mapper.class_.__name__: mapper.class_
+        for mapper in BaseModel.registry.mappers
+        if mapper.class_.__name__ in allowed
+    }
+
+    async def isPermitted(request, model, item):
+        if permission is None:
+            return True
+        result = permission(request, model, item)
+        if asyncio.iscoroutine(result):
+            result = await result
+        return bool(result)
+
+    def prepareStatement(item: ExportItem):
+        model = models.get(item.model, None)
+        if model is None:
+            return None, None, JSONResponse({"errors": [f"unknown model {item.model}"]}, status_code=404)
+        if item.format not in ("ndjson", "csv"):
+            return None, None, JSONResponse({"errors": [f"unknown format {item.format}"]}, status_code=400)
+        try:
+            statement = select(model) if not item.where else prepareSelect(model, item.where)
+            if item.after is not None:
+                statement = statement.where(model.id > uuid.UUID(item.after))
+        except Exception as e:
+            return None, None, JSONResponse({"errors": [f"{e}"]}, status_code=400)
+        statement = statement.order_by(model.id)
+        if item.limit is not None:
+            statement = statement.limit(item.limit)
+        return model, statement, None
+
+    async def rows(model, statement, format):
+        columns = [column.key for column in model.__mapper__.column_attrs]
+        asyncSessionMaker = await session_maker_factory()
+        async with asyncSessionMaker() as session:
+            loader = IDLoader[model](session, shared_cache=None, asyncio_lock=asyncio.Lock())
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            if format == "csv":
+                writer.writerow(columns)
+            count = 0
+            try:
+                async for row in loader.stream_select(statement, chunk_size=chunk_size):
+                    values = [getattr(row, column) for column in columns]
+                    if format == "csv":
+                        writer.writerow(["" if value is None else f"{value}" for value in values])
+                    else:
+                        buffer.write(json.dumps(dict(zip(columns, values)), default=str))
+                        buffer.write("\n")
+                    count += 1
+                    if count % chunk_size == 0:
+                        yield buffer.getvalue()
+                        buffer.seek(0)
+                        buffer.truncate()
+            except Exception as e:
+                # status 200 uz byl odeslan, klient pozna useknuty export podle posledniho radku
+                logging.exception(f"export of {model.__name__} failed after {count} rows")
+                if format == "csv":
+                    buffer.write(f"# export failed: {e}\n")
+                else:
+                    buffer.write(json.dumps({"errors": [f"{e}"]}))
+                    buffer.write("\n")
+            if buffer.tell():
+                yield buffer.getvalue()
+
+    async def serveExport(request: Request, item: ExportItem):
+        model, statement, error = prepareStatement(item)
+        if error is not None:
+            return error
+        if not await isPermitted(request, model, item):
+            return JSONResponse({"errors": [f"export of {item.model} is not permitted"]}, status_code=403)
+        media_type = "text/csv" if item.format == "csv" else "application/x-ndjson"
+        return StreamingResponse(rows(model, statement, item.format), media_type=media_type)
+
+    if DEMO in ["False", "false"]:
+        @app.post(mountpoint)
+        async def export(request: Request, item: ExportItem):
+            # sentinel pracuje s dotazem, export se mu predstavi jako pseudo dotaz
+            sentinelResult = await sentinel(request, Item(query=f"export {item.model}", variables=item.where or {}))
+            if sentinelResult:
+                logging.info(f"sentinel test failed for export={item} \n request={request}")
+                return sentinelResult
+            logging.info(f"sentinel test passed for export={item} for user {request.scope.get('user', None)}")
+            return await serveExport(request, item)
+    else:
+        @app.post(mountpoint)
+        async def export(request: Request, item: ExportItem):
+            logging.info(f"sentinel skippend because of DEMO mode for export={item}")
+            return await serveExport(request, item)
@@ -0,0 +1,192 @@
+import asyncio
+import collections
+
+from graphql import GraphQLError
+
+
+class DBOverloadedError(GraphQLError):
+    """Databáze je přetížená, požadavek byl odmítnut (load shedding)."""
+
+    def __init__(self, message="Database is overloaded, try again later"):
+        super().__init__(message, extensions={"code": "DB_OVERLOADED"})
+
+
+class AdaptiveLimiter:
+    """Adaptivní omezovač souběžných DB operací (AIMD podle latence dotazů).
+
+    Náhrada pevného `asyncio.Semaphore`, rozhraní `acquire()` / `release()` / `locked()`
+    i `async with` je stejné.
+    `observe(latency)` dostává dobu trvání DB volání. Latence se vyhodnocují po oknech
+    `window` volání: pokud průměr okna přesáhne `latency_tolerance` násobek dlouhodobé
+    baseline (EWMA průměrů oken s vahou `baseline_decay`, u přetížených oken desetinovou)
+    a zároveň `latency_floor`,
+    limit se sníží na `limit * backoff`, jinak po `limit` úspěšných voláních vzroste o 1.
+    Jednotlivé drahé dotazy (smíšená zátěž) tak limit nesnižují, jen trvalý růst latence.
+    Horní mez je `max_limit`, případně velikost poolu enginu (viz `configure_pool`).
+
+    Čekající se řadí do fronty, po `queue_timeout` sekundách nebo při plné frontě
+    (`max_queue`) se vyhodí `DBOverloadedError`.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 10,
+        *,
+        min_limit: int = 1,
+        max_limit: int = None,
+        queue_timeout: float = 10.0,
+        max_queue: int = None,
+        latency_tolerance: float = 2.0,
+        latency_floor: float = 0.01,
+        backoff: float = 0.9,
+        baseline_decay: float = 0.1,
+        window: int = 50,
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+        self.latency_tolerance = latency_tolerance
+        self.latency_floor = latency_floor
+        self.backoff = backoff
+        self.baseline_decay = baseline_decay
+        self.window = window
+
+        self.in_flight = 0
+        self.stats = collections.Counter()
+        self._waiters = collections.deque()
+        self._baseline = None
+        self._window_latency = None
+        self._window_sum = 0.0
+        self._window_count = 0
+        self._overloaded = False
+        self._successes = 0
+        self._pool_configured = False
+        if max_limit is not None:
+            self.limit = min(self.limit, max_limit)
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def configure_pool(self, session_maker) -> None:
+        """Odvodí `max_limit` z poolu enginu, na který je `session_maker` navázaný (jen jednou)."""
+        if self._pool_configured:
+            return
+        self._pool_configured = True
+        if self.max_limit is not None:
+            return
+        bind = getattr(session_maker, "kw", {}).get("bind", None)
+        pool = getattr(getattr(bind, "sync_engine", bind), "pool", None)
+        size = getattr(pool, "size", None)
+        if not callable(size):
+            return
+        self.max_limit = size() + max(getattr(pool, "_max_overflow", 0), 0)
+        self.limit = max(min(self.limit, self.max_limit), self.min_limit)
+
+    async def acquire(self) -> bool:
+        if not self._waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            self.stats["acquired"] += 1
+            return True
+        if self.max_queue is not None and len(self._waiters) >= self.max_queue:
+            self.stats["rejected"] += 1
+            raise DBOverloadedError()
+
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+        self._waiters.append(waiter)
+        timer = loop.call_later(self.queue_timeout, self._expire, waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled() and waiter.exception() is None:
+                # slot uz byl pridelen, vratit
+                self.release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+        finally:
+            timer.cancel()
+        self.stats["acquired"] += 1
+        return True
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    def locked(self) -> bool:
+        """Jako `asyncio.Semaphore.locked`, True pokud by `acquire()` musel čekat."""
+        return bool(self._waiters) or self.in_flight >= int(self.limit)
+
+    async def __aenter__(self):
+        await self.acquire()
+        return None
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.release()
+
+    def observe(self, latency: float) -> None:
+        """Zpracuje latenci jednoho DB volání a upraví limit."""
+        self._window_sum += latency
+        self._window_count += 1
+        if self._window_count >= self.window:
+            mean = self._window_sum / self._window_count
+            self._window_sum, self._window_count = 0.0, 0
+            self._window_latency = mean
+            if self._baseline is None:
+                self._baseline = mean
+            self._overloaded = mean > max(self._baseline * self.latency_tolerance, self.latency_floor)
+            # baseline pomalu sleduje aktualni stav (zmena planu, jina zatez),
+            # pretizena okna desetkrat pomaleji, aby se pretizeni nestalo novou normou
+            decay = self.baseline_decay * (0.1 if self._overloaded else 1.0)
+            self._baseline += (mean - self._baseline) * decay
+            if self._overloaded:
+                self.limit = max(float(self.min_limit), self.limit * self.backoff)
+                self._successes = 0
+                self.stats["decreases"] += 1
+                return
+
+        if self._overloaded:
+            # do vyhodnoceni dalsiho okna se limit nezvysuje
+            return
+        self._successes += 1
+        if self._successes >= self.limit:
+            self._successes = 0
+            if self.max_limit is None or self.limit < self.max_limit:
+                self.limit = self.limit + 1 if self.max_limit is None else min(self.limit + 1, float(self.max_limit))
+                self.stats["increases"] += 1
+                self._wake()
+
+    def get_stats(self) -> dict:
+        return {
+            "limit": int(self.limit),
+            "max_limit": self.max_limit,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "acquired": self.stats["acquired"],
+            "rejected": self.stats["rejected"],
+            "timeouts": self.stats["timeouts"],
+            "increases": self.stats["increases"],
+            "decreases": self.stats["decreases"],
+            "baseline_latency": self._baseline,
+            "window_latency": self._window_latency,
+        }
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if waiter.done():
+                continue
+            self.in_flight += 1
+            waiter.set_result(True)
+
+    def _expire(self, waiter) -> None:
+        if waiter.done():
+            return
+        if waiter in self._waiters:
+            self._waiters.remove(waiter)
+        self.stats["timeouts"] += 1
+        self.stats["rejected"] += 1
+        waiter.set_exception(DBOverloadedError())
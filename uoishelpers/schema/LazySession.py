@@ -0,0 +1,95 @@
+import time
+import asyncio
+import collections
+
+
+class LazySession:
+    """Zástupce `AsyncSession` pro jednu GraphQL operaci.
+
+    Session se vytvoří až při prvním použití a slot `semaphore` (`asyncio.Semaphore`
+    nebo `AdaptiveLimiter`) se získá až při prvním volání, které opravdu jde do databáze
+    (execute, get, flush, commit, ...). Operace, které DB vůbec nepotřebují (introspekce,
+    `_service { sdl }`, odpovědi z cache), tak nedrží slot ani spojení z poolu.
+    Doba DB volání se předává do `semaphore.observe`, pokud ji limiter má.
+
+    `totals` počítá operace a kolik z nich session skutečně otevřelo.
+    """
+
+    _db_methods = {
+        "execute", "scalar", "scalars", "get", "get_one", "flush", "refresh", "merge",
+        "delete", "stream", "stream_scalars", "run_sync", "connection", "commit", "rollback",
+    }
+
+    totals = collections.Counter()
+
+    def __init__(self, session_maker, semaphore=None):
+        self._session_maker = session_maker
+        self._semaphore = semaphore
+        self._session = None
+        self._acquired = False
+        self._acquire_lock = asyncio.Lock()
+        LazySession.totals["operations"] += 1
+
+    @property
+    def session(self):
+        if self._session is None:
+            self._session = self._session_maker()
+        return self._session
+
+    @property
+    def opened(self) -> bool:
+        """True, pokud session už šla do databáze."""
+        return self._acquired
+
+    async def acquire(self):
+        """Získá slot semaforu (jednou za operaci) a vrátí skutečnou session."""
+        await self._acquire_slot()
+        return self.session
+
+    async def _acquire_slot(self):
+        if not self._acquired:
+            async with self._acquire_lock:
+                if not self._acquired:
+                    if self._semaphore is not None:
+                        await self._semaphore.acquire()
+                    self._acquired = True
+                    LazySession.totals["opened"] += 1
+
+    def __getattr__(self, name):
+        if name in LazySession._db_methods:
+            async def db_method(*args, **kwargs):
+                session = await self.acquire()
+                start = time.perf_counter()
+                try:
+                    return await getattr(session, name)(*args, **kwargs)
+                finally:
+                    self._observe(time.perf_counter() - start)
+            return db_method
+        return getattr(self.session, name)
+
+    def _observe(self, latency: float) -> None:
+        # adaptivni limiter (AdaptiveLimiter) se ridi latenci DB volani
+        observe = getattr(self._semaphore, "observe", None)
+        if observe is not None:
+            observe(latency)
+
+    async def finish(self, commit: bool) -> None:
+        """Ukončí operaci, commit / rollback jen tehdy, pokud session něco dělala."""
+        if self._session is None:
+            return
+        session, self._session = self._session, None
+        try:
+            if commit:
+                if self._acquired or session.new or session.dirty or session.deleted:
+                    await self._acquire_slot()
+                    await session.commit()
+            elif self._acquired:
+                await session.rollback()
+        finally:
+            await session.close()
+            self.release()
+
+    def release(self) -> None:
+        if self._acquired and self._semaphore is not None:
+            self._semaphore.release()
+        self._acquired = False
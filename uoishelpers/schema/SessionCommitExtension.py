@@ -1,77 +1,173 @@
-import asyncio
 import uuid
+from graphql import OperationType
 from strawberry.extensions import SchemaExtension
 
+from .LazySession import LazySession
+from .AdaptiveLimiter import AdaptiveLimiter
+
 session_monitor = {}
-DB_SEMAPHORE = asyncio.Semaphore(10)  # např. pool_size
+# adaptivni limit soubeznych DB operaci, horni mez se odvodi z poolu enginu
+DB_LIMITER = AdaptiveLimiter(initial_limit=10, queue_timeout=10.0)
+DB_SEMAPHORE = DB_LIMITER  # puvodni jmeno
 class SessionCommitExtension(SchemaExtension):
     
-    def __init__(self, session_maker_factory, loaders_factory):
+    def __init__(self, session_maker_factory, loaders_factory, second_delete_delay=None, read_session_maker_factory=None, db_limiter=None):
         super().__init__()
+        # limiter soubeznych DB operaci (AdaptiveLimiter nebo asyncio.Semaphore), vychozi je sdileny DB_LIMITER
+        self.db_limiter = DB_LIMITER if db_limiter is None else db_limiter
         self._session_maker_factory = session_maker_factory
         self.loaders_factory = loaders_factory
+        # zpozdeni druheho smazani klicu z globalni cache po commitu (None = jen jedno smazani)
+        self.second_delete_delay = second_delete_delay
+        # volitelna read-only session (replika), loaders_factory pak dostane read_session=...
+        self._read_session_maker_factory = read_session_maker_factory
 
     async def on_operation(self):
         id = uuid.uuid4()
         asyncSessionMaker = await self._session_maker_factory()
-        
+        configure_pool = getattr(self.db_limiter, "configure_pool", None)
+        if configure_pool is not None:
+            configure_pool(asyncSessionMaker)
+        # session i slot limiteru se ziskaji az pri prvnim SQL dotazu (viz LazySession)
+        session = LazySession(asyncSessionMaker, self.db_limiter)
+        read_session = None
+        if self._read_session_maker_factory is not None:
+            read_session = LazySession(await self._read_session_maker_factory())
 
-        async with asyncSessionMaker() as session:
-            ctx = self.execution_context.context
-            ctx["session"] = session
-            ctx["errors"] = []
+        ctx = self.execution_context.context
+        ctx["session"] = session
+        ctx["errors"] = []
+        # chyby poli, jejichz savepoint byl vracen (neblokuji commit zbytku operace)
+        ctx["savepoint_errors"] = []
+        if read_session is None:
             ctx.update(self.loaders_factory(session))
-            # query_str = ctx.get("query_str")
-            try:
+        else:
+            ctx["read_session"] = read_session
+            ctx.update(self.loaders_factory(session, read_session=read_session))
+        # fronta odlozenych invalidaci (LoaderMapBase(..., defer_invalidation=True))
+        invalidation_queue = getattr(ctx.get("loaders", None), "invalidation_queue", None)
+        # query_str = ctx.get("query_str")
+        try:
             # před spuštěním operace
-                async with DB_SEMAPHORE:
-                    # opensessions = list(session_monitor.keys())
-                    # if opensessions:
-                    #     print(f"\033[1;31mStarting another session\033[0m {id} {len(opensessions)}", flush=True)
-                    # else :
-                    #     print(f"\033[1;32mStarting first session\033[0m {id}", flush=True)
-                    # if query_str:
-                    #     print(f"Starting operation {id} with query:\n{query_str}", flush=True)
-
-                    # session_monitor[id] = session
-                
-                    yield
-
-            # po dokončení operace:
-            except Exception as e:
-                # sem spadnou neočekávané chyby
-                error_description = {
-                    "msg": f"Unexpected error during operation: {e}",
-                    "code": "43b027da-d073-4fac-8881-3353609f2bcd",
-                    "_input": {},
-                }
-                ctx["errors"].append(error_description)
+            # opensessions = list(session_monitor.keys())
+            # if opensessions:
+            #     print(f"\033[1;31mStarting another session\033[0m {id} {len(opensessions)}", flush=True)
+            # else :
+            #     print(f"\033[1;32mStarting first session\033[0m {id}", flush=True)
+            # if query_str:
+            #     print(f"Starting operation {id} with query:\n{query_str}", flush=True)
+
+            # session_monitor[id] = session
+
+            yield
 
-                await session.rollback()
-                # print(f"Finalizing session {id} with exception", e, flush=True)
-                raise
+        # po dokončení operace:
+        except Exception as e:
+            # sem spadnou neočekávané chyby
+            error_description = {
+                "msg": f"Unexpected error during operation: {e}",
+                "code": "43b027da-d073-4fac-8881-3353609f2bcd",
+                "_input": {},
+            }
+            ctx["errors"].append(error_description)
+
+            await session.finish(commit=False)
+            if invalidation_queue is not None:
+                invalidation_queue.discard()
+            # print(f"Finalizing session {id} with exception", e, flush=True)
+            raise
+        else:
+            # sem se jde jen když NEBYLA výjimka
+            if ctx["errors"]:
+                await session.finish(commit=False)
+                if invalidation_queue is not None:
+                    invalidation_queue.discard()
             else:
-                # sem se jde jen když NEBYLA výjimka
-                if ctx["errors"]:
-                    await session.rollback()
-                else:
-                    await session.commit()
-                # print("Finalizing session", id, flush=True)
-            finally:
-                # volitelné: uklidit reference, ať někdo nepoužije zavřenou session
-                
-                # ctx.pop("session", None)
-                # session_monitor.pop(id, None)
-                # opensessions = list(session_monitor.keys())
-                # if opensessions:
-                #     print(f"\033[1;31mVAROVÁNÍ: ZŮSTALY OTEVŘENÉ SESSION: {len(opensessions)}\n{opensessions}\033[0m", flush=True)
-                # else :
-                #     print("\033[1;32mAll sessions closed properly.\033[0m", flush=True)
-                pass
+                await session.finish(commit=True)
+                if invalidation_queue is not None:
+                    await invalidation_queue.flush(second_delete_delay=self.second_delete_delay)
+            # print("Finalizing session", id, flush=True)
+        finally:
+            # finish je idempotentni, tady jen pojistka pro uvolneni slotu a spojeni
+            await session.finish(commit=False)
+            if read_session is not None:
+                await read_session.finish(commit=False)
+            # stale-if-error: oznac odpoved jako degradovanou
+            degraded = getattr(ctx.get("loaders", None), "degraded", None)
+            if degraded:
+                ctx["degraded"] = {
+                    model_name: [f"{id}" for id in ids]
+                    for model_name, ids in degraded.items()
+                }
+            # volitelné: uklidit reference, ať někdo nepoužije zavřenou session
+
+            # ctx.pop("session", None)
+            # session_monitor.pop(id, None)
+            # opensessions = list(session_monitor.keys())
+            # if opensessions:
+            #     print(f"\033[1;31mVAROVÁNÍ: ZŮSTALY OTEVŘENÉ SESSION: {len(opensessions)}\n{opensessions}\033[0m", flush=True)
+            # else :
+            #     print("\033[1;32mAll sessions closed properly.\033[0m", flush=True)
+            pass
+
+
+    def get_results(self):
+        degraded = self.execution_context.context.get("degraded", None)
+        if degraded:
+            return {"degraded": degraded}
+        return {}
             
             
-def SessionCommitExtensionFactory(*, session_maker_factory, loaders_factory, SessionCommitExtension=SessionCommitExtension):
+class SavepointSessionCommitExtension(SessionCommitExtension):
+    """Varianta SessionCommitExtension, kde každé top-level mutation pole běží ve vlastním
+    SAVEPOINTu (`begin_nested`). Chyba pole (výjimka nebo záznam v `ctx["errors"]`) vrátí jen
+    jeho savepoint, ostatní pole se commitnou najednou na konci operace.
+    Vrácené chyby jsou v `ctx["savepoint_errors"]`.
+    """
+
+    def resolve(self, _next, root, info, *args, **kwargs):
+        # synchronni, aby ostatni pole (vnorena, query) nebyla zbytecne awaitable
+        if info.path.prev is not None or info.operation.operation != OperationType.MUTATION:
+            return _next(root, info, *args, **kwargs)
+        return self._resolve_in_savepoint(_next, root, info, *args, **kwargs)
+
+    async def _resolve_in_savepoint(self, _next, root, info, *args, **kwargs):
+        # top-level mutace se vykonavaji seriove, savepointy se tedy neprekryvaji
+        ctx = info.context
+        session = await ctx["session"].acquire()
+        errors_before = len(ctx["errors"])
+        savepoint = await session.begin_nested()
+        try:
+            result = _next(root, info, *args, **kwargs)
+            if info.is_awaitable(result):
+                result = await result
+        except Exception:
+            await self._rollback_savepoint(ctx, savepoint, errors_before)
+            raise
+        if len(ctx["errors"]) > errors_before:
+            await self._rollback_savepoint(ctx, savepoint, errors_before)
+        else:
+            await savepoint.commit()
+        return result
+
+    async def _rollback_savepoint(self, ctx, savepoint, errors_before):
+        await savepoint.rollback()
+        ctx["savepoint_errors"].extend(ctx["errors"][errors_before:])
+        del ctx["errors"][errors_before:]
+        # loadery mohou drzet radky zmenene v ramci vraceneho savepointu
+        clear_all = getattr(ctx.get("loaders", None), "clear_all", None)
+        if clear_all is not None:
+            clear_all()
+
+
+_DefaultSessionCommitExtension = SessionCommitExtension
+def SessionCommitExtensionFactory(*, session_maker_factory, loaders_factory, SessionCommitExtension=SessionCommitExtension, second_delete_delay=None, read_session_maker_factory=None, db_limiter=None, savepoints=False):
+    if savepoints and SessionCommitExtension is _DefaultSessionCommitExtension:
+        SessionCommitExtension = SavepointSessionCommitExtension
     return SessionCommitExtension(
             session_maker_factory=session_maker_factory,
             loaders_factory=loaders_factory,
+            second_delete_delay=second_delete_delay,
+            read_session_maker_factory=read_session_maker_factory,
+            db_limiter=db_limiter,
         )
\ No newline at end of file
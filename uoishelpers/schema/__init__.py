@@ -2,4 +2,6 @@ from .ProfilingExtension import ProfilingExtension
 from .PrometheusExtension import PrometheusExtension
 from .WhoAmIExtension import WhoAmIExtension
 
-from .SessionCommitExtension import SessionCommitExtension, SessionCommitExtensionFactory
\ No newline at end of file
+from .SessionCommitExtension import SessionCommitExtension, SessionCommitExtensionFactory, SavepointSessionCommitExtension
+from .LazySession import LazySession
+from .AdaptiveLimiter import AdaptiveLimiter, DBOverloadedError